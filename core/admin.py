@@ -1,11 +1,67 @@
 # File: core/admin.py
 
 from django.contrib import admin
-from .models import Ingredient, Recipe, RecipeIngredient
+from .models import DEFAULT_HOUSEHOLD_SLUG, Household, Ingredient, Pack, PantryItem, Recipe, RecipeIngredient, Unit
+from .tenancy import member_households
+
+# --- 0. Nuclei familiari ---
+# Gli utenti non superuser vedono e scelgono solo i dati dei nuclei di cui sono membri.
+# In modifica il nucleo non cambia, e ingredienti e ricette si scelgono solo
+# nel nucleo dell'oggetto (o del genitore, per gli inline).
+class HouseholdScopedMixin:
+    # Percorso dal modello al nucleo familiare
+    household_lookup = 'household'
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.user.is_superuser:
+            return queryset
+        return queryset.filter(**{f'{self.household_lookup}__members': request.user})
+
+    def get_readonly_fields(self, request, obj=None):
+        fields = super().get_readonly_fields(request, obj)
+        if obj is not None and self.household_lookup == 'household':
+            return (*fields, 'household')
+        return fields
+
+    def get_form(self, request, obj=None, **kwargs):
+        request.admin_household_id = getattr(obj, 'household_id', None)
+        return super().get_form(request, obj, **kwargs)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        # Negli inline `obj` è il genitore (ricetta o ingrediente)
+        request.admin_household_id = getattr(obj, 'household_id', None)
+        return super().get_formset(request, obj, **kwargs)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Scelte limitate ai nuclei dell'utente (e ai loro ingredienti e ricette)
+        households = member_households(request.user)
+        household_id = getattr(request, 'admin_household_id', None)
+        if household_id is not None:
+            households = households.filter(pk=household_id)
+        if db_field.name == 'household':
+            kwargs['queryset'] = households
+        elif db_field.name in ('ingredient', 'recipe'):
+            kwargs['queryset'] = db_field.related_model._default_manager.filter(household__in=households)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class HouseholdAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug')
+    prepopulated_fields = {'slug': ('name',)}
+    filter_horizontal = ('members',)
+    search_fields = ('name', 'slug')
+
+    def has_delete_permission(self, request, obj=None):
+        # Il nucleo predefinito accoglie i dati senza nucleo esplicito: non si elimina
+        if obj is not None and obj.slug == DEFAULT_HOUSEHOLD_SLUG:
+            return False
+        return super().has_delete_permission(request, obj)
 
 # --- 1. Definizione dell'Inline per RecipeIngredient ---
 # Permette di inserire/modificare gli ingredienti direttamente dalla pagina della Ricetta.
-class RecipeIngredientInline(admin.TabularInline):
+class RecipeIngredientInline(HouseholdScopedMixin, admin.TabularInline):
+    household_lookup = 'recipe__household'
     model = RecipeIngredient
     extra = 1  # Numero di righe vuote da mostrare per l'aggiunta rapida
     # Campi visualizzati nell'inline (opzionale)
@@ -13,18 +69,56 @@ class RecipeIngredientInline(admin.TabularInline):
 
 # --- 2. Definizione dell'Admin per la Ricetta ---
 # Questa classe specifica come deve essere visualizzato il modello Recipe nell'Admin.
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(HouseholdScopedMixin, admin.ModelAdmin):
     # Usa l'Inline definito sopra
     inlines = [RecipeIngredientInline]
     # Colonne visualizzate nella lista principale delle ricette
-    list_display = ('name',) 
+    list_display = ('name', 'servings', 'cost', 'household')
+    list_select_related = ('household',)
+    list_filter = ('household',)
     # Permette la ricerca per nome
     search_fields = ('name',)
 
-# --- 3. Registrazione dei Modelli ---
+# --- 3. Definizione dell'Admin per gli Ingredienti e le Unità di Misura ---
+# Confezioni acquistabili, modificate dalla pagina dell'Ingrediente
+class PackInline(HouseholdScopedMixin, admin.TabularInline):
+    household_lookup = 'ingredient__household'
+    model = Pack
+    extra = 1
+    fields = ('quantity', 'price')
+
+
+class IngredientAdmin(HouseholdScopedMixin, admin.ModelAdmin):
+    inlines = [PackInline]
+    list_display = ('name', 'unit', 'unit_price', 'household')
+    list_select_related = ('unit', 'household')
+    list_filter = ('household',)
+    # Necessario per l'autocompletamento nella dispensa
+    search_fields = ('name',)
+
+
+class UnitAdmin(admin.ModelAdmin):
+    list_display = ('name', 'base', 'factor')
+    list_select_related = ('base',)
+    search_fields = ('name',)
+
+# --- 4. Definizione dell'Admin per la Dispensa ---
+class PantryItemAdmin(HouseholdScopedMixin, admin.ModelAdmin):
+    # La dispensa appartiene al nucleo tramite l'ingrediente
+    household_lookup = 'ingredient__household'
+    list_display = ('ingredient', 'quantity', 'unit', 'expiry', 'needed_on')
+    list_select_related = ('ingredient', 'unit')
+    list_filter = ('ingredient__household', 'expiry')
+    search_fields = ('ingredient__name',)
+    autocomplete_fields = ('ingredient',)
+
+# --- 5. Registrazione dei Modelli ---
 
 # Modelli semplici (registrazione standard)
-admin.site.register(Ingredient)
+admin.site.register(Household, HouseholdAdmin)
+admin.site.register(Ingredient, IngredientAdmin)
+admin.site.register(Unit, UnitAdmin)
+admin.site.register(PantryItem, PantryItemAdmin)
 
 
 # Registra la Ricetta usando la classe Admin modificata (con Inlines)
@@ -0,0 +1,169 @@
+# File: core/aggregation.py
+
+import datetime
+
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.utils import timezone
+
+from .models import MealRecipe, PantryItem, ShoppingListLine
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _total(queryset, expression):
+    """SUM di `expression` su una subquery correlata per ingrediente (0 se vuota)."""
+    total = queryset.order_by().values('ingredient').annotate(total=Sum(expression)).values('total')
+    return Coalesce(Subquery(total, output_field=FloatField()), Value(0.0))
+
+
+def pantry_lots(ingredient_ref, today=None):
+    """Lotti non scaduti dell'ingrediente `ingredient_ref` (riferimento della query esterna)."""
+    today = today or timezone.localdate()
+    return PantryItem.objects.filter(
+        Q(expiry__isnull=True) | Q(expiry__gte=today), ingredient=OuterRef(ingredient_ref)
+    )
+
+
+def lots_total(lots):
+    """Quantità dei lotti nell'unità base."""
+    return _total(lots, F('quantity') * F('unit__factor'))
+
+
+def free_stock(ingredient_ref, start, today=None):
+    """
+    Scorta libera (lotti senza `needed_on`) ancora disponibile il giorno
+    `start`: il piano la consuma in ordine di data a partire da oggi, quindi
+    ai giorni da oggi a `start` escluso va quanto non coperto dai lotti
+    comprati apposta per loro.
+    """
+    today = today or timezone.localdate()
+    lots = pantry_lots(ingredient_ref, today)
+    free = lots_total(lots.filter(needed_on__isnull=True))
+    if start <= today:
+        return free
+    before = (today, start - ONE_DAY)
+    planned = _total(
+        ShoppingListLine.objects.filter(ingredient=OuterRef(ingredient_ref), date__range=before),
+        F('quantity'),
+    )
+    covered = lots_total(lots.filter(needed_on__range=before))
+    return Greatest(free - Greatest(planned - covered, Value(0.0)), Value(0.0))
+
+
+def pantry_stock(ingredient_ref, start=None, end=None, today=None):
+    """
+    Scorta in dispensa dell'ingrediente `ingredient_ref` per i giorni da
+    `start` a `end`, nell'unità base ed esclusi i lotti scaduti: i lotti
+    comprati per quei giorni più la scorta libera rimasta (free_stock).
+    Senza intervallo (l'intero calendario) contano tutti i lotti.
+    Sono subquery correlate, valutate nella stessa query della lista.
+    """
+    if start is None:
+        return lots_total(pantry_lots(ingredient_ref, today))
+    today = today or timezone.localdate()
+    lots = pantry_lots(ingredient_ref, today)
+    if start <= today:
+        # Tutta la scorta libera è ancora disponibile: lotti dell'intervallo e
+        # lotti liberi sono insiemi disgiunti, sommati con una sola subquery
+        # (la query esterna la ripete in SELECT, GROUP BY e nel netto)
+        return lots_total(lots.filter(Q(needed_on__isnull=True) | Q(needed_on__range=(start, end))))
+    bought = lots_total(lots.filter(needed_on__range=(start, end)))
+    return bought + free_stock(ingredient_ref, start, today)
+
+
+def with_net_quantity(rows, ingredient_ref, start=None, end=None):
+    """
+    Aggiunge a righe {'quantity', ...} la scorta (`stock`) per l'intervallo
+    e la quantità netta da comprare (`net` = lordo - scorta, mai sotto zero).
+    """
+    return rows.annotate(
+        stock=pantry_stock(ingredient_ref, start, end),
+        net=Greatest(F('quantity') - F('stock'), Value(0.0)),
+    )
+
+
+def portion_scale(prefix=''):
+    """
+    Fattore di scala delle dosi di una pianificazione (MealRecipe raggiunta
+    con `prefix`): porzioni richieste (MealRecipe.portions, di default
+    quelle della ricetta) diviso porzioni della ricetta (Recipe.servings).
+    È un'espressione SQL, valutata dentro l'aggregazione.
+    """
+    portions = Coalesce(f'{prefix}portions', f'{prefix}recipe__servings')
+    return Cast(portions, FloatField()) / F(f'{prefix}recipe__servings')
+
+
+def planned_between(household_id, start, end):
+    """
+    Pianificazioni del nucleo nei giorni da `start` a `end` inclusi (indice
+    su MealSlot (household, date, meal_type)).
+    """
+    return MealRecipe.objects.filter(meal_slot__household=household_id, meal_slot__date__range=(start, end))
+
+
+def shopping_list_rows(meal_recipes=None, ingredient_ids=None, net=False, by_date=False):
+    """
+    Calcola la lista della spesa aggregata con UNA sola query raggruppata.
+
+    Unisce MealRecipe -> RecipeIngredient -> Ingredient -> Unit: ogni
+    pianificazione di una ricetta produce una riga per ciascun suo
+    ingrediente, quindi la SUM della quantità (già convertita nell'unità
+    base con il fattore della sua Unit e scalata sulle porzioni della
+    pianificazione con portion_scale) equivale a
+    "dose base x fattore x porzioni / porzioni della ricetta", sommato sulle
+    pianificazioni.
+
+    `meal_recipes` permette di restringere il piano considerato (es. a un
+    intervallo di date con planned_between); se omesso si usa l'intero
+    calendario. `ingredient_ids` limita il calcolo a un insieme di
+    ingredienti; con `by_date` le righe sono per ingrediente e giorno
+    (chiavi 'date' e 'household_id' in più), la forma delle righe
+    materializzate.
+    Con `net` ogni riga riporta anche 'stock' e 'net' (vedi with_net_quantity),
+    calcolati nella stessa query.
+    Restituisce un QuerySet pigro di dizionari
+    {'ingredient_id', 'name', 'unit', 'quantity'} ordinati per nome, così
+    vista, API ed esportazioni possono iterarlo (anche con .iterator()).
+    """
+    if meal_recipes is None:
+        meal_recipes = MealRecipe.objects.all()
+
+    # Un'unica filter(): le condizioni sulla relazione multipla devono
+    # riusare lo stesso JOIN usato dall'aggregazione
+    lookups = {'recipe__ingredients_list__isnull': False}
+    if ingredient_ids is not None:
+        lookups['recipe__ingredients_list__ingredient__in'] = ingredient_ids
+
+    groups = {
+        'ingredient_id': F('recipe__ingredients_list__ingredient'),
+        'name': F('recipe__ingredients_list__ingredient__name'),
+        # Simbolo dell'unità canonica (l'unità stessa se è già canonica)
+        'unit': Coalesce(
+            'recipe__ingredients_list__ingredient__unit__base__name',
+            'recipe__ingredients_list__ingredient__unit__name',
+        ),
+    }
+    if by_date:
+        groups['date'] = F('meal_slot__date')
+        groups['household_id'] = F('meal_slot__household')
+
+    rows = (
+        meal_recipes
+        .filter(**lookups)
+        .values(**groups)
+        .annotate(quantity=Sum(
+            F('recipe__ingredients_list__quantity')
+            * F('recipe__ingredients_list__ingredient__unit__factor')
+            * portion_scale()
+        ))
+        .order_by('name')
+    )
+    if net:
+        rows = with_net_quantity(rows, 'recipe__ingredients_list__ingredient')
+    return rows
+
+
+def build_shopping_list(meal_recipes=None):
+    """Restituisce la lista della spesa aggregata come lista di dizionari."""
+    return list(shopping_list_rows(meal_recipes))
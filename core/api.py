@@ -0,0 +1,222 @@
+# File: core/api.py
+
+"""
+Endpoint JSON dell'app core (consumati da client esterni, non dai template).
+
+Gli endpoint di lettura rispondono con ETag forti derivati dai contatori
+di versione del nucleo familiare della richiesta (core/versioning.py): se
+il client invia un If-None-Match ancora valido riceve un 304 senza che
+venga eseguita alcuna query. Tutti i dati sono quelli del nucleo.
+"""
+
+import json
+import math
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.http import Http404, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from . import autocomplete, nutrition, versioning, weeks
+from .materialized import materialized_shopping_list
+from .matrix import evaluate_plans
+from .models import Recipe
+from .routers import read_only
+from .views import abuild_weekly_grid
+
+# Limite di piani valutabili in una sola richiesta
+MAX_PLANS_PER_REQUEST = 1000
+
+
+def parse_plans(payload):
+    """
+    Valida il corpo {"plans": [{"<recipe_id>": conteggio, ...}, ...]} e lo
+    converte in una lista di dizionari {recipe_id (int): conteggio (float)}.
+    Solleva ValueError con un messaggio leggibile se il formato non è valido.
+    """
+    plans = payload.get('plans') if isinstance(payload, dict) else None
+    if not isinstance(plans, list):
+        raise ValueError("Il campo 'plans' deve essere una lista di piani.")
+    if len(plans) > MAX_PLANS_PER_REQUEST:
+        raise ValueError(f"Al massimo {MAX_PLANS_PER_REQUEST} piani per richiesta.")
+
+    parsed = []
+    for plan in plans:
+        if not isinstance(plan, dict):
+            raise ValueError("Ogni piano deve essere un oggetto {recipe_id: conteggio}.")
+        try:
+            plan = {int(pk): float(count) for pk, count in plan.items()}
+        except (TypeError, ValueError):
+            raise ValueError("Id ricetta e conteggi devono essere numerici.")
+        # json.loads accetta NaN e Infinity: entrerebbero nel prodotto matriciale
+        if not all(math.isfinite(count) and count >= 0 for count in plan.values()):
+            raise ValueError("I conteggi devono essere numeri finiti non negativi.")
+        parsed.append(plan)
+    return parsed
+
+
+@csrf_exempt
+@require_POST
+def plan_evaluate(request):
+    """
+    Valuta in blocco molti piani candidati (es. anteprime "cosa succede se
+    cambio la cena di martedì") e restituisce la lista della spesa di
+    ciascuno, calcolata con un unico prodotto matriciale (core/matrix.py).
+    Endpoint di sola lettura: non modifica il piano salvato.
+    """
+    try:
+        plans = parse_plans(json.loads(request.body or b'null'))
+    except ValueError as exc:  # include json.JSONDecodeError
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    recipe_ids = {pk for plan in plans for pk in plan}
+    known = set(
+        Recipe.objects.filter(household=request.household_id, pk__in=recipe_ids).values_list('pk', flat=True)
+    )
+    unknown = sorted(recipe_ids - known)
+    if unknown:
+        return JsonResponse({'error': "Ricette inesistenti.", 'recipe_ids': unknown}, status=400)
+
+    return JsonResponse({'shopping_lists': evaluate_plans(request.household_id, plans)})
+
+
+# ======================================================================
+# ENDPOINT DI LETTURA (con ETag)
+# ======================================================================
+
+def versioned(*scopes, dated=False):
+    """
+    GET con validazione condizionale: l'ETag dipende solo dai timbri degli
+    ambiti indicati (e, con `dated`, dall'intervallo di date effettivo della
+    richiesta) e viene calcolato prima di eseguire la vista. I client
+    devono sempre rivalidare (no-cache), ma il 304 non costa query.
+    """
+    def etag_func(request, *args, **kwargs):
+        period = weeks.requested_period(request) if dated else ''
+        return versioning.etag(
+            request.household_id, *scopes, period=period, versions=versioning.for_request(request, *scopes),
+        )
+
+    def decorator(view):
+        conditional = condition(etag_func=etag_func)(view)
+        if iscoroutinefunction(view):
+            # I timbri si leggono prima, senza bloccare il ciclo degli eventi
+            @wraps(view)
+            async def prefetching(request, *args, **kwargs):
+                await versioning.prefetch(request, *scopes)
+                return await conditional(request, *args, **kwargs)
+            return require_GET(cache_control(private=True, no_cache=True)(prefetching))
+        return require_GET(cache_control(private=True, no_cache=True)(conditional))
+    return decorator
+
+
+# Viste asincrone: sotto ASGI usano l'ORM asincrono (aget, aiterator).
+
+def bad_range():
+    return JsonResponse(
+        {'error': "Parametri non validi: usa ?week=AAAA-Www oppure ?start=AAAA-MM-GG&end=AAAA-MM-GG."},
+        status=400,
+    )
+
+
+@versioned(versioning.PLAN, versioning.RECIPES, dated=True)
+@read_only
+async def weekly_plan(request):
+    """Griglia della settimana di ?week= (di default la corrente): giorni -> pasti -> ricette."""
+    try:
+        week = weeks.week_from_request(request)
+    except ValueError:
+        return bad_range()
+    days = [
+        {
+            'day': day['code'],
+            'date': day['date'],
+            'name': day['name'],
+            'meals': [
+                {
+                    'meal_type': cell['meal_type'],
+                    'slot_id': cell['slot'].pk if cell['slot'] else None,
+                    'recipes': [{'id': r.pk, 'name': r.name} for r in cell['recipes']],
+                }
+                for cell in day['cells']
+            ],
+        }
+        for day in await abuild_weekly_grid(request.household_id, week)
+    ]
+    return JsonResponse({'week': weeks.format_week(week), 'days': days})
+
+
+@versioned(versioning.RECIPES)
+@read_only
+async def recipe_detail(request, pk):
+    """Dettaglio ricetta con ingredienti, dosi e unità di misura."""
+    try:
+        recipe = await Recipe.objects.aget(household=request.household_id, pk=pk)
+    except Recipe.DoesNotExist:
+        raise Http404("Ricetta inesistente.")
+    ingredients = (
+        recipe.ingredients_list
+        .order_by('ingredient__name')
+        .values(
+            'ingredient_id', 'quantity',
+            name=F('ingredient__name'),
+            unit=F('ingredient__unit__name'),
+            base_unit=Coalesce('ingredient__unit__base__name', 'ingredient__unit__name'),
+        )
+    )
+    return JsonResponse({
+        'id': recipe.pk,
+        'name': recipe.name,
+        'servings': recipe.servings,
+        # Totali dell'intera ricetta (tutte le porzioni)
+        'nutrition': nutrition.of(recipe)._asdict(),
+        'ingredients': [item async for item in ingredients.aiterator()],
+    })
+
+
+@versioned(versioning.PLAN, versioning.RECIPES, versioning.PANTRY, dated=True)
+@read_only
+async def shopping_list(request):
+    """
+    Lista della spesa aggregata (unità base) della settimana di ?week= o
+    dell'intervallo ?start=&end=, con scorta in dispensa e quantità netta.
+    """
+    try:
+        start, end = weeks.range_from_request(request)
+    except ValueError:
+        return bad_range()
+    rows = materialized_shopping_list(request.household_id, start, end, net=True)
+    return JsonResponse({
+        'start': start,
+        'end': end,
+        'items': [row async for row in rows.aiterator()],
+    })
+
+
+# ======================================================================
+# AUTOCOMPLETAMENTO (usato dai widget dei formset)
+# ======================================================================
+
+def autocomplete_view(kind):
+    @versioned(versioning.RECIPES)
+    @read_only
+    async def view(request):
+        """Risultati {'id', 'text'} il cui nome inizia con ?q= (massimo ?limit=)."""
+        try:
+            limit = int(request.GET.get('limit', autocomplete.DEFAULT_LIMIT))
+        except ValueError:
+            return JsonResponse({'error': "Il parametro 'limit' deve essere un intero."}, status=400)
+        # La cache LRU dei prefissi è sincrona: la ricerca gira nel thread dell'ORM
+        results = await sync_to_async(autocomplete.search)(
+            request.household_id, kind, request.GET.get('q', ''), limit,
+        )
+        return JsonResponse({'results': results})
+    return view
+
+
+ingredient_autocomplete = autocomplete_view('ingredients')
+recipe_autocomplete = autocomplete_view('recipes')
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Collega i ricevitori che aggiornano la lista della spesa materializzata
+        from . import signals  # noqa: F401
+
+        # Misura delle query per /metrics: collegata prima che si apra
+        # qualunque connessione, in qualunque thread
+        from . import metrics
+        if metrics.enabled():
+            metrics.install()
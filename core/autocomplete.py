@@ -0,0 +1,94 @@
+# File: core/autocomplete.py
+
+"""
+Ricerca per prefisso di ingredienti e ricette per l'autocompletamento.
+
+I form non elencano più l'intera tabella come <option>: il browser chiede
+al server solo i nomi del nucleo familiare che iniziano con il testo
+digitato. La ricerca è un intervallo su name_ci dentro il nucleo
+(household = ? AND name_ci >= prefisso AND < prefisso + U+10FFFF),
+quindi usa gli indici core_*_hh_name_ci_idx invece di scorrere la tabella
+come farebbe un LIKE '%...%'. name_ci e prefisso passano entrambi per
+models.fold_name, in Python: LOWER() di SQLite converte solo l'ASCII e non
+troverebbe 'Èrba' cercando 'èr'.
+
+I prefissi più richiesti restano in una piccola cache LRU nel processo,
+indicizzata dal nucleo e dal suo timbro RECIPES (core/versioning.py): ogni
+modifica al ricettario di un nucleo rende irraggiungibili le sue voci
+vecchie, che escono per anzianità.
+"""
+
+from functools import lru_cache
+
+from . import versioning
+from .models import Ingredient, Recipe, fold_name
+
+# Risultati restituiti di default e al massimo per ogni ricerca
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+# Prefissi (con relativo timbro) tenuti in memoria da ogni processo
+HOT_PREFIXES = 512
+
+# Oltre questa lunghezza i prefissi sono troppo rari per valere la cache
+MAX_CACHED_PREFIX = 8
+
+# Carattere più alto di Unicode: chiude l'intervallo del prefisso
+PREFIX_END = chr(0x10FFFF)
+
+
+def prefix_filter(queryset, prefix):
+    """Filtra `queryset` sui nomi che iniziano con `prefix` (senza maiuscole)."""
+    queryset = queryset.order_by('name_ci', 'pk')
+    if prefix:
+        queryset = queryset.filter(name_ci__gte=prefix, name_ci__lt=prefix + PREFIX_END)
+    return queryset
+
+
+def search_ingredients_uncached(household_id, prefix, limit):
+    queryset = prefix_filter(Ingredient.objects.filter(household=household_id), prefix)
+    return tuple(
+        {'id': pk, 'text': f'{name} ({unit})'}
+        for pk, name, unit in queryset.values_list('pk', 'name', 'unit__name')[:limit]
+    )
+
+
+def search_recipes_uncached(household_id, prefix, limit):
+    queryset = prefix_filter(Recipe.objects.filter(household=household_id), prefix)
+    return tuple(
+        {'id': pk, 'text': name}
+        for pk, name in queryset.values_list('pk', 'name')[:limit]
+    )
+
+
+SEARCHES = {
+    'ingredients': search_ingredients_uncached,
+    'recipes': search_recipes_uncached,
+}
+
+
+@lru_cache(maxsize=HOT_PREFIXES)
+def _cached_search(household_id, kind, prefix, limit, version):
+    return SEARCHES[kind](household_id, prefix, limit)
+
+
+def normalize_prefix(text):
+    return fold_name(text or '')
+
+
+def search(household_id, kind, text, limit=DEFAULT_LIMIT):
+    """
+    Restituisce fino a `limit` risultati {'id', 'text'} del nucleo il cui
+    nome inizia con `text`, in ordine alfabetico. `kind` è 'ingredients' o
+    'recipes'.
+    """
+    prefix = normalize_prefix(text)
+    limit = max(1, min(limit, MAX_LIMIT))
+    if len(prefix) > MAX_CACHED_PREFIX:
+        return list(SEARCHES[kind](household_id, prefix, limit))
+    version = versioning.get_versions(household_id, versioning.RECIPES)[versioning.RECIPES]
+    return list(_cached_search(household_id, kind, prefix, limit, version))
+
+
+def clear_cache():
+    _cached_search.cache_clear()
@@ -0,0 +1,233 @@
+# File: core/benchmarks.py
+
+"""
+Benchmark di tutte le rotte di core.urls, confrontati con una baseline
+salvata (core/benchmark_baseline.json).
+
+Per ogni richiesta di esempio si misurano il tempo (il migliore di più
+esecuzioni dopo un riscaldamento, il meno sensibile al rumore), il numero di query e il picco di memoria
+allocata (tracemalloc). Il confronto segnala come regressione:
+  - più query della baseline (il numero è deterministico, nessuna tolleranza);
+  - un tempo oltre TIME_TOLERANCE volte la baseline più TIME_SLACK;
+  - un picco di memoria oltre MEMORY_TOLERANCE volte la baseline più MEMORY_SLACK;
+  - uno stato HTTP diverso.
+
+Le richieste POST girano in una transazione annullata alla fine, quindi i
+dati restano quelli di partenza. Nessuna di esse modifica il ricettario, per
+cui matrice e indice dei suggerimenti in memoria restano validi.
+
+Si eseguono come test: BENCHMARK=1 python manage.py test core.tests.ViewBenchmark
+(con BENCHMARK_SAVE=1 la baseline viene riscritta con i valori misurati).
+I tempi dipendono dalla macchina: la baseline va rigenerata su quella usata
+per il confronto.
+"""
+
+import json
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from . import urls, weeks
+from .models import DEFAULT_HOUSEHOLD_SLUG, MealSlot, Recipe, default_household
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+REPEAT = 5
+
+TIME_TOLERANCE = 1.5
+TIME_SLACK = 0.005           # secondi
+MEMORY_TOLERANCE = 1.5
+MEMORY_SLACK = 256 * 1024    # byte
+
+
+@dataclass
+class Sample:
+    """Una richiesta di esempio per una rotta."""
+    label: str
+    method: str = 'get'
+    kwargs: dict = field(default_factory=dict)
+    query: str = ''
+    data: dict = None
+
+
+@dataclass
+class Result:
+    status: int
+    queries: int
+    seconds: float
+    memory_peak: int
+
+
+def route_names():
+    """Nomi di tutte le rotte definite in core.urls."""
+    return {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)}
+
+
+def samples(recipe_id, slot_id):
+    """Richieste di esempio per ogni rotta: {nome rotta: [Sample, ...]}."""
+    monday = weeks.current_week()
+    return {
+        'weekly_plan': [Sample('weekly_plan')],
+        'shopping_list': [
+            Sample('shopping_list'),
+            Sample('shopping_list?range', query=f'start={monday - weeks.ONE_WEEK}&end={monday + weeks.ONE_WEEK}'),
+        ],
+        'shopping_list_bought': [Sample('shopping_list_bought', method='post')],
+        'meal_slot_create': [Sample('meal_slot_create', kwargs={'date': monday, 'meal_type': 'DIN'})],
+        'meal_slot_update': [Sample('meal_slot_update', kwargs={'pk': slot_id})],
+        'week_edit': [Sample('week_edit')],
+        'copy_week': [Sample('copy_week', method='post')],
+        'reset_weekly_plan': [Sample('reset_weekly_plan', method='post')],
+        'generate_weekly_plan': [Sample('generate_weekly_plan', method='post')],
+        'recipe_management': [
+            Sample('recipe_management'),
+            Sample('recipe_management?q', query='q=ricetta 0001'),
+            Sample('recipe_management?order=rank', query='q=ricetta ingrediente&order=rank'),
+        ],
+        'recipe_create': [Sample('recipe_create')],
+        'recipe_detail': [Sample('recipe_detail', kwargs={'pk': recipe_id})],
+        'recipe_delete': [Sample('recipe_delete', kwargs={'pk': recipe_id})],
+        'ingredient_create': [Sample('ingredient_create')],
+        'export_shopping_list': [
+            Sample(f'export_shopping_list.{fmt}', kwargs={'fmt': fmt}) for fmt in ('csv', 'json')
+        ],
+        'export_weekly_plan': [
+            Sample(f'export_weekly_plan.{fmt}', kwargs={'fmt': fmt}) for fmt in ('csv', 'json', 'ics')
+        ],
+        'api_weekly_plan': [Sample('api_weekly_plan')],
+        'api_recipe_detail': [Sample('api_recipe_detail', kwargs={'pk': recipe_id})],
+        'api_shopping_list': [
+            Sample('api_shopping_list'),
+            Sample('api_shopping_list?range', query=f'start={monday - weeks.ONE_WEEK}&end={monday + weeks.ONE_WEEK}'),
+        ],
+        'api_plan_evaluate': [
+            Sample('api_plan_evaluate', method='post', data={'plans': [{str(recipe_id): 2}] * 10}),
+        ],
+        'api_ingredient_autocomplete': [Sample('api_ingredient_autocomplete', query='q=sint')],
+        'api_recipe_autocomplete': [Sample('api_recipe_autocomplete', query='q=sint')],
+        'metrics': [Sample('metrics')],
+        # Client anonimo: misura il rifiuto (404) senza cambiare la sessione
+        'household_switch': [
+            Sample('household_switch', method='post', kwargs={'slug': DEFAULT_HOUSEHOLD_SLUG}),
+        ],
+    }
+
+
+def default_samples():
+    """Esempi costruiti sulla prima ricetta e sul primo slot del nucleo predefinito."""
+    household_id = default_household()
+    recipe = Recipe.objects.filter(household=household_id).order_by('pk').values_list('pk', flat=True).first()
+    slot = MealSlot.objects.filter(household=household_id).order_by('pk').values_list('pk', flat=True).first()
+    return samples(recipe or 0, slot or 0)
+
+
+def request(client, name, sample):
+    # Senza cookie CSRF le pagine con form non escono dalla cache: si misura la vista
+    client.cookies.clear()
+    url = reverse(name, kwargs=sample.kwargs)
+    if sample.query:
+        url = f'{url}?{sample.query}'
+    if sample.method == 'post':
+        with transaction.atomic():
+            if sample.data is not None:
+                response = client.post(url, json.dumps(sample.data), content_type='application/json')
+            else:
+                response = client.post(url)
+            transaction.set_rollback(True)
+    else:
+        response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure(client, name, sample, repeat=REPEAT):
+    """Riscaldamento, `repeat` esecuzioni cronometrate, una con query e una con tracemalloc."""
+    request(client, name, sample)
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        request(client, name, sample)
+        timings.append(time.perf_counter() - started)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = request(client, name, sample)
+    # Il registro delle query si svuota a ogni nuova richiesta: si conta subito
+    query_count = len(queries)
+
+    tracemalloc.start()
+    try:
+        request(client, name, sample)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        status=response.status_code,
+        queries=query_count,
+        seconds=min(timings),
+        memory_peak=peak,
+    )
+
+
+def run(client, all_samples=None, repeat=REPEAT):
+    """Misura ogni esempio di ogni rotta: {etichetta: Result}."""
+    all_samples = all_samples or default_samples()
+    return {
+        sample.label: measure(client, name, sample, repeat)
+        for name, route_samples in sorted(all_samples.items())
+        for sample in route_samples
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not Path(path).exists():
+        return {}
+    with open(path, encoding='utf-8') as stream:
+        return {label: Result(**values) for label, values in json.load(stream).items()}
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump({label: asdict(result) for label, result in sorted(results.items())}, stream, indent=2)
+        stream.write('\n')
+
+
+def compare(results, baseline):
+    """Messaggi di regressione rispetto alla baseline (lista vuota se tutto è in linea)."""
+    regressions = []
+    for label, result in sorted(results.items()):
+        base = baseline.get(label)
+        if base is None:
+            continue
+        if result.status != base.status:
+            regressions.append(f'{label}: stato {result.status} invece di {base.status}')
+        if result.queries > base.queries:
+            regressions.append(f'{label}: {result.queries} query invece di {base.queries}')
+        if result.seconds > base.seconds * TIME_TOLERANCE + TIME_SLACK:
+            regressions.append(
+                f'{label}: {result.seconds * 1000:.1f} ms invece di {base.seconds * 1000:.1f} ms'
+            )
+        if result.memory_peak > base.memory_peak * MEMORY_TOLERANCE + MEMORY_SLACK:
+            regressions.append(
+                f'{label}: picco di memoria {result.memory_peak / 1024:.0f} KiB '
+                f'invece di {base.memory_peak / 1024:.0f} KiB'
+            )
+    return regressions
+
+
+def format_table(results, baseline):
+    lines = [f"{'richiesta':<36}{'stato':>6}{'query':>7}{'ms':>9}{'base ms':>9}{'KiB':>9}"]
+    for label, result in sorted(results.items()):
+        base = baseline.get(label)
+        lines.append(
+            f'{label:<36}{result.status:>6}{result.queries:>7}{result.seconds * 1000:>9.1f}'
+            f"{(f'{base.seconds * 1000:.1f}' if base else '-'):>9}{result.memory_peak / 1024:>9.0f}"
+        )
+    return '\n'.join(lines)
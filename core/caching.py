@@ -0,0 +1,120 @@
+# File: core/caching.py
+
+"""
+Validazione HTTP e cache delle pagine HTML per versione del piano.
+
+Il decoratore `versioned_page` aggiunge ETag e Last-Modified calcolati dai
+timbri di core/versioning.py (un 304 non esegue query) e conserva nella
+cache la risposta già renderizzata, con chiave legata al nucleo familiare
+della richiesta e alla versione: ogni scrittura sul piano o sul ricettario
+di un nucleo rende irraggiungibili le sue copie vecchie senza doverle
+cancellare, e non tocca quelle degli altri nuclei.
+
+Le pagine legate a un intervallo di date (`dated`) comprendono nella chiave
+anche l'intervallo effettivo: senza ?week= la settimana corrente cambia da
+sola, e la pagina della settimana prima non deve più essere servita.
+"""
+
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+from . import versioning, weeks
+
+# Durata massima delle pagine in cache (le versioni vecchie scadono da sole)
+PAGE_TIMEOUT = 60 * 60 * 24
+
+KEY_PREFIX = 'core:page:'
+
+
+def page_key(request, scopes, vary_on_csrf, dated=False):
+    """
+    Chiave della pagina: nucleo + URL (+ intervallo effettivo se `dated`) +
+    giorno corrente per gli ambiti che ne dipendono + timbri degli ambiti
+    (+ cookie CSRF se serve).
+    """
+    versions = versioning.for_request(request, *scopes)
+    parts = [str(request.household_id), request.get_full_path()]
+    if dated:
+        parts.append(weeks.requested_period(request))
+    day = versioning.day_marker(*scopes)
+    if day:
+        parts.append(day)
+    parts += [str(versions[scope]) for scope in scopes]
+    if vary_on_csrf:
+        parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def versioned_page(*scopes, vary_on_csrf=False, dated=False, timeout=PAGE_TIMEOUT):
+    """
+    Le pagine con form contengono un token CSRF legato al cookie del
+    client: con `vary_on_csrf` la chiave include quel cookie e le richieste
+    senza cookie non usano la cache (il token verrebbe condiviso).
+    `dated` indica le pagine che mostrano l'intervallo di ?week= o
+    ?start=&end= (di default la settimana corrente).
+    Funziona sia con viste sincrone sia con viste asincrone.
+    """
+    def etag_func(request, *args, **kwargs):
+        return '"%s"' % page_key(request, scopes, vary_on_csrf, dated)[:32]
+
+    def last_modified_func(request, *args, **kwargs):
+        modified = versioning.last_modified(
+            request.household_id, *scopes, versions=versioning.for_request(request, *scopes),
+        )
+        if dated and not weeks.has_explicit_period(request):
+            # La settimana corrente è cambiata: If-Modified-Since precedenti non valgono più
+            modified = max(modified, weeks.week_started_at(weeks.current_week()))
+        return modified
+
+    def cacheable(request):
+        return request.method in ('GET', 'HEAD') and (
+            not vary_on_csrf or settings.CSRF_COOKIE_NAME in request.COOKIES
+        )
+
+    def should_store(response):
+        return response.status_code == 200 and not response.streaming
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not cacheable(request):
+                    return await view(request, *args, **kwargs)
+
+                key = KEY_PREFIX + page_key(request, scopes, vary_on_csrf, dated)
+                response = await cache.aget(key)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    if should_store(response):
+                        await cache.aset(key, response, timeout)
+                return response
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not cacheable(request):
+                    return view(request, *args, **kwargs)
+
+                key = KEY_PREFIX + page_key(request, scopes, vary_on_csrf, dated)
+                response = cache.get(key)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                    if should_store(response):
+                        cache.set(key, response, timeout)
+                return response
+
+        conditional = condition(etag_func=etag_func, last_modified_func=last_modified_func)(wrapper)
+        if iscoroutinefunction(view):
+            # I timbri si leggono prima, senza bloccare il ciclo degli eventi
+            @wraps(view)
+            async def prefetching(request, *args, **kwargs):
+                await versioning.prefetch(request, *scopes)
+                return await conditional(request, *args, **kwargs)
+            return prefetching
+        return conditional
+    return decorator
@@ -0,0 +1,20 @@
+# File: core/converters.py
+
+"""
+Convertitori di percorso per core/urls.py.
+"""
+
+import datetime
+
+
+class IsoDateConverter:
+    """Data in formato ISO (AAAA-MM-GG), passata alla vista come datetime.date."""
+
+    regex = r'\d{4}-\d{2}-\d{2}'
+
+    def to_python(self, value):
+        # Una data inesistente (es. 2026-02-30) solleva ValueError: nessuna corrispondenza
+        return datetime.date.fromisoformat(value)
+
+    def to_url(self, value):
+        return value.isoformat() if isinstance(value, datetime.date) else str(value)
@@ -0,0 +1,247 @@
+# File: core/costs.py
+
+"""
+Costo della spesa con confezioni intere e costo stimato delle ricette.
+
+Ogni ingrediente può avere più confezioni (Pack: quantità e prezzo). Per
+la lista della spesa serve, per ogni riga, la combinazione più economica di
+confezioni che copre la quantità da comprare: un problema di copertura con
+ripetizioni, risolto una volta per ingrediente quando cambiano le sue
+confezioni e salvato in Ingredient.pack_options:
+
+  - le dimensioni, nell'unità base, si esprimono in passi del loro MCD;
+  - `cost[k]` è il costo minimo per coprire almeno k passi, `choice[k]` la
+    confezione aggiunta per ultima (per ricostruire la combinazione);
+  - la tabella arriva fino a (s - 1) x passi della confezione più grande + s,
+    con s i passi della confezione con il miglior prezzo per unità: una
+    soluzione ottima usa al più s - 1 confezioni diverse da questa
+    (tra s confezioni qualsiasi c'è un gruppo di dimensione totale multipla
+    di s, sostituibile con confezioni migliori), per cui oltre la tabella
+    si aggiungono solo confezioni migliori. Le tabelle restano di poche
+    voci; se superano MAX_TABLE_STEPS vengono troncate e la soluzione oltre
+    il limite diventa approssimata.
+
+Le tabelle arrivano con la lista della spesa nella sua stessa query
+(materialized_shopping_list con `packs=True`); risolvere una riga costa
+una lettura della tabella più un passo per confezione scelta.
+
+Il costo stimato di una ricetta (Recipe.cost) usa invece il prezzo per
+unità base della confezione più conveniente (Ingredient.unit_price): è
+ciò che la ricetta consuma, senza arrotondare alle confezioni. Si
+ricalcola come i totali nutrizionali (core/nutrition.py), con un UPDATE
+solo per le ricette toccate.
+"""
+
+import math
+from collections import Counter
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .materialized import EPSILON
+from .models import Ingredient, Pack, Recipe, RecipeIngredient
+
+# Lunghezza massima della tabella di un ingrediente (oltre: soluzione approssimata)
+MAX_TABLE_STEPS = 5000
+
+
+# ----------------------------------------------------------------------
+# Tabelle delle confezioni
+# ----------------------------------------------------------------------
+
+def build_options(packs):
+    """
+    Tabella delle combinazioni più economiche per le confezioni
+    [(quantità nell'unità base, prezzo in centesimi, etichetta)], o None se
+    non ce ne sono. Il risultato è serializzabile in JSON.
+    """
+    if not packs:
+        return None
+    sizes = [max(1, round(size)) for size, _, _ in packs]
+    quantum = math.gcd(*sizes)
+    steps = [size // quantum for size in sizes]
+    prices = [price for _, price, _ in packs]
+    # A parità di prezzo per unità, la confezione più grande
+    best = min(range(len(packs)), key=lambda i: (prices[i] / steps[i], -steps[i]))
+
+    length = min((steps[best] - 1) * max(steps) + steps[best], MAX_TABLE_STEPS)
+    cost = [0] * (length + 1)
+    choice = [-1] * (length + 1)
+    for k in range(1, length + 1):
+        cost[k], choice[k] = min(
+            (price + cost[max(0, k - step)], i) for i, (step, price) in enumerate(zip(steps, prices))
+        )
+    return {
+        'quantum': quantum,
+        'steps': steps,
+        'prices': prices,
+        'labels': [label for _, _, label in packs],
+        'best': best,
+        'cost': cost,
+        'choice': choice,
+    }
+
+
+class Purchase(NamedTuple):
+    """Confezioni da comprare per una riga: costo in centesimi e [(etichetta, numero)]."""
+    cost: int
+    packs: list
+
+
+def solve(options, quantity):
+    """Combinazione più economica di confezioni che copre `quantity` (unità base)."""
+    if quantity <= EPSILON:
+        return Purchase(0, [])
+    steps, prices, cost, choice = options['steps'], options['prices'], options['cost'], options['choice']
+    best = options['best']
+    k = math.ceil(quantity / options['quantum'] - EPSILON)
+
+    # Oltre la tabella si aggiungono solo confezioni con il miglior prezzo per unità
+    counts = Counter()
+    limit = len(cost) - 1
+    if k > limit:
+        counts[best] = math.ceil((k - limit) / steps[best])
+        k -= counts[best] * steps[best]
+    total = cost[k] + counts[best] * prices[best]
+    while k > 0:
+        i = choice[k]
+        counts[i] += 1
+        k -= steps[i]
+    return Purchase(total, [(options['labels'][i], n) for i, n in sorted(counts.items()) if n])
+
+
+def pack_rows(ingredient_ids=None, household_id=None):
+    """Confezioni raggruppate per ingrediente: {ingredient_id: [(quantità base, centesimi, etichetta)]}."""
+    packs = Pack.objects.order_by('ingredient_id', 'quantity', 'pk')
+    if ingredient_ids is not None:
+        packs = packs.filter(ingredient_id__in=ingredient_ids)
+    if household_id is not None:
+        packs = packs.filter(ingredient__household=household_id)
+    grouped = {}
+    rows = packs.values_list('ingredient_id', 'quantity', 'price', 'ingredient__unit__factor', 'ingredient__unit__name')
+    for ingredient_id, quantity, price, factor, unit in rows:
+        grouped.setdefault(ingredient_id, []).append(
+            (quantity * factor, round(price * 100), f'{quantity:g} {unit}')
+        )
+    return grouped
+
+
+def unit_price(options):
+    """Prezzo in euro per unità base della confezione più conveniente."""
+    best = options['best']
+    return options['prices'][best] / 100 / (options['steps'][best] * options['quantum'])
+
+
+def refresh_ingredients(ingredient_ids):
+    """
+    Ricalcola tabelle e prezzi per unità degli ingredienti indicati e il
+    costo delle ricette che li usano: una lettura delle confezioni, un
+    aggiornamento in blocco degli ingredienti, un UPDATE delle ricette.
+    """
+    ingredient_ids = list(ingredient_ids)
+    grouped = pack_rows(ingredient_ids)
+    ingredients = []
+    for pk in ingredient_ids:
+        options = build_options(grouped.get(pk))
+        ingredients.append(Ingredient(
+            pk=pk, pack_options=options, unit_price=unit_price(options) if options else None,
+        ))
+    with transaction.atomic():
+        Ingredient.objects.bulk_update(ingredients, ['pack_options', 'unit_price'])
+        refresh_recipes(RecipeIngredient.objects.filter(ingredient__in=ingredient_ids).values('recipe_id'))
+
+
+def rebuild(household_id=None):
+    """Ricalcola tabelle, prezzi e costi del nucleo (di tutti i nuclei se `household_id` è None)."""
+    ingredients = Ingredient.objects.all()
+    if household_id is not None:
+        ingredients = ingredients.filter(household=household_id)
+    refresh_ingredients(ingredients.values_list('pk', flat=True))
+
+
+# ----------------------------------------------------------------------
+# Costo stimato delle ricette
+# ----------------------------------------------------------------------
+
+def recipe_cost():
+    """Subquery: costo stimato della ricetta esterna (0 senza ingredienti con prezzo)."""
+    total = (
+        RecipeIngredient.objects
+        .filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(total=Sum(
+            F('quantity') * F('ingredient__unit__factor') * F('ingredient__unit_price'),
+            output_field=FloatField(),
+        ))
+        .values('total')
+    )
+    return Coalesce(Subquery(total), Value(0.0))
+
+
+def refresh_recipes(recipe_ids):
+    """Ricalcola il costo delle ricette indicate (id o queryset di id) con un solo UPDATE."""
+    return Recipe.objects.filter(pk__in=recipe_ids).update(cost=recipe_cost())
+
+
+# ----------------------------------------------------------------------
+# Lista della spesa e piano
+# ----------------------------------------------------------------------
+
+class Basket(NamedTuple):
+    """Costo della lista: totale in euro e righe senza confezioni (non conteggiate)."""
+    total: float
+    unpriced: int
+
+
+def price_shopping_list(rows):
+    """
+    Aggiunge a ogni riga della lista netta (con 'pack_options') le chiavi
+    'packs', 'cost' (euro, None senza confezioni) e 'packs_label' (es.
+    "2 × 500 g · 3.20 €": composta qui, perché un ciclo annidato e
+    floatformat per riga costerebbero nel template più del calcolo) e
+    restituisce il Basket. Nessuna query: le tabelle arrivano con le righe.
+    """
+    total, unpriced = 0, 0
+    for row in rows:
+        options = row.pop('pack_options')
+        if options is None:
+            row['packs'], row['packs_label'], row['cost'] = [], '', None
+            unpriced += 1
+            continue
+        purchase = solve(options, row['net'])
+        row['packs'], row['cost'] = purchase.packs, purchase.cost / 100
+        row['packs_label'] = '{} · {:.2f} €'.format(
+            ' + '.join(f'{count} × {label}' for label, count in purchase.packs), row['cost'],
+        )
+        total += purchase.cost
+    return Basket(total=total / 100, unpriced=unpriced)
+
+
+class RecipeCost(NamedTuple):
+    recipe: Recipe
+    portions: int
+    portion_cost: float
+    cost: float
+
+
+def summarize(meal_grid):
+    """
+    Costo stimato delle ricette pianificate nella griglia di
+    views.build_weekly_grid, dal Recipe.cost già caricato con la griglia:
+    ([RecipeCost] per nome, totale della settimana). Una passata, nessuna query.
+    """
+    recipes, portions = {}, Counter()
+    for day in meal_grid:
+        for cell in day['cells']:
+            for recipe, planned in zip(cell['recipes'], cell['portions']):
+                recipes[recipe.pk] = recipe
+                portions[recipe.pk] += planned
+    rows = []
+    for pk, recipe in recipes.items():
+        portion_cost = recipe.cost / recipe.servings
+        rows.append(RecipeCost(recipe, portions[pk], portion_cost, portion_cost * portions[pk]))
+    rows.sort(key=lambda row: row.recipe.name)
+    return rows, sum(row.cost for row in rows)
@@ -0,0 +1,216 @@
+# File: core/exports.py
+
+"""
+Esportazioni in streaming della lista della spesa e del piano settimanale
+(CSV, JSON, iCal), per la settimana di ?week= o l'intervallo ?start=&end=
+(vedi core/weeks.py; di default la settimana corrente).
+
+Le righe vengono lette dal database a blocchi con .iterator() e inviate al
+client man mano con StreamingHttpResponse: la memoria usata resta costante
+anche per esportazioni molto grandi e i primi byte partono subito.
+"""
+
+import csv
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, IntegerField, When
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+
+from . import weeks
+from .aggregation import planned_between
+from .materialized import materialized_shopping_list
+from .models import DAY_CHOICES, MEAL_TYPE_CHOICES
+
+# Righe lette dal database per ogni blocco dell'iteratore
+CHUNK_SIZE = 2000
+
+# Orari indicativi dei pasti per l'esportazione iCal
+MEAL_TIMES = {
+    'BRK': datetime.time(8, 0),
+    'LUN': datetime.time(13, 0),
+    'SNK': datetime.time(17, 0),
+    'DIN': datetime.time(20, 0),
+}
+MEAL_DURATION = datetime.timedelta(hours=1)
+
+DAY_NAMES = dict(DAY_CHOICES)
+MEAL_NAMES = dict(MEAL_TYPE_CHOICES)
+
+
+class Echo:
+    """Pseudo-buffer per csv.writer: restituisce la riga invece di scriverla."""
+
+    def write(self, value):
+        return value
+
+
+# ======================================================================
+# SORGENTI DATI
+# ======================================================================
+
+def shopping_list_items(household_id, start, end):
+    """Righe della lista della spesa del nucleo nei giorni da `start` a `end`, lette a blocchi."""
+    return materialized_shopping_list(household_id, start, end).iterator(chunk_size=CHUNK_SIZE)
+
+
+def weekly_plan_items(household_id, start, end):
+    """
+    Ricette pianificate dal nucleo nei giorni da `start` a `end` in ordine di
+    data e pasto, lette a blocchi.
+    """
+    meal_order = Case(
+        *[When(meal_slot__meal_type=code, then=i) for i, (code, _) in enumerate(MEAL_TYPE_CHOICES)],
+        output_field=IntegerField(),
+    )
+    rows = (
+        planned_between(household_id, start, end)
+        .annotate(meal_order=meal_order)
+        .order_by('meal_slot__date', 'meal_order', 'id')
+        .values_list('pk', 'meal_slot__date', 'meal_slot__meal_type', 'recipe_id', 'recipe__name')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for pk, date, meal_type, recipe_id, recipe_name in rows:
+        day = weeks.day_code(date)
+        yield {
+            'id': pk,
+            'date': date,
+            'day': day,
+            'day_name': DAY_NAMES.get(day, day),
+            'meal_type': meal_type,
+            'meal_name': MEAL_NAMES.get(meal_type, meal_type),
+            'recipe_id': recipe_id,
+            'recipe': recipe_name,
+        }
+
+
+# ======================================================================
+# FORMATI
+# ======================================================================
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(items):
+    """Serializza un iterabile di dizionari come array JSON, un elemento alla volta."""
+    yield '['
+    for i, item in enumerate(items):
+        yield (',\n' if i else '\n') + json.dumps(item, cls=DjangoJSONEncoder)
+    yield '\n]\n'
+
+
+def ical_escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\n', '\\n')
+    )
+
+
+def ical_fold(line):
+    """Spezza le righe iCal oltre i 75 ottetti (RFC 5545, 3.1)."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, current = [], b''
+    for char in line:
+        char_bytes = char.encode('utf-8')
+        if len(current) + len(char_bytes) > (75 if not parts else 74):
+            parts.append(current.decode('utf-8'))
+            current = b''
+        current += char_bytes
+    parts.append(current.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def stream_ical(items):
+    """Un VEVENT per ogni ricetta pianificata, nel giorno del suo slot."""
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+
+    yield ical_fold('BEGIN:VCALENDAR')
+    yield ical_fold('VERSION:2.0')
+    yield ical_fold('PRODID:-//SpesaFacile//Piano Settimanale//IT')
+    for item in items:
+        start = datetime.datetime.combine(item['date'], MEAL_TIMES.get(item['meal_type'], datetime.time(12, 0)))
+        end = start + MEAL_DURATION
+        yield ical_fold('BEGIN:VEVENT')
+        yield ical_fold(f"UID:mealrecipe-{item['id']}@spesafacile")
+        yield ical_fold(f'DTSTAMP:{stamp}')
+        yield ical_fold(f'DTSTART:{start:%Y%m%dT%H%M%S}')
+        yield ical_fold(f'DTEND:{end:%Y%m%dT%H%M%S}')
+        yield ical_fold('SUMMARY:' + ical_escape(f"{item['meal_name']}: {item['recipe']}"))
+        yield ical_fold('END:VEVENT')
+    yield ical_fold('END:VCALENDAR')
+
+
+def streaming_response(content, content_type, filename):
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# ======================================================================
+# VISTE
+# ======================================================================
+
+def requested_range(request):
+    try:
+        return weeks.range_from_request(request)
+    except ValueError:
+        raise Http404("Settimana o intervallo di date non valido.")
+
+
+def range_filename(prefix, start, end, ext):
+    return f'{prefix}-{start:%Y%m%d}-{end:%Y%m%d}.{ext}'
+
+
+def export_shopping_list(request, fmt):
+    """Esporta la lista della spesa aggregata dell'intervallo in CSV o JSON."""
+    start, end = requested_range(request)
+    household_id = request.household_id
+    if fmt == 'csv':
+        rows = (
+            (item['name'], item['quantity'], item['unit'])
+            for item in shopping_list_items(household_id, start, end)
+        )
+        return streaming_response(
+            stream_csv(['ingrediente', 'quantita', 'unita'], rows),
+            'text/csv; charset=utf-8', range_filename('lista-spesa', start, end, 'csv'),
+        )
+    if fmt == 'json':
+        return streaming_response(
+            stream_json(shopping_list_items(household_id, start, end)), 'application/json',
+            range_filename('lista-spesa', start, end, 'json'),
+        )
+    raise Http404("Formato di esportazione non supportato.")
+
+
+def export_weekly_plan(request, fmt):
+    """Esporta il piano dell'intervallo (di default la settimana corrente) in CSV, JSON o iCal."""
+    start, end = requested_range(request)
+    household_id = request.household_id
+    if fmt == 'csv':
+        rows = (
+            (item['date'].isoformat(), item['day_name'], item['meal_name'], item['recipe'])
+            for item in weekly_plan_items(household_id, start, end)
+        )
+        return streaming_response(
+            stream_csv(['data', 'giorno', 'pasto', 'ricetta'], rows),
+            'text/csv; charset=utf-8', range_filename('piano', start, end, 'csv'),
+        )
+    if fmt == 'json':
+        return streaming_response(
+            stream_json(weekly_plan_items(household_id, start, end)), 'application/json',
+            range_filename('piano', start, end, 'json'),
+        )
+    if fmt == 'ics':
+        return streaming_response(
+            stream_ical(weekly_plan_items(household_id, start, end)),
+            'text/calendar; charset=utf-8', range_filename('piano', start, end, 'ics'),
+        )
+    raise Http404("Formato di esportazione non supportato.")
@@ -1,48 +1,238 @@
 from django import forms
-from .models import Recipe, Ingredient, RecipeIngredient, MealSlot, MealRecipe
+from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
+from .models import (
+    Recipe, Ingredient, RecipeIngredient, MealRecipe, DAY_CHOICES, MEAL_TYPE_CHOICES, NUTRIENT_FIELDS,
+)
+from .widgets import AutocompleteSelect, AutocompleteSelectMultiple
+from . import planner
+
+
+class HouseholdNameMixin:
+    """
+    Nome unico nel nucleo dell'istanza (`instance.household_id`, impostato
+    dalla vista). Il vincolo (household, name) non viene verificato dal
+    ModelForm perché il nucleo non è un campo del form.
+    """
+
+    def clean_name(self):
+        name = self.cleaned_data['name']
+        duplicates = self._meta.model.objects.filter(household=self.instance.household_id, name=name)
+        if self.instance.pk:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise ValidationError(
+                "Esiste già un elemento con questo nome nel nucleo familiare.", code='unique',
+            )
+        return name
 
 # 1. Form per la Creazione/Modifica Ricetta
-class RecipeForm(forms.ModelForm):
-    """Form per il nome base della Ricetta."""
+class RecipeForm(HouseholdNameMixin, forms.ModelForm):
+    """Form per il nome base della Ricetta e le porzioni a cui si riferiscono le dosi."""
     class Meta:
         model = Recipe
-        fields = ['name']
+        fields = ['name', 'servings']
         widgets = {
             'name': forms.TextInput(attrs={
                 'class': 'form-control', 
                 'placeholder': 'Nome del piatto (es: Lasagne alla Bolognese)'
             }),
+            'servings': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
         }
         labels = {
             'name': 'Nome della Ricetta',
+            'servings': 'Porzioni (le dosi sono per questo numero di porzioni)',
         }
 
 # 2. Form per la Creazione di Ingredienti al volo
-class IngredientForm(forms.ModelForm):
+class IngredientForm(HouseholdNameMixin, forms.ModelForm):
     """Form per creare un nuovo Ingrediente dalla vista Recipe Detail."""
     class Meta:
         model = Ingredient
-        fields = ['name', 'unit']
+        fields = ['name', 'unit', 'nutrition_basis', *NUTRIENT_FIELDS]
         widgets = {
             'name': forms.TextInput(attrs={
                 'class': 'form-control', 
                 'placeholder': 'Es: Zucchero, Farina, Uova'
             }),
-            'unit': forms.TextInput(attrs={
+            'unit': forms.Select(attrs={
                 'class': 'form-control', 
-                'placeholder': 'Es: g, ml, pezzi'
             }),
+            # Valori nutrizionali: facoltativi, 0 se non indicati
+            **{
+                name: forms.NumberInput(attrs={'class': 'form-control', 'min': 0, 'step': 'any'})
+                for name in ['nutrition_basis', *NUTRIENT_FIELDS]
+            },
         }
         labels = {
             'name': 'Nome Ingrediente',
             'unit': 'Unità di Misura',
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # I form rapidi inviano solo nome e unità: i valori vuoti prendono il default
+        for name in ['nutrition_basis', *NUTRIENT_FIELDS]:
+            self.fields[name].required = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for name in ['nutrition_basis', *NUTRIENT_FIELDS]:
+            if cleaned_data.get(name) is None and name not in self.errors:
+                cleaned_data[name] = Ingredient._meta.get_field(name).default
+        return cleaned_data
+
+    def clean_nutrition_basis(self):
+        basis = self.cleaned_data['nutrition_basis']
+        if basis is not None and basis <= 0:
+            raise ValidationError("La quantità di riferimento deve essere positiva.")
+        return basis
+
+# 3. Form per la singola riga ingrediente del formset delle ricette
+class RecipeIngredientForm(forms.ModelForm):
+    """Riga del RecipeIngredientFormSet (ingrediente + quantità)."""
+    class Meta:
+        model = RecipeIngredient
+        fields = ['ingredient', 'quantity']
+        widgets = {
+            # Solo l'ingrediente scelto: gli altri arrivano dall'autocompletamento
+            'ingredient': AutocompleteSelect(url=reverse_lazy('api_ingredient_autocomplete')),
+        }
+
+    def __init__(self, *args, household=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # L'etichetta dell'opzione mostra l'unità: evita una query in più
+        ingredients = Ingredient.objects.select_related('unit')
+        if household is not None:
+            # Solo gli ingredienti del nucleo della ricetta
+            ingredients = ingredients.filter(household=household)
+        self.fields['ingredient'].queryset = ingredients
+        if self.instance.ingredient_id:
+            self.fields['ingredient'].widget.known_objects = {
+                str(self.instance.ingredient_id): self.instance.ingredient,
+            }
+
+# 4. Form per la singola riga ricetta del formset degli slot pasto
+class MealRecipeForm(forms.ModelForm):
+    """Riga del MealRecipeFormSet (ricetta assegnata allo slot e porzioni, vuoto = quelle della ricetta)."""
+    class Meta:
+        model = MealRecipe
+        fields = ['recipe', 'portions']
+        widgets = {
+            'recipe': AutocompleteSelect(url=reverse_lazy('api_recipe_autocomplete')),
+            'portions': forms.NumberInput(attrs={'min': 1, 'placeholder': 'Come la ricetta'}),
+        }
+
+    def __init__(self, *args, household=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if household is not None:
+            # Solo le ricette del nucleo dello slot
+            self.fields['recipe'].queryset = Recipe.objects.filter(household=household)
+        if self.instance.recipe_id:
+            self.fields['recipe'].widget.known_objects = {
+                str(self.instance.recipe_id): self.instance.recipe,
+            }
+
+# 5. Form per la generazione automatica del piano settimanale
+class PlanGeneratorForm(forms.Form):
+    """Parametri del generatore (core/planner.py)."""
+    objective = forms.ChoiceField(
+        label='Obiettivo',
+        choices=[
+            (planner.OBJECTIVE_INGREDIENTS, 'Meno ingredienti diversi'),
+            (planner.OBJECTIVE_QUANTITY, 'Minore quantità totale'),
+        ],
+        initial=planner.OBJECTIVE_INGREDIENTS,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    no_repeat_days = forms.IntegerField(
+        label='Non ripetere una ricetta entro (giorni)',
+        min_value=0, max_value=7,
+        initial=planner.DEFAULT_NO_REPEAT_DAYS,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+    )
+
+# 6. Form per la modifica in blocco della settimana (core/week_editor.py)
+class RecipeIdsField(forms.ModelMultipleChoiceField):
+    """
+    Come ModelMultipleChoiceField, ma restituisce la lista degli id senza
+    interrogare il database: l'esistenza delle ricette è verificata una sola
+    volta per tutto il form (WeekPlanForm.clean), non una volta per cella.
+    """
+
+    def clean(self, value):
+        value = self.prepare_value(value)
+        if not value:
+            return []
+        if not isinstance(value, (list, tuple)):
+            raise ValidationError(self.error_messages['invalid_list'], code='invalid_list')
+        ids = set()
+        for pk in value:
+            try:
+                ids.add(int(pk))
+            except (TypeError, ValueError):
+                raise ValidationError(
+                    self.error_messages['invalid_pk_value'], code='invalid_pk_value', params={'pk': pk},
+                )
+        return sorted(ids)
+
+
+class WeekPlanForm(forms.Form):
+    """
+    Un campo per cella (giorno x pasto) con le ricette della cella, tutte
+    del nucleo `household`.
+    """
+
+    def __init__(self, *args, household, known_recipes=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.household = household
+        recipes = Recipe.objects.filter(household=household)
+        self.cells = {}
+        for day, _ in DAY_CHOICES:
+            for meal_type, meal_name in MEAL_TYPE_CHOICES:
+                name = self.field_name(day, meal_type)
+                widget = AutocompleteSelectMultiple(url=reverse_lazy('api_recipe_autocomplete'))
+                # Ricette già caricate dal chiamante: nessuna query per cella
+                widget.known_objects = known_recipes or {}
+                self.fields[name] = RecipeIdsField(
+                    queryset=recipes, required=False, label=meal_name, widget=widget,
+                )
+                self.cells[name] = (day, meal_type)
+
+    @staticmethod
+    def field_name(day, meal_type):
+        return f'{day}_{meal_type}'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        requested = {pk for name in self.cells for pk in cleaned_data.get(name, ())}
+        existing = set(
+            Recipe.objects.filter(household=self.household, pk__in=requested).values_list('pk', flat=True)
+        )
+        unknown = sorted(requested - existing)
+        if unknown:
+            raise ValidationError(
+                "Ricette inesistenti: %(ids)s.", code='unknown_recipes',
+                params={'ids': ', '.join(map(str, unknown))},
+            )
+        return cleaned_data
+
+    def assignments(self):
+        """{(day, meal_type): [recipe_id, ...]} per tutte le celle del form."""
+        return {cell: self.cleaned_data.get(name, []) for name, cell in self.cells.items()}
+
+    def rows(self):
+        """I campi disposti per giorno, nell'ordine della griglia."""
+        return [
+            (day_name, [self[self.field_name(day, meal_type)] for meal_type, _ in MEAL_TYPE_CHOICES])
+            for day, day_name in DAY_CHOICES
+        ]
+
 # NOTA: I Formset (come RecipeIngredientFormSet e MealRecipeFormSet)
 # NON vengono definiti qui, ma sono generati direttamente nelle viste 
 # (core/views.py) utilizzando la funzione inlineformset_factory.
 
 # Esempio:
 # from django.forms import inlineformset_factory
-# RecipeIngredientFormSet = inlineformset_factory(Recipe, RecipeIngredient, fields=('ingredient', 'quantity'), extra=1, can_delete=True)
-# Questo è il motivo per cui non vedi qui il codice per RecipeIngredient!
\ No newline at end of file
+# RecipeIngredientFormSet = inlineformset_factory(Recipe, RecipeIngredient, form=RecipeIngredientForm, fields=('ingredient', 'quantity'), extra=1, can_delete=True)
+# Qui sono definiti solo i form delle singole righe (RecipeIngredientForm, MealRecipeForm).
\ No newline at end of file
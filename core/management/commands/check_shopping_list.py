@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import materialized
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola da zero la lista della spesa e la confronta con la copia "
+        "materializzata (ShoppingListLine). Con --fix la ricostruisce."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help="Ricostruisce la lista materializzata se non è coerente.",
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=1e-6,
+            help="Differenza massima ammessa tra le quantità (default: 1e-6).",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = materialized.diff(tolerance=options['tolerance'])
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Lista della spesa materializzata coerente."))
+            return
+
+        for date, name, unit, expected, actual in mismatches:
+            self.stdout.write(f"{date:%d/%m/%Y} {name} ({unit}): atteso {expected:g}, materializzato {actual:g}")
+
+        if options['fix']:
+            materialized.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f"Lista ricostruita ({len(mismatches)} righe corrette)."
+            ))
+            return
+
+        raise CommandError(f"{len(mismatches)} righe non coerenti. Usa --fix per ricostruire.")
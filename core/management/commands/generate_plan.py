@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import planner, weeks
+from core.models import DEFAULT_HOUSEHOLD_SLUG, Household, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Riempie le celle vuote di una settimana del piano con le ricette che "
+        "minimizzano gli ingredienti distinti (o la quantità totale)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--week',
+            help="Settimana da completare, AAAA-Www o una sua data (default: la corrente).",
+        )
+        parser.add_argument(
+            '--objective', choices=planner.OBJECTIVES, default=planner.OBJECTIVE_INGREDIENTS,
+            help="Cosa minimizzare (default: ingredients).",
+        )
+        parser.add_argument(
+            '--no-repeat-days', type=int, default=planner.DEFAULT_NO_REPEAT_DAYS,
+            help=f"Giorni entro cui una ricetta non si ripete (default: {planner.DEFAULT_NO_REPEAT_DAYS}).",
+        )
+        parser.add_argument(
+            '--beam-width', type=int, default=planner.DEFAULT_BEAM_WIDTH,
+            help=f"Piani parziali tenuti a ogni passo (default: {planner.DEFAULT_BEAM_WIDTH}).",
+        )
+        parser.add_argument(
+            '--time-budget', type=float, default=planner.DEFAULT_TIME_BUDGET,
+            help=f"Secondi di ricerca prima di completare in modo goloso (default: {planner.DEFAULT_TIME_BUDGET}).",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Mostra il piano senza salvarlo.")
+        parser.add_argument(
+            '--household', default=DEFAULT_HOUSEHOLD_SLUG,
+            help=f"Slug del nucleo familiare (default: {DEFAULT_HOUSEHOLD_SLUG}).",
+        )
+
+    def handle(self, *args, **options):
+        if options['no_repeat_days'] < 0 or options['beam_width'] < 1:
+            raise CommandError("--no-repeat-days deve essere >= 0 e --beam-width >= 1.")
+        try:
+            week = weeks.parse_week(options['week']) if options['week'] else weeks.current_week()
+        except ValueError:
+            raise CommandError(f"Settimana non valida: {options['week']}")
+        try:
+            household = Household.objects.get(slug=options['household'])
+        except Household.DoesNotExist:
+            raise CommandError(f"Nucleo familiare inesistente: {options['household']}")
+
+        result = planner.generate_plan(
+            household.pk,
+            week,
+            objective=options['objective'],
+            no_repeat_days=options['no_repeat_days'],
+            beam_width=options['beam_width'],
+            time_budget=options['time_budget'],
+        )
+        names = dict(
+            Recipe.objects.filter(pk__in=result.assignments.values()).values_list('pk', 'name')
+        )
+        for (day, meal_type), recipe_id in result.assignments.items():
+            self.stdout.write(f"{day} {meal_type}: {names[recipe_id]}")
+        for day, meal_type in result.unfilled:
+            self.stdout.write(self.style.WARNING(f"{day} {meal_type}: nessuna ricetta ammessa"))
+
+        if not options['dry_run']:
+            planner.apply_plan(household.pk, result, week)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result.assignments)} pasti {'proposti' if options['dry_run'] else 'pianificati'}: "
+            f"{result.distinct_ingredients} ingredienti distinti, quantità totale "
+            f"{result.total_quantity:g} in {result.elapsed * 1000:.0f} ms"
+            f"{' (budget di tempo esaurito)' if result.timed_out else ''}."
+        ))
@@ -0,0 +1,232 @@
+import csv
+import io
+import json
+import sys
+import time
+from itertools import groupby, islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import costs, matrix, nutrition, suggestions, versioning
+from core.models import DEFAULT_HOUSEHOLD_SLUG, Household, Ingredient, Recipe, RecipeIngredient, Unit
+
+
+def read_csv(stream):
+    """
+    Legge un CSV con intestazione recipe,ingredient,quantity[,unit].
+    Le righe della stessa ricetta devono essere consecutive.
+    """
+    reader = csv.DictReader(stream)
+    missing = {'recipe', 'ingredient', 'quantity'} - set(reader.fieldnames or [])
+    if missing:
+        raise CommandError(f"Colonne mancanti nel CSV: {', '.join(sorted(missing))}")
+    for name, rows in groupby(reader, key=lambda row: row['recipe'].strip()):
+        yield name, [
+            (row['ingredient'], row['quantity'], row.get('unit')) for row in rows
+        ]
+
+
+def read_jsonl(stream):
+    """Legge righe JSON {"name": ..., "ingredients": [{"name", "quantity", "unit"}]}."""
+    for line in stream:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        yield record['name'].strip(), [
+            (item['name'], item['quantity'], item.get('unit'))
+            for item in record.get('ingredients', [])
+        ]
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa ricette in blocco da CSV o JSONL in streaming, con inserimenti "
+        "bulk_create in transazioni a blocchi e ripresa dopo un errore."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File da importare ('-' per lo standard input).")
+        parser.add_argument('--format', choices=sorted(READERS), help="Formato (default: dall'estensione).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Ricette per transazione (default: 1000).")
+        parser.add_argument('--default-unit', default='pz', help="Unità per i nuovi ingredienti senza unità (default: pz).")
+        parser.add_argument(
+            '--checkpoint',
+            help="File in cui salvare il numero di ricette già importate (default: <path>.checkpoint).",
+        )
+        parser.add_argument('--resume', action='store_true', help="Riprende dall'ultimo blocco confermato.")
+        parser.add_argument(
+            '--household', default=DEFAULT_HOUSEHOLD_SLUG,
+            help=f"Slug del nucleo familiare (default: {DEFAULT_HOUSEHOLD_SLUG}).",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or Path(path).suffix.lstrip('.').lower()
+        if fmt not in READERS:
+            raise CommandError("Formato non riconosciuto: usa --format csv|jsonl.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size deve essere positivo.")
+
+        checkpoint = None
+        if path != '-':
+            checkpoint = Path(options['checkpoint'] or f'{path}.checkpoint')
+        skip = 0
+        if options['resume']:
+            if checkpoint is None or not checkpoint.exists():
+                raise CommandError("Nessun checkpoint da cui riprendere.")
+            skip = int(checkpoint.read_text().strip() or 0)
+        try:
+            self.household = Household.objects.get(slug=options['household'])
+        except Household.DoesNotExist:
+            raise CommandError(f"Nucleo familiare inesistente: {options['household']}")
+
+        self.load_caches(options['default_unit'])
+
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            stream = open(path, encoding='utf-8', newline='')
+
+        started = time.perf_counter()
+        done = skip
+        totals = {'recipes': 0, 'rows': 0, 'skipped': 0}
+        try:
+            records = islice(READERS[fmt](stream), skip, None)
+            while True:
+                try:
+                    batch = list(islice(records, options['batch_size']))
+                except (ValueError, KeyError, csv.Error) as exc:
+                    raise CommandError(f"Dati non validi dopo {done} ricette ({exc!r}).") from exc
+                if not batch:
+                    break
+                try:
+                    with transaction.atomic():
+                        counts = self.import_batch(batch)
+                except Exception as exc:
+                    raise CommandError(
+                        f"Blocco fallito dopo {done} ricette ({exc}). "
+                        f"Correggi i dati e rilancia con --resume."
+                    ) from exc
+
+                done += len(batch)
+                for key in totals:
+                    totals[key] += counts[key]
+                if checkpoint is not None:
+                    checkpoint.write_text(str(done))
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{done} ricette lette - {totals['rows']} righe "
+                    f"({totals['rows'] / elapsed:,.0f} righe/s)"
+                )
+        finally:
+            if path != '-':
+                stream.close()
+            # bulk_create non invia segnali: matrice, indice dei suggerimenti e
+            # versione del ricettario vanno invalidati esplicitamente
+            matrix.invalidate(self.household.pk)
+            suggestions.invalidate(self.household.pk)
+            versioning.bump(self.household.pk, versioning.RECIPES)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Importate {totals['recipes']} ricette e {totals['rows']} ingredienti "
+            f"in {elapsed:.1f}s ({totals['rows'] / max(elapsed, 1e-9):,.0f} righe/s, "
+            f"{totals['skipped']} ricette già presenti saltate)."
+        ))
+
+    # ------------------------------------------------------------------
+
+    def load_caches(self, default_unit):
+        """Carica in memoria le mappe nome -> pk di unità e ingredienti del nucleo."""
+        self.units = {}
+        self.unit_factors = {}
+        for pk, name, base_id, factor in Unit.objects.values_list('pk', 'name', 'base_id', 'factor'):
+            self.units[name] = pk
+            self.unit_factors[pk] = (base_id or pk, factor)
+        self.ingredients = {
+            name: (pk, unit_id)
+            for pk, name, unit_id in Ingredient.objects
+            .filter(household=self.household).values_list('pk', 'name', 'unit_id')
+        }
+        self.default_unit = self.resolve_units([default_unit])[0]
+
+    def resolve_units(self, names):
+        """Restituisce i pk delle unità, creando in blocco quelle mancanti (come canoniche)."""
+        names = [name.lower().strip() for name in names]
+        missing = {name for name in names if name not in self.units}
+        if missing:
+            for unit in Unit.objects.bulk_create(Unit(name=name) for name in sorted(missing)):
+                self.units[unit.name] = unit.pk
+                self.unit_factors[unit.pk] = (unit.pk, 1)
+        return [self.units[name] for name in names]
+
+    def convert(self, quantity, from_unit_id, to_unit_id):
+        """Converte una quantità tra due unità con la stessa unità canonica."""
+        if from_unit_id == to_unit_id:
+            return quantity
+        from_base, from_factor = self.unit_factors[from_unit_id]
+        to_base, to_factor = self.unit_factors[to_unit_id]
+        if from_base != to_base:
+            raise ValueError("unità non convertibili")
+        return quantity * from_factor / to_factor
+
+    def import_batch(self, batch):
+        names = [name for name, _ in batch]
+        existing = set(
+            Recipe.objects.filter(household=self.household, name__in=names).values_list('name', flat=True)
+        )
+
+        # 1. Normalizza le righe e raccoglie le unità
+        recipes = {}
+        for name, items in batch:
+            if not name:
+                raise ValueError("ricetta senza nome")
+            if name in existing or name in recipes:
+                continue
+            recipes[name] = [
+                (ingredient.strip(), float(quantity), (unit or '').strip())
+                for ingredient, quantity, unit in items
+            ]
+        unit_names = {unit for items in recipes.values() for _, _, unit in items if unit}
+        self.resolve_units(unit_names)
+
+        # 2. Crea in blocco gli ingredienti mancanti
+        new_ingredients = {}
+        for items in recipes.values():
+            for ingredient, _, unit in items:
+                if ingredient not in self.ingredients and ingredient not in new_ingredients:
+                    unit_id = self.units[unit.lower()] if unit else self.default_unit
+                    new_ingredients[ingredient] = Ingredient(
+                        household=self.household, name=ingredient, unit_id=unit_id,
+                    )
+        for ingredient in Ingredient.objects.bulk_create(new_ingredients.values()):
+            self.ingredients[ingredient.name] = (ingredient.pk, ingredient.unit_id)
+
+        # 3. Ricette e dosi
+        created = Recipe.objects.bulk_create(Recipe(household=self.household, name=name) for name in recipes)
+        doses = []
+        for recipe in created:
+            quantities = {}
+            for ingredient, quantity, unit in recipes[recipe.name]:
+                ingredient_id, unit_id = self.ingredients[ingredient]
+                if unit:
+                    quantity = self.convert(quantity, self.units[unit.lower()], unit_id)
+                quantities[ingredient_id] = quantities.get(ingredient_id, 0) + quantity
+            doses.extend(
+                RecipeIngredient(recipe=recipe, ingredient_id=pk, quantity=quantity)
+                for pk, quantity in quantities.items()
+            )
+        RecipeIngredient.objects.bulk_create(doses)
+        # Totali nutrizionali e costi delle nuove ricette (possono usare ingredienti
+        # già presenti, con i loro valori e prezzi): un UPDATE ciascuno per blocco
+        recipe_ids = [recipe.pk for recipe in created]
+        nutrition.refresh_recipes(recipe_ids)
+        costs.refresh_recipes(recipe_ids)
+
+        return {'recipes': len(created), 'rows': len(doses), 'skipped': len(batch) - len(created)}
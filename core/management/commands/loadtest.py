@@ -0,0 +1,105 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/', '/shopping-list/', '/api/plan/', '/api/shopping-list/']
+
+
+def percentile(values, fraction):
+    """Percentile per rango più vicino su una lista già ordinata."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+async def fetch(host, port, path, timeout):
+    """Una richiesta GET su una connessione nuova; restituisce lo stato HTTP."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+            f'Accept: */*\r\nConnection: close\r\n\r\n'.encode('ascii')
+        )
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        # Legge il resto della risposta fino alla chiusura della connessione
+        while await asyncio.wait_for(reader.read(65536), timeout):
+            pass
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Misura throughput e latenze (p50/p95/p99) di un server già avviato "
+        "(WSGI o ASGI) con molte richieste concorrenti sulle pagine di lettura."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help="Indirizzo del server, es. http://127.0.0.1:8000")
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help=f"Percorso da richiedere (ripetibile; default: {' '.join(DEFAULT_PATHS)}).",
+        )
+        parser.add_argument('--concurrency', type=int, default=100, help="Client simultanei (default: 100).")
+        parser.add_argument('--requests', type=int, default=2000, help="Richieste totali (default: 2000).")
+        parser.add_argument('--timeout', type=float, default=30, help="Timeout per richiesta in secondi (default: 30).")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['base_url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError("Serve un indirizzo http://host:porta.")
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency e --requests devono essere positivi.")
+
+        paths = options['paths'] or DEFAULT_PATHS
+        results, elapsed = asyncio.run(self.run(
+            url.hostname, url.port or 80, paths,
+            options['concurrency'], options['requests'], options['timeout'],
+        ))
+
+        self.stdout.write(f"{'percorso':<24}{'richieste':>10}{'errori':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for path in [*paths, None]:
+            rows = [r for r in results if path is None or r[0] == path]
+            latencies = sorted(r[2] for r in rows if r[1] == 200)
+            errors = sum(1 for r in rows if r[1] != 200)
+            self.stdout.write(
+                f"{path or 'TOTALE':<24}{len(rows):>10}{errors:>8}"
+                f"{percentile(latencies, 0.50) * 1000:>10.1f}"
+                f"{percentile(latencies, 0.95) * 1000:>10.1f}"
+                f"{percentile(latencies, 0.99) * 1000:>10.1f}"
+            )
+        ok = sum(1 for r in results if r[1] == 200)
+        latencies = [r[2] for r in results if r[1] == 200]
+        self.stdout.write(self.style.SUCCESS(
+            f"{ok / elapsed:,.0f} richieste/s riuscite in {elapsed:.1f}s "
+            f"(concorrenza {options['concurrency']}, media {statistics.fmean(latencies or [0]) * 1000:.1f} ms)."
+        ))
+
+    async def run(self, host, port, paths, concurrency, total, timeout):
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(paths[i % len(paths)])
+        results = []
+
+        async def worker():
+            while True:
+                try:
+                    path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    status = await fetch(host, port, path, timeout)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    status = 0
+                results.append((path, status, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results, time.perf_counter() - started
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import synthetic
+from core.models import DEFAULT_HOUSEHOLD_SLUG, Household
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera dati sintetici (ingredienti, ricette, dosi, slot e pianificazioni) "
+        "in volumi configurabili, per misurare le prestazioni delle viste."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=500, help="Ingredienti (default: 500).")
+        parser.add_argument('--recipes', type=int, default=2000, help="Ricette (default: 2000).")
+        parser.add_argument(
+            '--packs-per-ingredient', type=int, default=2,
+            help="Confezioni per ingrediente, al più 3 (default: 2).",
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help="Ingredienti medi per ricetta (default: 8).",
+        )
+        parser.add_argument(
+            '--recipes-per-slot', type=int, default=2,
+            help="Ricette pianificate in ognuno dei 28 slot (default: 2).",
+        )
+        parser.add_argument('--prefix', default='Sintetico', help="Prefisso dei nomi (default: Sintetico).")
+        parser.add_argument('--seed', type=int, default=0, help="Seme del generatore casuale (default: 0).")
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Cancella prima piano, dispensa, ricette e ingredienti esistenti del nucleo.",
+        )
+        parser.add_argument(
+            '--household', default=DEFAULT_HOUSEHOLD_SLUG,
+            help=f"Slug del nucleo familiare (default: {DEFAULT_HOUSEHOLD_SLUG}).",
+        )
+
+    def handle(self, *args, **options):
+        counts = ('ingredients', 'packs_per_ingredient', 'recipes', 'ingredients_per_recipe', 'recipes_per_slot')
+        if any(options[name] < 0 for name in counts):
+            raise CommandError("I volumi non possono essere negativi.")
+        if options['recipes_per_slot'] and not options['recipes']:
+            raise CommandError("Servono ricette per riempire gli slot.")
+
+        household, _ = Household.objects.get_or_create(
+            slug=options['household'], defaults={'name': options['household'].capitalize()},
+        )
+
+        started = time.perf_counter()
+        if options['clear']:
+            synthetic.clear(household.pk)
+        try:
+            result = synthetic.seed(
+                household_id=household.pk,
+                ingredients=options['ingredients'],
+                recipes=options['recipes'],
+                ingredients_per_recipe=options['ingredients_per_recipe'],
+                recipes_per_slot=options['recipes_per_slot'],
+                packs_per_ingredient=options['packs_per_ingredient'],
+                prefix=options['prefix'],
+                random_seed=options['seed'],
+            )
+        except ValueError as exc:
+            raise CommandError(f"{exc} Usa un altro --prefix oppure --clear.") from exc
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Creati {result.ingredients} ingredienti, {result.packs} confezioni, {result.recipes} ricette, "
+            f"{result.recipe_ingredients} dosi e {result.meal_recipes} pianificazioni "
+            f"in {result.meal_slots} slot ({time.perf_counter() - started:.1f}s)."
+        ))
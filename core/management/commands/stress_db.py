@@ -0,0 +1,173 @@
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, OperationalError, close_old_connections, connections, transaction
+
+from core import weeks
+from core.aggregation import planned_between, shopping_list_rows
+from core.models import DEFAULT_HOUSEHOLD_SLUG, Household, MealRecipe, MealSlot, Recipe, DAY_CHOICES, MEAL_TYPE_CHOICES
+from core.routers import reading
+from core.views import build_weekly_grid
+
+
+class Command(BaseCommand):
+    help = (
+        "Prova di accesso concorrente al database: alcuni thread pianificano e "
+        "tolgono ricette mentre altri leggono griglia e lista della spesa. "
+        "Conta gli errori 'database is locked' e le latenze delle scritture. "
+        "Di default lavora su una copia temporanea del database; ogni scrittura "
+        "viene comunque annullata (rollback), quindi anche con --live il piano "
+        "resta com'era."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help="Thread che scrivono (default: 4).")
+        parser.add_argument('--readers', type=int, default=8, help="Thread che leggono (default: 8).")
+        parser.add_argument('--seconds', type=float, default=10, help="Durata della prova (default: 10).")
+        parser.add_argument(
+            '--household', default=DEFAULT_HOUSEHOLD_SLUG,
+            help=f"Slug del nucleo familiare (default: {DEFAULT_HOUSEHOLD_SLUG}).",
+        )
+        parser.add_argument(
+            '--live', action='store_true',
+            help="Usa il file del database configurato invece di una copia temporanea.",
+        )
+
+    def handle(self, *args, **options):
+        if options['writers'] < 0 or options['readers'] < 0 or options['seconds'] <= 0:
+            raise CommandError("--writers, --readers e --seconds non possono essere negativi.")
+        if options['live']:
+            self.run(options)
+            return
+        with temporary_copy() as path:
+            self.stdout.write(f"copia temporanea: {path}")
+            self.run(options)
+
+    def run(self, options):
+        try:
+            household = Household.objects.get(slug=options['household'])
+        except Household.DoesNotExist:
+            raise CommandError(f"Nucleo familiare inesistente: {options['household']}")
+        household_id = household.pk
+        recipe_ids = list(Recipe.objects.filter(household=household_id).values_list('pk', flat=True)[:50])
+        if not recipe_ids:
+            raise CommandError("Serve almeno una ricetta nel database.")
+        # Le celle (data, pasto) della settimana corrente
+        week = weeks.current_week()
+        all_cells = [
+            (weeks.cell_date(week, day), meal_type)
+            for day, _ in DAY_CHOICES for meal_type, _ in MEAL_TYPE_CHOICES
+        ]
+        already_planned = set(
+            planned_between(household_id, *weeks.week_range(week))
+            .values_list('meal_slot__date', 'meal_slot__meal_type', 'recipe_id')
+        )
+
+        stop = time.perf_counter() + options['seconds']
+        stats = Counter()
+        latencies = []
+        lock = threading.Lock()
+
+        def record(key, elapsed=None):
+            with lock:
+                stats[key] += 1
+                if elapsed is not None:
+                    latencies.append(elapsed)
+
+        def writer(number):
+            # Ogni thread pianifica una propria ricetta, scorrendo le celle
+            recipe_id = recipe_ids[number % len(recipe_ids)]
+            cells = [cell for cell in all_cells if (*cell, recipe_id) not in already_planned]
+            i = number
+            while cells and time.perf_counter() < stop:
+                date, meal_type = cells[i % len(cells)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    # Lettura seguita da scrittura nella stessa transazione (il
+                    # caso che con BEGIN DEFERRED fallisce subito), poi annullata:
+                    # slot e ricetta non restano nel database
+                    with transaction.atomic():
+                        slot, _ = MealSlot.objects.get_or_create(
+                            household_id=household_id, date=date, meal_type=meal_type,
+                        )
+                        MealRecipe.objects.create(meal_slot=slot, recipe_id=recipe_id)
+                        transaction.set_rollback(True)
+                except (IntegrityError, OperationalError) as exc:
+                    # Con più thread che ricette, due thread possono scegliere la stessa coppia
+                    record('locked' if 'locked' in str(exc) else 'write_errors')
+                else:
+                    record('writes', time.perf_counter() - started)
+
+        def reader():
+            while time.perf_counter() < stop:
+                try:
+                    with reading():
+                        build_weekly_grid(household_id, week)
+                        list(shopping_list_rows(planned_between(household_id, *weeks.week_range(week))))
+                except OperationalError as exc:
+                    record('locked' if 'locked' in str(exc) else 'read_errors')
+                else:
+                    record('reads')
+
+        def run(target, *args):
+            try:
+                target(*args)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(writer, n)) for n in range(options['writers'])]
+        threads += [threading.Thread(target=run, args=(reader,)) for _ in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        close_old_connections()
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        self.stdout.write(
+            f"scritture: {stats['writes']} ({stats['writes'] / elapsed:,.0f}/s, p95 {p95:.1f} ms)\n"
+            f"letture:   {stats['reads']} ({stats['reads'] / elapsed:,.0f}/s)\n"
+            f"altri errori: {stats['write_errors'] + stats['read_errors']}"
+        )
+        style = self.style.SUCCESS if not stats['locked'] else self.style.ERROR
+        self.stdout.write(style(f"errori 'database is locked': {stats['locked']}"))
+
+
+@contextmanager
+def temporary_copy():
+    """
+    Punta per la durata del blocco gli alias che usano il database SQLite
+    predefinito (anche 'read') a una sua copia in una cartella temporanea.
+    """
+    if connections['default'].vendor != 'sqlite':
+        raise CommandError("La copia temporanea è possibile solo con SQLite: usare --live.")
+    live = connections['default'].settings_dict['NAME']
+    aliases = [alias for alias in connections if str(connections.settings[alias]['NAME']) == str(live)]
+    connections.close_all()
+    with tempfile.TemporaryDirectory(prefix='stress_db-') as directory:
+        path = Path(directory) / Path(live).name
+        # L'API di backup copia anche le pagine ancora nel WAL
+        source, target = sqlite3.connect(live), sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        try:
+            for alias in aliases:
+                connections.settings[alias]['NAME'] = path
+            yield path
+        finally:
+            connections.close_all()
+            for alias in aliases:
+                connections.settings[alias]['NAME'] = live
@@ -0,0 +1,252 @@
+# File: core/materialized.py
+
+"""
+Manutenzione incrementale della lista della spesa materializzata
+(modello ShoppingListLine, una riga per nucleo, giorno e ingrediente).
+
+Ogni modifica al piano o alle dosi delle ricette viene tradotta in una
+variazione (delta) di quantità per (ingrediente, data), espressa nell'unità
+base e scalata sulle porzioni di ogni pianificazione, e applicata alle righe esistenti con UPDATE atomici
+(quantity = quantity + delta), così non si ricalcola mai l'intero aggregato.
+La lista di un intervallo di date è una SUM raggruppata sulle sole righe
+del nucleo nei giorni richiesti. Gli ingredienti appartengono a un solo
+nucleo, quindi (ingrediente, data) basta a individuare la riga.
+"""
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .aggregation import shopping_list_rows, with_net_quantity
+from .models import Ingredient, MealRecipe, RecipeIngredient, ShoppingListLine
+
+# Sotto questa soglia una riga è considerata esaurita (errori di arrotondamento)
+EPSILON = 1e-9
+
+# Righe aggiornate da ogni UPDATE con CASE (due parametri per riga)
+UPDATE_BATCH_SIZE = 500
+
+# Simbolo dell'unità canonica di un ingrediente
+BASE_UNIT_NAME = Coalesce('ingredient__unit__base__name', 'ingredient__unit__name')
+
+_state = threading.local()
+
+
+@contextmanager
+def suspended():
+    """
+    Sospende gli aggiornamenti incrementali nel thread corrente (lista
+    materializzata, totali e costi delle ricette, revisioni degli slot e
+    versione del piano per le scritture di MealSlot e MealRecipe).
+    Da usare per operazioni di massa seguite da un reset o da un rebuild()
+    (vedi anche week_editor.bulk_plan_changes).
+    """
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', False)
+
+
+class IngredientDetails(NamedTuple):
+    name: str
+    unit: str             # simbolo dell'unità base
+    factor: float         # fattore di conversione nell'unità base
+    household_id: int
+
+
+def materialized_shopping_list(household_id, start, end, net=False, packs=False):
+    """
+    Lista della spesa del nucleo nei giorni da `start` a `end` inclusi, dalle
+    righe precalcolate (stessa forma di shopping_list_rows): una query
+    raggruppata. Con `packs` ogni riga porta anche la tabella delle
+    confezioni dell'ingrediente (`pack_options`, vedi core/costs.py).
+    """
+    fields = {'pack_options': F('ingredient__pack_options')} if packs else {}
+    rows = (
+        ShoppingListLine.objects
+        .filter(household=household_id, date__range=(start, end))
+        .values('ingredient_id', 'name', 'unit', **fields)
+        .annotate(quantity=Sum('quantity'))
+        .filter(quantity__gt=EPSILON)
+        .order_by('name')
+    )
+    if net:
+        rows = with_net_quantity(rows, 'ingredient_id', start, end)
+    return rows
+
+
+def apply_ingredient_deltas(deltas, details=None):
+    """
+    Applica le variazioni {(ingredient_id, data): delta} alle righe materializzate.
+
+    `details` fornisce {ingredient_id: IngredientDetails} per creare le
+    righe mancanti; le righe vengono create solo per delta positivi.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if abs(delta) > EPSILON}
+    if not deltas:
+        return
+
+    lines = ShoppingListLine.objects.filter(
+        ingredient_id__in={pk for pk, _ in deltas},
+        date__in={date for _, date in deltas},
+    )
+    with transaction.atomic():
+        # Le righe esistenti si leggono in una query e si aggiornano con un
+        # solo UPDATE (quantity = quantity + CASE id WHEN ... END); quelle
+        # nuove (tipico quando si pianifica una settimana vuota) vanno
+        # nell'INSERT in blocco
+        existing = {(pk, date): line_id for line_id, pk, date in lines.values_list('pk', 'ingredient_id', 'date')}
+        updates = [(existing[key], delta) for key, delta in deltas.items() if key in existing]
+        missing = [key for key, delta in deltas.items() if key not in existing and delta > 0]
+        for i in range(0, len(updates), UPDATE_BATCH_SIZE):
+            batch = updates[i:i + UPDATE_BATCH_SIZE]
+            ShoppingListLine.objects.filter(pk__in=[line_id for line_id, _ in batch]).update(
+                quantity=F('quantity') + Case(
+                    *(When(pk=line_id, then=Value(delta)) for line_id, delta in batch),
+                    output_field=FloatField(),
+                )
+            )
+
+        if missing:
+            if details is None:
+                details = ingredient_details({pk for pk, _ in missing})
+            ShoppingListLine.objects.bulk_create(
+                ShoppingListLine(
+                    household_id=details[pk].household_id,
+                    ingredient_id=pk,
+                    date=date,
+                    name=details[pk].name,
+                    unit=details[pk].unit,
+                    quantity=deltas[(pk, date)],
+                )
+                for pk, date in missing
+            )
+
+        # Elimina le righe azzerate in un'unica istruzione
+        lines.filter(quantity__lte=EPSILON).delete()
+
+
+def apply_recipe_deltas(recipe_counts):
+    """
+    Aggiunge (conteggio positivo) o rimuove (negativo) pianificazioni di
+    ricette: {(recipe_id, data, porzioni): variazione del numero di
+    pianificazioni}, con porzioni None per quelle della ricetta
+    (MealRecipe.portions vuoto).
+    """
+    by_recipe = defaultdict(list)
+    for (recipe_id, date, portions), count in recipe_counts.items():
+        if count:
+            by_recipe[recipe_id].append((date, portions, count))
+    if not by_recipe:
+        return
+
+    rows = (
+        RecipeIngredient.objects
+        .filter(recipe_id__in=list(by_recipe))
+        .values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name', BASE_UNIT_NAME,
+            'ingredient__unit__factor', 'ingredient__household_id', 'quantity', 'recipe__servings',
+        )
+    )
+    deltas = defaultdict(float)
+    details = {}
+    for recipe_id, ingredient_id, name, unit, factor, household_id, quantity, servings in rows:
+        for date, portions, count in by_recipe[recipe_id]:
+            scale = (portions or servings) / servings
+            deltas[(ingredient_id, date)] += quantity * factor * scale * count
+        details[ingredient_id] = IngredientDetails(name, unit, factor, household_id)
+    apply_ingredient_deltas(deltas, details)
+
+
+def ingredient_details(ingredient_ids):
+    """Restituisce {ingredient_id: IngredientDetails}."""
+    return {
+        pk: IngredientDetails(*details)
+        for pk, *details in Ingredient.objects
+        .filter(pk__in=ingredient_ids)
+        .values_list('pk', 'name', Coalesce('unit__base__name', 'unit__name'), 'unit__factor', 'household_id')
+    }
+
+
+def refresh_ingredients(ingredient_ids):
+    """
+    Ricalcola da zero le righe dei soli ingredienti indicati (es. dopo un
+    cambio di nome o di unità di misura), con una query di aggregazione.
+    """
+    ingredient_ids = list(ingredient_ids)
+    rows = shopping_list_rows(ingredient_ids=ingredient_ids, by_date=True)
+    with transaction.atomic():
+        ShoppingListLine.objects.filter(ingredient_id__in=ingredient_ids).delete()
+        ShoppingListLine.objects.bulk_create(ShoppingListLine(**row) for row in rows)
+
+
+def clear(household_id=None, start=None, end=None):
+    """
+    Svuota la lista materializzata con una sola istruzione DELETE (solo
+    quella del nucleo e dei giorni da `start` a `end`, se indicati).
+    """
+    lines = ShoppingListLine.objects.all()
+    if household_id is not None:
+        lines = lines.filter(household=household_id)
+    if start is not None:
+        lines = lines.filter(date__range=(start, end))
+    lines.delete()
+
+
+def rebuild(household_id=None):
+    """
+    Ricalcola da zero la lista materializzata del nucleo (di tutti i nuclei
+    se `household_id` è None) dall'aggregazione completa.
+    """
+    meal_recipes = MealRecipe.objects.all()
+    if household_id is not None:
+        meal_recipes = meal_recipes.filter(meal_slot__household=household_id)
+    with transaction.atomic():
+        clear(household_id)
+        ShoppingListLine.objects.bulk_create(
+            ShoppingListLine(**row)
+            for row in shopping_list_rows(meal_recipes, by_date=True).iterator()
+        )
+
+
+def diff(tolerance=1e-6):
+    """
+    Confronta la lista materializzata con quella ricalcolata da zero.
+    Restituisce una lista di tuple (data, nome, unità, atteso, materializzato)
+    per le righe (ingrediente, giorno) che non coincidono.
+    """
+    expected = {
+        (row['ingredient_id'], row['date']): row
+        for row in shopping_list_rows(by_date=True)
+    }
+    actual = {
+        (row['ingredient_id'], row['date']): row
+        for row in ShoppingListLine.objects
+        .filter(quantity__gt=EPSILON)
+        .values('ingredient_id', 'date', 'name', 'unit', 'quantity')
+    }
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys(), key=lambda key: (key[1], key[0])):
+        exp = expected.get(key)
+        act = actual.get(key)
+        exp_qty = exp['quantity'] if exp else 0
+        act_qty = act['quantity'] if act else 0
+        row = exp or act
+        if (
+            abs(exp_qty - act_qty) > tolerance
+            or (exp and act and (exp['name'], exp['unit']) != (act['name'], act['unit']))
+        ):
+            mismatches.append((row['date'], row['name'], row['unit'], exp_qty, act_qty))
+    return mismatches
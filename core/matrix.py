@@ -0,0 +1,158 @@
+# File: core/matrix.py
+
+"""
+Matrice sparsa ricette x ingredienti per valutare molti piani in blocco.
+
+Ogni riga della matrice è una ricetta, ogni colonna un ingrediente e il
+valore è la dose base (RecipeIngredient.quantity) convertita nell'unità
+canonica dell'ingrediente. Un piano è un vettore
+di conteggi (quante volte ogni ricetta è pianificata): moltiplicando la
+matrice dei piani (B x R) per la matrice delle dosi (R x I) si ottengono
+in un solo prodotto le liste della spesa di tutti i B piani.
+
+Ogni nucleo familiare ha la propria matrice, costruita con una sola query
+sulle sue ricette e conservata in memoria nel processo (tenancy.PerHousehold)
+insieme al timbro RECIPES del nucleo: si ricostruisce al primo uso dopo una
+modifica al ricettario fatta da qualunque processo. Nel processo che scrive,
+i segnali in core/signals.py la scartano al commit della transazione. Il
+ricettario grande di un nucleo non pesa sugli altri.
+"""
+
+import numpy as np
+from scipy import sparse
+
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+from . import versioning
+from .models import RecipeIngredient
+from .tenancy import PerHousehold
+
+
+class RecipeIngredientMatrix:
+    """Snapshot immutabile della matrice dosi (CSR) con gli indici di riga/colonna."""
+
+    def __init__(self, rows):
+        recipe_ids = sorted({row[0] for row in rows})
+        ingredient_ids = sorted({row[1] for row in rows})
+        self.recipe_index = {pk: i for i, pk in enumerate(recipe_ids)}
+        self.ingredient_ids = np.array(ingredient_ids, dtype=np.int64)
+
+        ingredient_index = {pk: i for i, pk in enumerate(ingredient_ids)}
+        self.ingredient_details = {}
+        row_idx = np.empty(len(rows), dtype=np.int64)
+        col_idx = np.empty(len(rows), dtype=np.int64)
+        data = np.empty(len(rows), dtype=np.float64)
+        for n, (recipe_id, ingredient_id, quantity, name, unit) in enumerate(rows):
+            row_idx[n] = self.recipe_index[recipe_id]
+            col_idx[n] = ingredient_index[ingredient_id]
+            data[n] = quantity
+            self.ingredient_details[ingredient_id] = (name, unit)
+
+        self.matrix = sparse.csr_matrix(
+            (data, (row_idx, col_idx)),
+            shape=(len(recipe_ids), len(ingredient_ids)),
+        )
+        self.recipe_ids = np.array(recipe_ids, dtype=np.int64)
+        self._bitsets = None
+
+    @classmethod
+    def from_database(cls, household_id=None):
+        """Matrice delle ricette del nucleo (di tutti i nuclei se `household_id` è None)."""
+        doses = RecipeIngredient.objects.all()
+        if household_id is not None:
+            doses = doses.filter(recipe__household=household_id)
+        rows = list(
+            doses.values_list(
+                'recipe_id', 'ingredient_id',
+                F('quantity') * F('ingredient__unit__factor'),
+                'ingredient__name', Coalesce('ingredient__unit__base__name', 'ingredient__unit__name'),
+            )
+        )
+        return cls(rows)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def ingredient_bitsets(self):
+        """
+        Insieme degli ingredienti di ogni ricetta come bitset: matrice
+        R x W di uint64, con il bit j acceso se la ricetta usa la colonna j.
+        Calcolata al primo uso e conservata con lo snapshot.
+        """
+        if self._bitsets is None:
+            words = max(1, (self.shape[1] + 63) // 64)
+            bitsets = np.zeros((self.shape[0], words), dtype=np.uint64)
+            coo = self.matrix.tocoo()
+            np.bitwise_or.at(
+                bitsets,
+                (coo.row, coo.col // 64),
+                np.left_shift(np.uint64(1), (coo.col % 64).astype(np.uint64)),
+            )
+            self._bitsets = bitsets
+        return self._bitsets
+
+    def plan_matrix(self, plans):
+        """
+        Converte una lista di piani {recipe_id: conteggio} nella matrice
+        sparsa B x R. Le ricette che non compaiono nella matrice (senza
+        ingredienti o inesistenti) non contribuiscono al risultato.
+        """
+        rows, cols, data = [], [], []
+        for b, plan in enumerate(plans):
+            for recipe_id, count in plan.items():
+                col = self.recipe_index.get(recipe_id)
+                if col is None:
+                    continue
+                rows.append(b)
+                cols.append(col)
+                data.append(count)
+        return sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), (rows, cols)),
+            shape=(len(plans), self.shape[0]),
+        )
+
+    def evaluate(self, plans):
+        """
+        Restituisce una lista della spesa per ogni piano, calcolate con un
+        unico prodotto matriciale. Ogni lista ha la stessa forma di
+        core.aggregation.shopping_list_rows (dizionari ordinati per nome).
+        """
+        totals = (self.plan_matrix(plans) @ self.matrix).tocsr()
+        results = []
+        for b in range(totals.shape[0]):
+            start, end = totals.indptr[b], totals.indptr[b + 1]
+            items = []
+            for col, quantity in zip(totals.indices[start:end], totals.data[start:end]):
+                if quantity == 0:
+                    continue
+                ingredient_id = int(self.ingredient_ids[col])
+                name, unit = self.ingredient_details[ingredient_id]
+                items.append({
+                    'ingredient_id': ingredient_id,
+                    'name': name,
+                    'unit': unit,
+                    'quantity': float(quantity),
+                })
+            items.sort(key=lambda item: item['name'])
+            results.append(items)
+        return results
+
+
+_matrices = PerHousehold(RecipeIngredientMatrix.from_database, scope=versioning.RECIPES)
+
+
+def get_matrix(household_id):
+    """Restituisce la matrice corrente del nucleo, ricostruendola se è stata invalidata."""
+    return _matrices.get(household_id)
+
+
+def invalidate(household_id=None):
+    """Scarta la matrice del nucleo (di tutti se None): verrà ricostruita al prossimo uso."""
+    _matrices.discard(household_id)
+
+
+def evaluate_plans(household_id, plans):
+    """Scorciatoia: valuta una lista di piani {recipe_id: conteggio} del nucleo."""
+    return get_matrix(household_id).evaluate(plans)
@@ -0,0 +1,335 @@
+# File: core/metrics.py
+
+"""
+Metriche per richiesta: numero di query, tempo SQL, tempo di rendering dei
+template e tempo totale, raggruppati per nome della rotta (`weekly_plan`,
+`shopping_list`, ...) in istogrammi a bucket fissi.
+
+I dati della richiesta in corso stanno in una ContextVar (RequestStats),
+riempita da tre punti:
+  - MetricsMiddleware (core/middleware.py): apre e chiude la misura; per
+    le risposte in streaming la chiude il contenuto (MeasuredContent) quando
+    il server lo chiude, e le query eseguite generando i pezzi contano;
+  - `record_query`: execute_wrapper installato su ogni connessione al
+    database (anche nei thread di sync_to_async, che copiano il contesto);
+  - il backend di template `DjangoTemplates` di questo modulo.
+
+Fuori da una richiesta misurata (metriche disattivate, comandi, test) la
+ContextVar è vuota e ogni hook si riduce a un controllo. Con
+METRICS_ENABLED = False il middleware non viene caricato e gli hook sulle
+connessioni non vengono installati (lo fa CoreConfig.ready()).
+
+Gli istogrammi sono per processo: con più worker ognuno espone i propri.
+La vista /metrics risponde solo allo staff e agli indirizzi in INTERNAL_IPS.
+"""
+
+import bisect
+import heapq
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+# Bucket (limiti superiori) degli istogrammi
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Query riportate nel log di una richiesta lenta (le più lente)
+SLOW_REQUEST_QUERIES = 5
+
+METRICS = {
+    # nome: (descrizione, bucket)
+    'core_request_duration_seconds': ("Tempo totale della richiesta.", SECONDS_BUCKETS),
+    'core_request_sql_seconds': ("Tempo speso nelle query SQL.", SECONDS_BUCKETS),
+    'core_request_template_seconds': ("Tempo di rendering dei template.", SECONDS_BUCKETS),
+    'core_request_queries': ("Query SQL eseguite dalla richiesta.", QUERY_BUCKETS),
+}
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+def slow_request_seconds():
+    return getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', None)
+
+
+# ======================================================================
+# ISTOGRAMMI
+# ======================================================================
+
+class Histogram:
+    """Istogramma cumulativo alla Prometheus: conteggi per bucket, somma e totale."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # l'ultimo è +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Coppie (limite, conteggio cumulativo), con '+Inf' per ultimo."""
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """Istogrammi per (metrica, rotta); thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, view, values):
+        """Registra in un colpo solo i valori {metrica: valore} di una richiesta."""
+        with self._lock:
+            for name, value in values.items():
+                histogram = self._histograms.get((name, view))
+                if histogram is None:
+                    histogram = self._histograms[(name, view)] = Histogram(METRICS[name][1])
+                histogram.observe(value)
+
+    def get(self, name, view):
+        return self._histograms.get((name, view))
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """Testo nel formato di esposizione di Prometheus (versione 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, (description, _) in METRICS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, view), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    label = f'view="{escape_label(view)}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+# ======================================================================
+# MISURA DELLA RICHIESTA IN CORSO
+# ======================================================================
+
+class RequestStats:
+    """Contatori di una richiesta: query (sql, durata), tempo SQL e dei template."""
+
+    __slots__ = ('queries', 'sql_seconds', 'template_seconds', 'template_depth')
+
+    def __init__(self):
+        self.queries = []
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def slowest_queries(self, n=SLOW_REQUEST_QUERIES):
+        return heapq.nlargest(n, self.queries, key=lambda query: query[1])
+
+
+_current = ContextVar('core_request_stats', default=None)
+
+
+def start():
+    """Apre la misura della richiesta; restituisce il token per `stop`."""
+    return _current.set(RequestStats())
+
+
+def stop(token):
+    """Stacca la misura dal contesto corrente e restituisce i suoi RequestStats."""
+    stats = _current.get()
+    _current.reset(token)
+    return stats
+
+
+def finish(stats, request, response, wall_seconds):
+    """Aggiorna gli istogrammi con la richiesta misurata e registra quelle lente."""
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else '<unresolved>'
+    registry.observe(view, {
+        'core_request_duration_seconds': wall_seconds,
+        'core_request_sql_seconds': stats.sql_seconds,
+        'core_request_template_seconds': stats.template_seconds,
+        'core_request_queries': len(stats.queries),
+    })
+
+    threshold = slow_request_seconds()
+    if threshold is not None and wall_seconds >= threshold:
+        queries = ''.join(
+            f'\n  {seconds * 1000:8.1f} ms  {sql}' for sql, seconds in stats.slowest_queries()
+        )
+        logger.warning(
+            "Richiesta lenta %s %s (%s, stato %s): %.1f ms, %d query in %.1f ms, template %.1f ms%s",
+            request.method, request.get_full_path(), view, getattr(response, 'status_code', None),
+            wall_seconds * 1000, len(stats.queries), stats.sql_seconds * 1000,
+            stats.template_seconds * 1000, queries,
+        )
+
+
+class MeasuredContent:
+    """
+    Contenuto di una risposta in streaming che resta nella misura della sua
+    richiesta: ogni pezzo si genera con `stats` nel contesto (query e
+    template contano), e `done` si chiama una volta, a contenuto esaurito o
+    alla chiusura della risposta (anche se non è mai stato letto).
+    """
+
+    def __init__(self, stats, iterator, done):
+        self.stats = stats
+        self.iterator = iterator
+        self.done = done
+
+    def close(self):
+        done, self.done = self.done, None
+        if done is not None:
+            done()
+
+
+class MeasuredStream(MeasuredContent):
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = _current.set(self.stats)
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            self.close()
+            raise
+        finally:
+            _current.reset(token)
+
+
+class AsyncMeasuredStream(MeasuredContent):
+    """Per il contenuto asincrono (StreamingHttpResponse.is_async)."""
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        token = _current.set(self.stats)
+        try:
+            return await anext(self.iterator)
+        except StopAsyncIteration:
+            self.close()
+            raise
+        finally:
+            _current.reset(token)
+
+
+def measure_stream(stats, response, done):
+    """Sostituisce il contenuto di `response` (in streaming) con la sua versione misurata."""
+    if response.is_async:
+        content = AsyncMeasuredStream(stats, aiter(response.streaming_content), done)
+    else:
+        content = MeasuredStream(stats, iter(response.streaming_content), done)
+    response.streaming_content = content
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper: misura la query se c'è una richiesta in corso."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries.append((sql, elapsed))
+        stats.sql_seconds += elapsed
+
+
+def instrument(connection, **kwargs):
+    """Installa `record_query` sulla connessione (una volta sola)."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install():
+    """Strumenta le connessioni già aperte in questo thread e tutte le future."""
+    connection_created.connect(instrument, dispatch_uid='core.metrics.instrument')
+    for connection in connections.all(initialized_only=True):
+        instrument(connection)
+
+
+# ======================================================================
+# BACKEND DEI TEMPLATE
+# ======================================================================
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        # Conta solo il rendering più esterno (render_to_string annidati)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_seconds += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Il backend standard di Django, con i template che misurano il proprio rendering."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+# ======================================================================
+# VISTA
+# ======================================================================
+
+def can_read_metrics(request):
+    """Lo staff autenticato o un indirizzo in INTERNAL_IPS (es. il collettore Prometheus)."""
+    if request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    """Istogrammi di questo processo in formato testo Prometheus."""
+    if not enabled():
+        raise Http404("Metriche disattivate.")
+    if not can_read_metrics(request):
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,88 @@
+# File: core/middleware.py
+
+"""
+Middleware del progetto. MetricsMiddleware misura ogni richiesta (vedi
+core/metrics.py) e va messo per primo in MIDDLEWARE, così il tempo totale
+comprende anche gli altri middleware. HouseholdMiddleware sceglie il nucleo
+familiare della richiesta (core/tenancy.py) e va dopo SessionMiddleware.
+"""
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, tenancy
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        # Metriche disattivate: Django scarta il middleware, costo zero
+        if not metrics.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.start()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self.finish(token, request, response, started)
+
+    async def __acall__(self, request):
+        token = metrics.start()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self.finish(token, request, response, started)
+
+    @staticmethod
+    def finish(token, request, response, started):
+        """
+        Chiude la misura. Per le risposte in streaming il corpo si genera
+        dopo: la misura si chiude quando il server chiude il contenuto.
+        """
+        stats = metrics.stop(token)
+
+        def done():
+            metrics.finish(stats, request, response, time.perf_counter() - started)
+
+        if response is not None and response.streaming:
+            metrics.measure_stream(stats, response, done)
+        else:
+            done()
+
+
+class HouseholdMiddleware:
+    """Imposta request.household_id, il nucleo su cui lavorano tutte le viste."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.household_id = tenancy.household_from_session(request.session)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.household_id = await tenancy.ahousehold_from_session(request.session)
+        return await self.get_response(request)
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import Lower, Trim
+
+
+def populate_shopping_list(apps, schema_editor):
+    """Materializza la lista della spesa per il piano già esistente."""
+    MealRecipe = apps.get_model('core', 'MealRecipe')
+    ShoppingListLine = apps.get_model('core', 'ShoppingListLine')
+
+    rows = (
+        MealRecipe.objects
+        .filter(recipe__ingredients_list__isnull=False)
+        .values(
+            ingredient_id=F('recipe__ingredients_list__ingredient'),
+            name=F('recipe__ingredients_list__ingredient__name'),
+            unit=Lower(Trim('recipe__ingredients_list__ingredient__unit')),
+        )
+        .annotate(quantity=Sum('recipe__ingredients_list__quantity'))
+    )
+    ShoppingListLine.objects.bulk_create(ShoppingListLine(**row) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_mealslot_mealrecipe_delete_weeklyplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=100, verbose_name='Nome Ingrediente')),
+                ('unit', models.CharField(max_length=50, verbose_name='Unità di Misura')),
+                ('quantity', models.FloatField(default=0, verbose_name='Quantità Totale')),
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_line', to='core.ingredient', verbose_name='Ingrediente')),
+            ],
+            options={
+                'verbose_name': 'Riga Lista della Spesa',
+                'verbose_name_plural': 'Righe Lista della Spesa',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RunPython(populate_shopping_list, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Unità canoniche e sinonimi noti: simbolo -> (unità base, fattore)
+STANDARD_UNITS = {
+    'g': (None, 1), 'ml': (None, 1), 'pz': (None, 1),
+    # Massa
+    'mg': ('g', 0.001), 'hg': ('g', 100), 'kg': ('g', 1000),
+    'gr': ('g', 1), 'grammo': ('g', 1), 'grammi': ('g', 1),
+    'etto': ('g', 100), 'etti': ('g', 100),
+    'chilo': ('g', 1000), 'chili': ('g', 1000), 'chilogrammi': ('g', 1000),
+    # Volume
+    'cl': ('ml', 10), 'dl': ('ml', 100), 'l': ('ml', 1000),
+    'millilitri': ('ml', 1), 'litro': ('ml', 1000), 'litri': ('ml', 1000),
+    # Pezzi
+    'pezzo': ('pz', 1), 'pezzi': ('pz', 1), 'unità': ('pz', 1),
+}
+
+
+def convert_units(apps, schema_editor):
+    """Crea le unità standard e collega ogni ingrediente alla sua unità."""
+    Unit = apps.get_model('core', 'Unit')
+    Ingredient = apps.get_model('core', 'Ingredient')
+    ShoppingListLine = apps.get_model('core', 'ShoppingListLine')
+
+    units = {}
+    for name, (base, factor) in sorted(STANDARD_UNITS.items(), key=lambda item: item[1][0] is not None):
+        units[name] = Unit.objects.create(name=name, base=units.get(base), factor=factor)
+
+    for ingredient in Ingredient.objects.all():
+        name = ingredient.unit_name.lower().strip()
+        if name not in units:
+            # Unità sconosciuta: diventa una nuova unità canonica
+            units[name] = Unit.objects.create(name=name)
+        ingredient.unit = units[name]
+        ingredient.save(update_fields=['unit'])
+
+    # Le quantità materializzate passano alle unità base
+    for line in ShoppingListLine.objects.select_related('ingredient__unit__base'):
+        unit = line.ingredient.unit
+        line.quantity *= unit.factor
+        line.unit = (unit.base or unit).name
+        line.save(update_fields=['quantity', 'unit'])
+
+
+def restore_unit_names(apps, schema_editor):
+    Ingredient = apps.get_model('core', 'Ingredient')
+    ShoppingListLine = apps.get_model('core', 'ShoppingListLine')
+
+    for ingredient in Ingredient.objects.select_related('unit'):
+        ingredient.unit_name = ingredient.unit.name
+        ingredient.save(update_fields=['unit_name'])
+
+    for line in ShoppingListLine.objects.select_related('ingredient__unit'):
+        unit = line.ingredient.unit
+        line.quantity /= unit.factor
+        line.unit = unit.name
+        line.save(update_fields=['quantity', 'unit'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_shoppinglistline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Unit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Simbolo')),
+                ('factor', models.FloatField(default=1, verbose_name='Fattore di Conversione')),
+                ('base', models.ForeignKey(blank=True, help_text="Vuoto se questa è un'unità canonica.", null=True, on_delete=django.db.models.deletion.PROTECT, related_name='derived_units', to='core.unit', verbose_name='Unità Base')),
+            ],
+            options={
+                'verbose_name': 'Unità di Misura',
+                'verbose_name_plural': 'Unità di Misura',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RenameField(
+            model_name='ingredient',
+            old_name='unit',
+            new_name='unit_name',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='unit_name',
+            field=models.CharField(max_length=50, null=True, verbose_name='Unità di Misura (es: g, ml, pezzi)'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='unit',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ingredients', to='core.unit', verbose_name='Unità di Misura (es: g, ml, pezzi)'),
+        ),
+        migrations.RunPython(convert_units, restore_unit_names),
+        migrations.RemoveField(
+            model_name='ingredient',
+            name='unit_name',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='unit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ingredients', to='core.unit', verbose_name='Unità di Misura (es: g, ml, pezzi)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealslot',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Revisione'),
+        ),
+    ]
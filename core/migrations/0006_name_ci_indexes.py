@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:39
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_mealslot_revision'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='core_ingredient_name_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='core_recipe_name_ci_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:10
+
+from django.db import migrations
+
+from core.migrations import _search_schema as search_schema
+
+# Indice full-text (SQLite FTS5) su nome ricetta e nomi degli ingredienti,
+# versione 1 dello schema in core/migrations/_search_schema.py.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_name_ci_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_schema.create(1), search_schema.drop),
+    ]
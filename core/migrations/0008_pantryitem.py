@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PantryItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.FloatField(verbose_name='Quantità')),
+                ('expiry', models.DateField(blank=True, null=True, verbose_name='Scadenza')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pantry_items', to='core.ingredient', verbose_name='Ingrediente')),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pantry_items', to='core.unit', verbose_name='Unità di Misura')),
+            ],
+            options={
+                'verbose_name': 'Scorta in Dispensa',
+                'verbose_name_plural': 'Dispensa',
+                'ordering': ['ingredient__name', 'expiry'],
+            },
+        ),
+    ]
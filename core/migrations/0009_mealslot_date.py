@@ -0,0 +1,148 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:12
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+DAY_CODES = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN']
+
+
+def current_monday():
+    today = datetime.date.today()
+    return today - datetime.timedelta(days=today.weekday())
+
+
+def assign_dates(apps, schema_editor):
+    """Gli slot della vecchia settimana unica diventano quelli della settimana corrente."""
+    MealSlot = apps.get_model('core', 'MealSlot')
+    monday = current_monday()
+    for slot in MealSlot.objects.all():
+        slot.date = monday + datetime.timedelta(days=DAY_CODES.index(slot.day))
+        slot.save(update_fields=['date'])
+
+
+def assign_days(apps, schema_editor):
+    """
+    All'indietro resta una sola settimana: per ogni (giorno, pasto) si tiene
+    lo slot con la data più recente e si eliminano gli altri.
+    """
+    MealSlot = apps.get_model('core', 'MealSlot')
+    kept = set()
+    for slot in MealSlot.objects.order_by('-date'):
+        day = DAY_CODES[slot.date.weekday()]
+        if (day, slot.meal_type) in kept:
+            slot.delete()
+            continue
+        kept.add((day, slot.meal_type))
+        slot.day = day
+        slot.save(update_fields=['day'])
+
+
+def line_rows(apps, by_date):
+    """Righe della lista della spesa aggregate (per ingrediente o per ingrediente e giorno)."""
+    MealRecipe = apps.get_model('core', 'MealRecipe')
+    groups = {
+        'ingredient_id': F('recipe__ingredients_list__ingredient'),
+        'name': F('recipe__ingredients_list__ingredient__name'),
+        'unit': Coalesce(
+            'recipe__ingredients_list__ingredient__unit__base__name',
+            'recipe__ingredients_list__ingredient__unit__name',
+        ),
+    }
+    if by_date:
+        groups['date'] = F('meal_slot__date')
+    return (
+        MealRecipe.objects
+        .filter(recipe__ingredients_list__isnull=False)
+        .values(**groups)
+        .annotate(quantity=Sum(
+            F('recipe__ingredients_list__quantity')
+            * F('recipe__ingredients_list__ingredient__unit__factor')
+        ))
+        .order_by()
+    )
+
+
+def delete_lines(apps, schema_editor):
+    apps.get_model('core', 'ShoppingListLine').objects.all().delete()
+
+
+def rebuild_daily_lines(apps, schema_editor):
+    ShoppingListLine = apps.get_model('core', 'ShoppingListLine')
+    ShoppingListLine.objects.bulk_create(ShoppingListLine(**row) for row in line_rows(apps, by_date=True))
+
+
+def rebuild_total_lines(apps, schema_editor):
+    ShoppingListLine = apps.get_model('core', 'ShoppingListLine')
+    ShoppingListLine.objects.bulk_create(ShoppingListLine(**row) for row in line_rows(apps, by_date=False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_pantryitem'),
+    ]
+
+    operations = [
+        # La lista materializzata viene ricalcolata per ingrediente e giorno alla fine
+        migrations.RunPython(delete_lines, rebuild_total_lines),
+
+        # --- Slot legati a una data invece che al solo giorno della settimana ---
+        migrations.AddField(
+            model_name='mealslot',
+            name='date',
+            field=models.DateField(null=True, verbose_name='Data'),
+        ),
+        migrations.AlterField(
+            model_name='mealslot',
+            name='day',
+            field=models.CharField(choices=[('MON', 'Lunedì'), ('TUE', 'Martedì'), ('WED', 'Mercoledì'), ('THU', 'Giovedì'), ('FRI', 'Venerdì'), ('SAT', 'Sabato'), ('SUN', 'Domenica')], max_length=3, null=True, verbose_name='Giorno'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mealslot',
+            unique_together=set(),
+        ),
+        migrations.RunPython(assign_dates, assign_days),
+        migrations.RemoveField(
+            model_name='mealslot',
+            name='day',
+        ),
+        migrations.AlterField(
+            model_name='mealslot',
+            name='date',
+            field=models.DateField(verbose_name='Data'),
+        ),
+        migrations.AlterModelOptions(
+            name='mealslot',
+            options={'ordering': ['date', 'meal_type'], 'verbose_name': 'Slot Pasto', 'verbose_name_plural': 'Slot Pasti'},
+        ),
+        migrations.AddConstraint(
+            model_name='mealslot',
+            constraint=models.UniqueConstraint(fields=('date', 'meal_type'), name='core_mealslot_date_meal_type_uniq'),
+        ),
+
+        # --- Lista materializzata per ingrediente e giorno ---
+        migrations.AlterField(
+            model_name='shoppinglistline',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_lines', to='core.ingredient', verbose_name='Ingrediente'),
+        ),
+        migrations.AddField(
+            model_name='shoppinglistline',
+            name='date',
+            field=models.DateField(default=datetime.date(2000, 1, 1), verbose_name='Data'),
+            preserve_default=False,
+        ),
+        migrations.AlterModelOptions(
+            name='shoppinglistline',
+            options={'ordering': ['date', 'name'], 'verbose_name': 'Riga Lista della Spesa', 'verbose_name_plural': 'Righe Lista della Spesa'},
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistline',
+            constraint=models.UniqueConstraint(fields=('date', 'ingredient'), name='core_shoppinglistline_date_ingredient_uniq'),
+        ),
+        migrations.RunPython(rebuild_daily_lines, delete_lines),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:20
+
+import core.models
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+from core.migrations import _search_schema as search_schema
+
+# Su SQLite le modifiche a core_recipe e core_ingredient ricreano le tabelle:
+# i trigger dell'indice full-text (versione 1, migrazione 0007) che le citano
+# vanno tolti prima e ricreati dopo, in entrambe le direzioni.
+
+
+def create_default_household(apps, schema_editor):
+    """Tutti i dati esistenti passano al nucleo predefinito."""
+    Household = apps.get_model('core', 'Household')
+    Household.objects.get_or_create(slug=core.models.DEFAULT_HOUSEHOLD_SLUG, defaults={'name': 'Casa'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_mealslot_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Household',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nome')),
+                ('slug', models.SlugField(unique=True, verbose_name='Identificativo')),
+            ],
+            options={
+                'verbose_name': 'Nucleo Familiare',
+                'verbose_name_plural': 'Nuclei Familiari',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RunPython(create_default_household, migrations.RunPython.noop),
+        migrations.RunPython(search_schema.drop_triggers, search_schema.recreate_triggers(1)),
+        migrations.RemoveConstraint(
+            model_name='mealslot',
+            name='core_mealslot_date_meal_type_uniq',
+        ),
+        migrations.RemoveConstraint(
+            model_name='shoppinglistline',
+            name='core_shoppinglistline_date_ingredient_uniq',
+        ),
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='core_ingredient_name_ci_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='core_recipe_name_ci_idx',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Nome Ingrediente'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='name',
+            field=models.CharField(max_length=200, verbose_name='Nome Ricetta'),
+        ),
+        migrations.AddField(
+            model_name='household',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='households', to=settings.AUTH_USER_MODEL, verbose_name='Membri'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='household',
+            field=models.ForeignKey(default=core.models.default_household, on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='core.household', verbose_name='Nucleo Familiare'),
+        ),
+        migrations.AddField(
+            model_name='mealslot',
+            name='household',
+            field=models.ForeignKey(default=core.models.default_household, on_delete=django.db.models.deletion.CASCADE, related_name='meal_slots', to='core.household', verbose_name='Nucleo Familiare'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='household',
+            field=models.ForeignKey(default=core.models.default_household, on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to='core.household', verbose_name='Nucleo Familiare'),
+        ),
+        migrations.AddField(
+            model_name='shoppinglistline',
+            name='household',
+            field=models.ForeignKey(default=core.models.default_household, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_lines', to='core.household', verbose_name='Nucleo Familiare'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(models.F('household'), django.db.models.functions.text.Lower('name'), name='core_ingredient_hh_name_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(models.F('household'), django.db.models.functions.text.Lower('name'), name='core_recipe_hh_name_ci_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('household', 'name'), name='core_ingredient_household_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='mealslot',
+            constraint=models.UniqueConstraint(fields=('household', 'date', 'meal_type'), name='core_mealslot_household_date_meal_type_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipe',
+            constraint=models.UniqueConstraint(fields=('household', 'name'), name='core_recipe_household_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistline',
+            constraint=models.UniqueConstraint(fields=('household', 'date', 'ingredient'), name='core_shoppinglistline_household_date_ingredient_uniq'),
+        ),
+        migrations.RunPython(search_schema.recreate_triggers(1), search_schema.drop_triggers),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:32
+
+import django.core.validators
+from django.db import migrations, models
+
+from core.migrations import _search_schema as search_schema
+
+# Su SQLite il nuovo campo e il vincolo ricreano core_recipe: come in 0010,
+# i trigger dell'indice full-text si tolgono prima e si ricreano dopo.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_household'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_schema.drop_triggers, search_schema.recreate_triggers(1)),
+        migrations.AddField(
+            model_name='mealrecipe',
+            name='portions',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Porzioni'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=4, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Porzioni'),
+        ),
+        migrations.AddConstraint(
+            model_name='mealrecipe',
+            constraint=models.CheckConstraint(condition=models.Q(('portions__isnull', True), ('portions__gte', 1), _connector='OR'), name='core_mealrecipe_portions_positive'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipe',
+            constraint=models.CheckConstraint(condition=models.Q(('servings__gte', 1)), name='core_recipe_servings_positive'),
+        ),
+        migrations.RunPython(search_schema.recreate_triggers(1), search_schema.drop_triggers),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:36
+
+import django.core.validators
+from django.db import migrations, models
+
+from core.migrations import _search_schema as search_schema
+
+# Su SQLite i nuovi campi ricreano core_ingredient e core_recipe: come in
+# 0010, i trigger dell'indice full-text si tolgono prima e si ricreano dopo.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_servings'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_schema.drop_triggers, search_schema.recreate_triggers(1)),
+        migrations.AddField(
+            model_name='ingredient',
+            name='carbs',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Carboidrati (g)'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='fat',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Grassi (g)'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='fiber',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Fibre (g)'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='kcal',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Energia (kcal)'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='nutrition_basis',
+            field=models.FloatField(default=100, help_text='Quantità in unità base (es. 100 per 100 g, 1 per un pezzo).', verbose_name='Valori nutrizionali riferiti a'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='protein',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Proteine (g)'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carbs',
+            field=models.FloatField(default=0, editable=False, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Carboidrati (g)'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fat',
+            field=models.FloatField(default=0, editable=False, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Grassi (g)'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fiber',
+            field=models.FloatField(default=0, editable=False, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Fibre (g)'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='kcal',
+            field=models.FloatField(default=0, editable=False, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Energia (kcal)'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='protein',
+            field=models.FloatField(default=0, editable=False, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Proteine (g)'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.CheckConstraint(condition=models.Q(('nutrition_basis__gt', 0)), name='core_ingredient_nutrition_basis_positive'),
+        ),
+        migrations.RunPython(search_schema.recreate_triggers(1), search_schema.drop_triggers),
+    ]
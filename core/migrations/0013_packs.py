@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.migrations import _search_schema as search_schema
+
+# Su SQLite il costo con default ricrea core_recipe: come in 0010, i trigger
+# dell'indice full-text si tolgono prima e si ricreano dopo.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_nutrition'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_schema.drop_triggers, search_schema.recreate_triggers(1)),
+        migrations.AddField(
+            model_name='ingredient',
+            name='pack_options',
+            field=models.JSONField(editable=False, null=True, verbose_name='Opzioni di acquisto'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='unit_price',
+            field=models.FloatField(editable=False, null=True, verbose_name='Prezzo per unità base'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='cost',
+            field=models.FloatField(default=0, editable=False, verbose_name='Costo stimato'),
+        ),
+        migrations.CreateModel(
+            name='Pack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.FloatField(verbose_name='Quantità per Confezione')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Prezzo (€)')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='packs', to='core.ingredient', verbose_name='Ingrediente')),
+            ],
+            options={
+                'verbose_name': 'Confezione',
+                'verbose_name_plural': 'Confezioni',
+                'ordering': ['ingredient', 'quantity'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('quantity__gt', 0)), name='core_pack_quantity_positive'), models.CheckConstraint(condition=models.Q(('price__gte', 0)), name='core_pack_price_not_negative')],
+            },
+        ),
+        migrations.RunPython(search_schema.recreate_triggers(1), search_schema.drop_triggers),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_packs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pantryitem',
+            name='needed_on',
+            field=models.DateField(blank=True, null=True, verbose_name='Comprato per il giorno'),
+        ),
+    ]
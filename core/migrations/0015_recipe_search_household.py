@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:40
+
+from django.db import migrations
+
+from core.migrations import _search_schema as search_schema
+
+# L'indice full-text porta anche il nucleo della ricetta, come token 'h<id>'
+# nella colonna household: la ricerca filtra il nucleo dentro la query MATCH
+# (intersezione delle liste di documenti) invece di unire dopo le
+# corrispondenze di tutti i nuclei. Una colonna UNINDEXED costringerebbe a
+# leggere la riga di contenuto di ogni corrispondenza. Tabella e trigger
+# passano alla versione 2 di core/migrations/_search_schema.py, che le
+# migrazioni successive devono usare se ricreano core_recipe.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_pantryitem_needed_on'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_schema.rebuild(2), search_schema.rebuild(1)),
+    ]
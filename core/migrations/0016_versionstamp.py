@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recipe_search_household'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionStamp',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=20, verbose_name='Ambito')),
+                ('stamp', models.BigIntegerField(verbose_name='Timbro')),
+                ('household', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='version_stamps', to='core.household', verbose_name='Nucleo Familiare')),
+            ],
+            options={
+                'verbose_name': 'Timbro di Versione',
+                'verbose_name_plural': 'Timbri di Versione',
+                'constraints': [models.UniqueConstraint(fields=('household', 'scope'), name='core_versionstamp_household_scope_uniq')],
+            },
+        ),
+    ]
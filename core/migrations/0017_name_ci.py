@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:10
+
+import core.models
+from django.db import migrations, models
+
+from core.migrations import _search_schema as search_schema
+
+# L'autocompletamento confronta il prefisso con una colonna scritta da
+# Python (core.models.fold_name) invece che con LOWER(name) di SQLite, che
+# non converte le lettere accentate. Su SQLite i nuovi campi ricreano
+# core_ingredient e core_recipe: i trigger dell'indice full-text (versione 2,
+# migrazione 0015) si tolgono prima e si ricreano dopo.
+
+
+def fill_name_ci(apps, schema_editor):
+    for model_name in ('Ingredient', 'Recipe'):
+        model = apps.get_model('core', model_name)
+        rows = list(model.objects.only('name'))
+        for row in rows:
+            row.name_ci = core.models.fold_name(row.name)
+        model.objects.bulk_update(rows, ['name_ci'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_versionstamp'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_schema.drop_triggers, search_schema.recreate_triggers(2)),
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='core_ingredient_hh_name_ci_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='core_recipe_hh_name_ci_idx',
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='name_ci',
+            field=core.models.FoldedNameField(default='', editable=False, max_length=200, verbose_name='Nome per la ricerca'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='name_ci',
+            field=core.models.FoldedNameField(default='', editable=False, max_length=400, verbose_name='Nome per la ricerca'),
+        ),
+        migrations.RunPython(fill_name_ci, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['household', 'name_ci'], name='core_ingredient_hh_name_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['household', 'name_ci'], name='core_recipe_hh_name_ci_idx'),
+        ),
+        migrations.RunPython(search_schema.recreate_triggers(2), search_schema.drop_triggers),
+    ]
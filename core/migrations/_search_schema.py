@@ -0,0 +1,161 @@
+# File: core/migrations/_search_schema.py
+
+"""
+SQL dell'indice full-text delle ricette (tabella virtuale SQLite FTS5
+core_recipe_search, rowid = id della ricetta), per versione dello schema:
+
+  1: migrazione 0007, colonne name e ingredients;
+  2: migrazione 0015, più il nucleo della ricetta come token 'h<id>' nella
+     colonna household (la ricerca filtra il nucleo dentro la query MATCH,
+     vedi core/search.py).
+
+I trigger tengono allineato l'indice a ogni scrittura, comprese quelle in
+blocco (bulk_create) che non inviano segnali Django. Su SQLite le
+migrazioni che ricreano core_recipe o core_ingredient li perdono: li
+tolgono prima e li ricreano dopo con `recreate_triggers(versione)`, la
+versione in vigore in quel punto della storia delle migrazioni.
+
+Il nome inizia con '_': il caricatore delle migrazioni non lo considera una
+migrazione.
+"""
+
+TABLE = 'core_recipe_search'
+
+INGREDIENT_NAMES = """
+    (SELECT coalesce(group_concat(i.name, ' '), '')
+     FROM core_recipeingredient ri JOIN core_ingredient i ON i.id = ri.ingredient_id
+     WHERE ri.recipe_id = {recipe_id})
+"""
+
+COLUMNS = {
+    1: "name, ingredients",
+    2: "name, ingredients, household",
+}
+
+POPULATE = {
+    1: f"""
+    INSERT INTO core_recipe_search (rowid, name, ingredients)
+    SELECT r.id, r.name, {INGREDIENT_NAMES.format(recipe_id='r.id')} FROM core_recipe r
+    """,
+    2: f"""
+    INSERT INTO core_recipe_search (rowid, name, ingredients, household)
+    SELECT r.id, r.name, {INGREDIENT_NAMES.format(recipe_id='r.id')}, 'h' || r.household_id FROM core_recipe r
+    """,
+}
+
+# Inserimento e rinomina delle ricette: cambiano con le colonne
+RECIPE_TRIGGERS = {
+    1: [
+        """
+        CREATE TRIGGER core_recipe_search_ai AFTER INSERT ON core_recipe BEGIN
+            INSERT INTO core_recipe_search (rowid, name, ingredients) VALUES (new.id, new.name, '');
+        END
+        """,
+        """
+        CREATE TRIGGER core_recipe_search_au AFTER UPDATE OF name ON core_recipe BEGIN
+            UPDATE core_recipe_search SET name = new.name WHERE rowid = new.id;
+        END
+        """,
+    ],
+    2: [
+        """
+        CREATE TRIGGER core_recipe_search_ai AFTER INSERT ON core_recipe BEGIN
+            INSERT INTO core_recipe_search (rowid, name, ingredients, household)
+            VALUES (new.id, new.name, '', 'h' || new.household_id);
+        END
+        """,
+        """
+        CREATE TRIGGER core_recipe_search_au AFTER UPDATE OF name, household_id ON core_recipe BEGIN
+            UPDATE core_recipe_search SET name = new.name, household = 'h' || new.household_id WHERE rowid = new.id;
+        END
+        """,
+    ],
+}
+
+# Cancellazione delle ricette, dosi e nomi degli ingredienti: uguali in ogni versione
+COMMON_TRIGGERS = [
+    """
+    CREATE TRIGGER core_recipe_search_ad AFTER DELETE ON core_recipe BEGIN
+        DELETE FROM core_recipe_search WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER core_recipe_search_ri_ai AFTER INSERT ON core_recipeingredient BEGIN
+        UPDATE core_recipe_search SET ingredients = {INGREDIENT_NAMES.format(recipe_id='new.recipe_id')}
+        WHERE rowid = new.recipe_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER core_recipe_search_ri_au AFTER UPDATE OF recipe_id, ingredient_id ON core_recipeingredient BEGIN
+        UPDATE core_recipe_search SET ingredients = {INGREDIENT_NAMES.format(recipe_id='old.recipe_id')}
+        WHERE rowid = old.recipe_id;
+        UPDATE core_recipe_search SET ingredients = {INGREDIENT_NAMES.format(recipe_id='new.recipe_id')}
+        WHERE rowid = new.recipe_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER core_recipe_search_ri_ad AFTER DELETE ON core_recipeingredient BEGIN
+        UPDATE core_recipe_search SET ingredients = {INGREDIENT_NAMES.format(recipe_id='old.recipe_id')}
+        WHERE rowid = old.recipe_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER core_recipe_search_ingredient_au AFTER UPDATE OF name ON core_ingredient BEGIN
+        UPDATE core_recipe_search SET ingredients = {INGREDIENT_NAMES.format(recipe_id='core_recipe_search.rowid')}
+        WHERE rowid IN (SELECT recipe_id FROM core_recipeingredient WHERE ingredient_id = new.id);
+    END
+    """,
+]
+
+DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS core_recipe_search_ingredient_au',
+    'DROP TRIGGER IF EXISTS core_recipe_search_ri_ad',
+    'DROP TRIGGER IF EXISTS core_recipe_search_ri_au',
+    'DROP TRIGGER IF EXISTS core_recipe_search_ri_ai',
+    'DROP TRIGGER IF EXISTS core_recipe_search_ad',
+    'DROP TRIGGER IF EXISTS core_recipe_search_au',
+    'DROP TRIGGER IF EXISTS core_recipe_search_ai',
+]
+
+DROP_SQL = DROP_TRIGGERS + [f'DROP TABLE IF EXISTS {TABLE}']
+
+
+def triggers(version):
+    return RECIPE_TRIGGERS[version] + COMMON_TRIGGERS
+
+
+def create_sql(version):
+    """Tabella, contenuto iniziale e trigger della versione indicata."""
+    table = f"""
+    CREATE VIRTUAL TABLE {TABLE} USING fts5(
+        {COLUMNS[version]}, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """
+    return [table, POPULATE[version]] + triggers(version)
+
+
+def run_on_sqlite(statements):
+    """FTS5 esiste solo su SQLite: sugli altri database la ricerca usa l'ORM."""
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+def create(version):
+    return run_on_sqlite(create_sql(version))
+
+
+def rebuild(version):
+    """Ricrea da capo tabella, contenuto e trigger nella versione indicata."""
+    return run_on_sqlite(DROP_SQL + create_sql(version))
+
+
+drop = run_on_sqlite(DROP_SQL)
+drop_triggers = run_on_sqlite(DROP_TRIGGERS)
+
+
+def recreate_triggers(version):
+    return run_on_sqlite(DROP_TRIGGERS + triggers(version))
@@ -1,4 +1,8 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Q
 
 # Definizione delle Choices (utilizzate in MealSlot)
 DAY_CHOICES = [
@@ -9,17 +13,255 @@ MEAL_TYPE_CHOICES = [
     ('LUN', 'Pranzo'), ('DIN', 'Cena'), ('BRK', 'Colazione'), ('SNK', 'Snack'),
 ]
 
+# Nucleo familiare predefinito (creato dalla migrazione 0010): è quello delle
+# richieste anonime e dei comandi che non ne indicano uno
+DEFAULT_HOUSEHOLD_SLUG = 'casa'
+
+# Porzioni per cui sono scritte le dosi di una ricetta, se non indicato
+DEFAULT_SERVINGS = 4
+
+# Valori nutrizionali: campo -> etichetta (stessi campi su Ingredient e Recipe)
+NUTRIENTS = [
+    ('kcal', 'Energia (kcal)'),
+    ('protein', 'Proteine (g)'),
+    ('fat', 'Grassi (g)'),
+    ('carbs', 'Carboidrati (g)'),
+    ('fiber', 'Fibre (g)'),
+]
+NUTRIENT_FIELDS = [name for name, _ in NUTRIENTS]
+
+# Quantità (in unità base) a cui si riferiscono i valori di un ingrediente, se non indicata
+DEFAULT_NUTRITION_BASIS = 100
+
+# 00. Modello Nucleo Familiare (il "tenant": ricettario e piano sono per nucleo)
+class Household(models.Model):
+    """
+    Un nucleo familiare. Ingredienti, ricette, slot del piano e lista della
+    spesa appartengono a un nucleo; le unità di misura sono condivise.
+    Il nucleo di ogni richiesta è scelto da core/tenancy.py.
+    """
+    name = models.CharField(max_length=100, verbose_name="Nome")
+    slug = models.SlugField(max_length=50, unique=True, verbose_name="Identificativo")
+    members = models.ManyToManyField(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        related_name='households',
+        verbose_name="Membri",
+    )
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "Nucleo Familiare"
+        verbose_name_plural = "Nuclei Familiari"
+
+    def __str__(self):
+        return self.name
+
+
+_default_household_id = None
+
+
+def default_household():
+    """
+    Id del nucleo predefinito (valore di default delle chiavi `household`),
+    letto una volta per processo.
+    """
+    global _default_household_id
+    if _default_household_id is None:
+        household, _ = Household.objects.get_or_create(
+            slug=DEFAULT_HOUSEHOLD_SLUG, defaults={'name': 'Casa'},
+        )
+        _default_household_id = household.pk
+    return _default_household_id
+
+
+def household_field(related_name):
+    """Chiave esterna verso il nucleo proprietario (di default il nucleo predefinito)."""
+    return models.ForeignKey(
+        Household,
+        on_delete=models.CASCADE,
+        default=default_household,
+        related_name=related_name,
+        verbose_name="Nucleo Familiare",
+    )
+
+
+def fold_name(name):
+    """
+    Chiave di confronto di un nome senza maiuscole né spazi ripetuti.
+    Calcolata in Python e non con LOWER() di SQLite, che converte solo le
+    lettere ASCII ('Èrba' resterebbe 'Èrba').
+    """
+    return ' '.join(name.split()).casefold()
+
+
+class FoldedNameField(models.CharField):
+    """
+    Copia di `name` passata per fold_name, riscritta a ogni salvataggio (anche
+    con bulk_create, che chiama pre_save dei campi): serve l'autocompletamento.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = fold_name(model_instance.name)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def nutrient_field(label, editable=True):
+    """Un valore nutrizionale (mai negativo, 0 se non indicato)."""
+    return models.FloatField(
+        default=0, validators=[MinValueValidator(0)], editable=editable, verbose_name=label,
+    )
+
+
+# 0. Modello Unità di Misura (con fattore di conversione verso l'unità base)
+class Unit(models.Model):
+    """
+    Unità di misura. Le unità canoniche (es. g, ml, pz) non hanno `base`;
+    le altre (es. kg, grammi, l) puntano alla loro unità canonica con il
+    fattore di conversione precalcolato: quantità_base = quantità * factor.
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name="Simbolo")
+    base = models.ForeignKey(
+        'self',
+        null=True, blank=True,
+        on_delete=models.PROTECT,
+        related_name='derived_units',
+        verbose_name="Unità Base",
+        help_text="Vuoto se questa è un'unità canonica.",
+    )
+    factor = models.FloatField(default=1, verbose_name="Fattore di Conversione")
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "Unità di Misura"
+        verbose_name_plural = "Unità di Misura"
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        # Normalizzato prima del controllo di unicità (full_clean lo esegue dopo clean)
+        if self.name:
+            self.name = self.name.lower().strip()
+        # Una sola "catena" di conversione: la base deve essere canonica
+        if self.base_id and (self.base.base_id or self.base_id == self.pk):
+            raise ValidationError({'base': "L'unità base deve essere un'unità canonica."})
+        if self.factor <= 0:
+            raise ValidationError({'factor': "Il fattore deve essere positivo."})
+
+    def save(self, *args, **kwargs):
+        # Anche per le scritture che non passano da full_clean
+        self.name = self.name.lower().strip()
+        if self.base_id is None:
+            self.factor = 1
+        super().save(*args, **kwargs)
+
+    @property
+    def base_unit(self):
+        return self.base or self
+
+
 # 1. Modello Ingrediente (Cosa compriamo?)
 class Ingredient(models.Model):
-    name = models.CharField(max_length=100, unique=True, verbose_name="Nome Ingrediente")
-    unit = models.CharField(max_length=50, verbose_name="Unità di Misura (es: g, ml, pezzi)")
+    household = household_field('ingredients')
+    name = models.CharField(max_length=100, verbose_name="Nome Ingrediente")
+    # casefold può allungare il nome (es. 'ß' -> 'ss')
+    name_ci = FoldedNameField(max_length=200, default='', verbose_name="Nome per la ricerca")
+    unit = models.ForeignKey(
+        Unit,
+        on_delete=models.PROTECT,
+        related_name='ingredients',
+        verbose_name="Unità di Misura (es: g, ml, pezzi)"
+    )
+    # Valori nutrizionali per `nutrition_basis` unità base (es. per 100 g o per 1 pezzo)
+    nutrition_basis = models.FloatField(
+        default=DEFAULT_NUTRITION_BASIS,
+        verbose_name="Valori nutrizionali riferiti a",
+        help_text="Quantità in unità base (es. 100 per 100 g, 1 per un pezzo).",
+    )
+    kcal = nutrient_field(NUTRIENTS[0][1])
+    protein = nutrient_field(NUTRIENTS[1][1])
+    fat = nutrient_field(NUTRIENTS[2][1])
+    carbs = nutrient_field(NUTRIENTS[3][1])
+    fiber = nutrient_field(NUTRIENTS[4][1])
+    # Precalcolati da core/costs.py quando cambiano le confezioni (None senza confezioni):
+    # tabella delle combinazioni più economiche e prezzo per unità base della più conveniente
+    pack_options = models.JSONField(null=True, editable=False, verbose_name="Opzioni di acquisto")
+    unit_price = models.FloatField(null=True, editable=False, verbose_name="Prezzo per unità base")
+
+    class Meta:
+        constraints = [
+            # Nomi unici per nucleo (due nuclei possono avere lo stesso ingrediente)
+            models.UniqueConstraint(fields=['household', 'name'], name='core_ingredient_household_name_uniq'),
+            # Divisore nel calcolo dei totali delle ricette (core/nutrition.py)
+            models.CheckConstraint(condition=Q(nutrition_basis__gt=0), name='core_ingredient_nutrition_basis_positive'),
+        ]
+        indexes = [
+            # Ricerca per prefisso senza distinzione maiuscole/minuscole (autocompletamento)
+            # dentro il nucleo: l'intervallo resta nelle righe del nucleo
+            models.Index(fields=['household', 'name_ci'], name='core_ingredient_hh_name_ci_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.unit})"
 
+# 1b. Modello Confezione (Come lo compriamo?)
+class Pack(models.Model):
+    """
+    Confezione acquistabile di un ingrediente (es. pasta da 500 g a 0,89 €).
+    La quantità è nell'unità dell'ingrediente, come le dosi delle ricette.
+    """
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='packs', verbose_name="Ingrediente")
+    quantity = models.FloatField(verbose_name="Quantità per Confezione")
+    price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Prezzo (€)")
+
+    class Meta:
+        ordering = ['ingredient', 'quantity']
+        verbose_name = "Confezione"
+        verbose_name_plural = "Confezioni"
+        constraints = [
+            models.CheckConstraint(condition=Q(quantity__gt=0), name='core_pack_quantity_positive'),
+            models.CheckConstraint(condition=Q(price__gte=0), name='core_pack_price_not_negative'),
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient.name}: {self.quantity:g} {self.ingredient.unit} a {self.price} €"
+
 # 2. Modello Ricetta (Nome del piatto)
 class Recipe(models.Model):
-    name = models.CharField(max_length=200, unique=True, verbose_name="Nome Ricetta")
+    household = household_field('recipes')
+    name = models.CharField(max_length=200, verbose_name="Nome Ricetta")
+    name_ci = FoldedNameField(max_length=400, default='', verbose_name="Nome per la ricerca")
+    # Le dosi (RecipeIngredient.quantity) sono per questo numero di porzioni
+    servings = models.PositiveSmallIntegerField(
+        default=DEFAULT_SERVINGS, validators=[MinValueValidator(1)], verbose_name="Porzioni",
+    )
+    # Totali nutrizionali dell'intera ricetta (tutte le porzioni), precalcolati
+    # da core/nutrition.py quando cambiano le sue dosi o i suoi ingredienti
+    kcal = nutrient_field(NUTRIENTS[0][1], editable=False)
+    protein = nutrient_field(NUTRIENTS[1][1], editable=False)
+    fat = nutrient_field(NUTRIENTS[2][1], editable=False)
+    carbs = nutrient_field(NUTRIENTS[3][1], editable=False)
+    fiber = nutrient_field(NUTRIENTS[4][1], editable=False)
+    # Costo stimato dell'intera ricetta (dosi x prezzo per unità base), precalcolato
+    # da core/costs.py; gli ingredienti senza confezioni non contano
+    cost = models.FloatField(default=0, editable=False, verbose_name="Costo stimato")
+
+    class Meta:
+        constraints = [
+            # L'indice (household, name) serve anche la paginazione per nome del ricettario
+            models.UniqueConstraint(fields=['household', 'name'], name='core_recipe_household_name_uniq'),
+            # Divisore del fattore di scala nell'aggregazione (vedi aggregation.portion_scale)
+            models.CheckConstraint(condition=Q(servings__gte=1), name='core_recipe_servings_positive'),
+        ]
+        indexes = [
+            models.Index(fields=['household', 'name_ci'], name='core_recipe_hh_name_ci_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -37,33 +279,61 @@ class RecipeIngredient(models.Model):
     def __str__(self):
         return f"{self.recipe.name}: {self.quantity} {self.ingredient.unit} di {self.ingredient.name}"
 
+    def clean(self):
+        # Ricetta e ingrediente devono appartenere allo stesso nucleo familiare
+        # (la ricetta può essere ancora da salvare, es. nell'admin in aggiunta)
+        has_recipe = self.recipe_id is not None or RecipeIngredient.recipe.is_cached(self)
+        if has_recipe and self.ingredient_id and self.recipe.household_id != self.ingredient.household_id:
+            raise ValidationError({'ingredient': "L'ingrediente appartiene a un altro nucleo familiare."})
+
 # --------------------------------------------------------
 # 4. NUOVI MODELLI PER PIANIFICAZIONE MULTI-RICETTA
 # --------------------------------------------------------
 
 class MealSlot(models.Model):
     """
-    Rappresenta un singolo slot pasto nella griglia settimanale (es. Lunedì - Cena).
-    È il CONTENITORE per una o più ricette.
+    Rappresenta un singolo slot pasto del calendario (es. la Cena di lunedì 12/10).
+    È il CONTENITORE per una o più ricette. La griglia mostra una settimana
+    ISO alla volta (vedi core/weeks.py): le settimane passate restano come storico.
     """
-    day = models.CharField(max_length=3, choices=DAY_CHOICES, verbose_name="Giorno")
+    household = household_field('meal_slots')
+    date = models.DateField(verbose_name="Data")
     meal_type = models.CharField(max_length=3, choices=MEAL_TYPE_CHOICES, verbose_name="Tipo Pasto")
+    # Incrementata a ogni modifica delle ricette dello slot: invalida la
+    # cella corrispondente nella cache dei frammenti della griglia
+    revision = models.PositiveIntegerField(default=0, editable=False, verbose_name="Revisione")
 
     class Meta:
-        # Garantisce che ci sia un solo slot pasto per giorno/tipo (es. una sola "Lunedì - Cena")
-        unique_together = ('day', 'meal_type')
-        ordering = ['day', 'meal_type']
+        constraints = [
+            # Un solo slot pasto per nucleo e data/tipo (es. una sola "Cena" il 12/10).
+            # L'indice composto (household, date, meal_type) serve anche le
+            # letture per intervallo di date del nucleo: griglia, lista della spesa
+            models.UniqueConstraint(
+                fields=['household', 'date', 'meal_type'], name='core_mealslot_household_date_meal_type_uniq',
+            ),
+        ]
+        ordering = ['date', 'meal_type']
         verbose_name = "Slot Pasto"
         verbose_name_plural = "Slot Pasti"
 
     def __str__(self):
-        return f"{self.get_day_display()} - {self.get_meal_type_display()}"
+        return f"{self.get_day_display()} {self.date:%d/%m/%Y} - {self.get_meal_type_display()}"
+
+    @property
+    def day(self):
+        """Codice del giorno della settimana (MON, TUE, ...)."""
+        return DAY_CHOICES[self.date.weekday()][0]
+
+    def get_day_display(self):
+        return DAY_CHOICES[self.date.weekday()][1]
 
 
 class MealRecipe(models.Model):
     """
     Collega una specifica ricetta a un MealSlot.
     Questo permette l'associazione di molte ricette a un unico slot (uno slot a molte ricette).
+    Il nucleo è quello dello slot: le letture filtrano sullo slot (indice
+    household, date, meal_type) e arrivano qui con l'indice su meal_slot.
     """
     # Lo slot a cui è assegnata questa ricetta
     meal_slot = models.ForeignKey(
@@ -79,15 +349,134 @@ class MealRecipe(models.Model):
         verbose_name="Ricetta Scelta"
     )
     
+    # Porzioni da preparare in questo pasto (vuoto: quelle della ricetta)
+    portions = models.PositiveSmallIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1)], verbose_name="Porzioni",
+    )
+    
     # Campo opzionale per ordinare (es. 1=Primo, 2=Secondo, 3=Dolce)
     # order = models.PositiveSmallIntegerField(default=0, verbose_name="Ordine nel Pasto")
 
     class Meta:
         # Aggiunge un vincolo: una ricetta non può essere aggiunta due volte allo stesso slot
         unique_together = ('meal_slot', 'recipe')
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(portions__isnull=True) | Q(portions__gte=1), name='core_mealrecipe_portions_positive',
+            ),
+        ]
         ordering = ['meal_slot', 'id']
         verbose_name = "Ricetta nel Pasto"
         verbose_name_plural = "Ricette nel Pasto"
 
     def __str__(self):
-        return f"{self.recipe.name} in {self.meal_slot}"
\ No newline at end of file
+        return f"{self.recipe.name} in {self.meal_slot}"
+
+
+# --------------------------------------------------------
+# 5. LISTA DELLA SPESA MATERIALIZZATA
+# --------------------------------------------------------
+
+class ShoppingListLine(models.Model):
+    """
+    Riga precalcolata della lista della spesa: quanto serve di un ingrediente
+    per i pasti di un giorno. Viene aggiornata in modo incrementale dai
+    segnali in core/signals.py, così la lista di un intervallo di date è una
+    sola SUM raggruppata sulle righe del nucleo nell'intervallo (indice
+    household, date). Nucleo, nome e unità sono copiati dall'ingrediente per
+    evitare il JOIN in lettura.
+    """
+    household = household_field('shopping_lines')
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_lines',
+        verbose_name="Ingrediente"
+    )
+    date = models.DateField(verbose_name="Data")
+    name = models.CharField(max_length=100, db_index=True, verbose_name="Nome Ingrediente")
+    unit = models.CharField(max_length=50, verbose_name="Unità di Misura")
+    quantity = models.FloatField(default=0, verbose_name="Quantità Totale")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['household', 'date', 'ingredient'], name='core_shoppinglistline_household_date_ingredient_uniq',
+            ),
+        ]
+        ordering = ['date', 'name']
+        verbose_name = "Riga Lista della Spesa"
+        verbose_name_plural = "Righe Lista della Spesa"
+
+    def __str__(self):
+        return f"{self.quantity} {self.unit} di {self.name} ({self.date:%d/%m/%Y})"
+
+
+class PantryItem(models.Model):
+    """
+    Scorta in dispensa di un ingrediente (un lotto, con scadenza opzionale).
+    Il nucleo è quello dell'ingrediente.
+    Le quantità non scadute, convertite nell'unità base, vengono sottratte
+    dalla lista della spesa (vedi core/aggregation.py, pantry_stock): un
+    lotto comprato per un giorno del piano (`needed_on`) copre solo quel
+    giorno, gli altri vengono consumati dal piano in ordine di data a
+    partire da oggi.
+    """
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='pantry_items',
+        verbose_name="Ingrediente"
+    )
+    quantity = models.FloatField(verbose_name="Quantità")
+    unit = models.ForeignKey(
+        Unit,
+        on_delete=models.PROTECT,
+        related_name='pantry_items',
+        verbose_name="Unità di Misura"
+    )
+    expiry = models.DateField(null=True, blank=True, verbose_name="Scadenza")
+    needed_on = models.DateField(null=True, blank=True, verbose_name="Comprato per il giorno")
+
+    class Meta:
+        ordering = ['ingredient__name', 'expiry']
+        verbose_name = "Scorta in Dispensa"
+        verbose_name_plural = "Dispensa"
+
+    def __str__(self):
+        return f"{self.quantity} {self.unit} di {self.ingredient.name}"
+
+    def clean(self):
+        # La scorta deve essere convertibile nell'unità base dell'ingrediente
+        if self.unit_id and self.ingredient_id:
+            if self.unit.base_unit.pk != self.ingredient.unit.base_unit.pk:
+                raise ValidationError({'unit': "Unità non convertibile in quella dell'ingrediente."})
+        if self.quantity is not None and self.quantity < 0:
+            raise ValidationError({'quantity': "La quantità non può essere negativa."})
+
+
+class VersionStamp(models.Model):
+    """
+    Timbro di versione di un ambito di un nucleo (vedi core/versioning.py).
+    La cache ne tiene una copia per le letture; qui il timbro non viene mai
+    scartato, quindi ETag e Last-Modified non ripartono da capo quando la
+    cache espelle la sua copia.
+    """
+    household = models.ForeignKey(
+        Household,
+        on_delete=models.CASCADE,
+        related_name='version_stamps',
+        verbose_name="Nucleo Familiare"
+    )
+    scope = models.CharField(max_length=20, verbose_name="Ambito")
+    stamp = models.BigIntegerField(verbose_name="Timbro")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['household', 'scope'], name='core_versionstamp_household_scope_uniq'),
+        ]
+        verbose_name = "Timbro di Versione"
+        verbose_name_plural = "Timbri di Versione"
+
+    def __str__(self):
+        return f"{self.household_id}:{self.scope} = {self.stamp}"
@@ -0,0 +1,148 @@
+# File: core/nutrition.py
+
+"""
+Valori nutrizionali delle ricette e riepiloghi del piano settimanale.
+
+Ogni ingrediente ha i suoi valori (NUTRIENTS) per `nutrition_basis` unità
+base; ogni ricetta conserva nei propri campi il vettore dei totali
+dell'intera ricetta:
+
+    totale = somma su RecipeIngredient di
+             quantity x fattore dell'unità x valore / nutrition_basis
+
+I totali si ricalcolano solo per le ricette toccate (segnali in
+core/signals.py: dosi della ricetta, valori o unità di un suo ingrediente),
+con un solo UPDATE il cui valore è calcolato nel database da subquery
+correlate. Le importazioni e i dati sintetici, che non inviano segnali,
+chiamano `rebuild`.
+
+I riepiloghi della griglia (`summarize`) usano solo i vettori già caricati
+con le ricette della griglia: una passata sulle celle, nessuna query e
+nessun accesso alle dosi.
+"""
+
+from typing import NamedTuple
+
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import NUTRIENT_FIELDS, Recipe, RecipeIngredient
+
+
+class Nutrients(NamedTuple):
+    """Vettore dei valori nutrizionali, nello stesso ordine di NUTRIENTS."""
+    kcal: float = 0.0
+    protein: float = 0.0
+    fat: float = 0.0
+    carbs: float = 0.0
+    fiber: float = 0.0
+
+    def __add__(self, other):
+        return Nutrients(*(a + b for a, b in zip(self, other)))
+
+    def scaled(self, factor):
+        return Nutrients(*(value * factor for value in self))
+
+
+ZERO = Nutrients()
+
+
+def of(recipe):
+    """Vettore dei totali precalcolati della ricetta."""
+    return Nutrients(*(getattr(recipe, name) for name in NUTRIENT_FIELDS))
+
+
+def per_portion(recipe):
+    """Valori di una porzione della ricetta."""
+    return of(recipe).scaled(1 / recipe.servings)
+
+
+# ----------------------------------------------------------------------
+# Totali delle ricette
+# ----------------------------------------------------------------------
+
+def recipe_total(name):
+    """Subquery: totale del valore `name` della ricetta esterna (0 senza dosi)."""
+    total = (
+        RecipeIngredient.objects
+        .filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(total=Sum(
+            F('quantity') * F('ingredient__unit__factor') * F(f'ingredient__{name}')
+            / F('ingredient__nutrition_basis'),
+            output_field=FloatField(),
+        ))
+        .values('total')
+    )
+    return Coalesce(Subquery(total), Value(0.0))
+
+
+def refresh_recipes(recipe_ids):
+    """
+    Ricalcola i totali delle ricette indicate (id o queryset di id) con un
+    solo UPDATE.
+    """
+    return Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{name: recipe_total(name) for name in NUTRIENT_FIELDS}
+    )
+
+
+def refresh_ingredient(ingredient_id):
+    """Ricalcola le ricette che usano l'ingrediente (valori o unità cambiati)."""
+    return refresh_recipes(
+        RecipeIngredient.objects.filter(ingredient=ingredient_id).values('recipe_id')
+    )
+
+
+def rebuild(household_id=None):
+    """Ricalcola le ricette del nucleo (di tutti i nuclei se `household_id` è None)."""
+    recipes = Recipe.objects.all()
+    if household_id is not None:
+        recipes = recipes.filter(household=household_id)
+    return refresh_recipes(recipes.values('pk'))
+
+
+def diff(household_id=None):
+    """Ricette i cui totali salvati non corrispondono al ricalcolo (lista vuota se coerenti)."""
+    recipes = Recipe.objects.all()
+    if household_id is not None:
+        recipes = recipes.filter(household=household_id)
+    rows = recipes.annotate(
+        **{f'expected_{name}': recipe_total(name) for name in NUTRIENT_FIELDS}
+    ).values_list('name', *NUTRIENT_FIELDS, *(f'expected_{name}' for name in NUTRIENT_FIELDS))
+    width = len(NUTRIENT_FIELDS)
+    return [
+        row[0] for row in rows
+        if any(abs(stored - expected) > 1e-6 for stored, expected in zip(row[1:width + 1], row[width + 1:]))
+    ]
+
+
+# ----------------------------------------------------------------------
+# Riepiloghi del piano
+# ----------------------------------------------------------------------
+
+class WeekNutrition(NamedTuple):
+    """Riepilogo di una settimana: valori per giorno, totale e media giornaliera."""
+    days: list
+    total: Nutrients
+    daily_average: Nutrients
+
+
+def summarize(meal_grid):
+    """
+    Valori di una porzione di ogni ricetta pianificata, sommati per giorno e
+    per settimana, dalla griglia di views.build_weekly_grid. Aggiunge a ogni
+    giorno la chiave 'nutrition' e restituisce il WeekNutrition.
+    """
+    days = []
+    total = ZERO
+    for day in meal_grid:
+        day_total = ZERO
+        for cell in day['cells']:
+            for recipe in cell['recipes']:
+                day_total += per_portion(recipe)
+        day['nutrition'] = day_total
+        days.append(day_total)
+        total += day_total
+    return WeekNutrition(days=days, total=total, daily_average=total.scaled(1 / max(len(days), 1)))
@@ -0,0 +1,61 @@
+# File: core/pantry.py
+
+"""
+Operazioni in blocco sulla dispensa (PantryItem).
+"""
+
+from django.db import transaction
+from django.db.models import F, OuterRef
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import versioning
+from .aggregation import free_stock, lots_total, pantry_lots
+from .materialized import EPSILON
+from .models import PantryItem, ShoppingListLine
+
+
+def mark_shopping_list_bought(household_id, start, end, expiry=None):
+    """
+    Segna come comprata la lista della spesa netta del nucleo nei giorni da
+    `start` a `end`. La lettura è per ingrediente e giorno: ogni giorno usa
+    prima i lotti già comprati per lui, poi la scorta libera rimasta, in
+    ordine di data; quanto manca diventa un lotto in dispensa (nell'unità
+    base) legato a quel giorno (`needed_on`), così copre solo il suo
+    fabbisogno e non viene sottratto di nuovo dagli intervalli successivi.
+    I giorni già passati non si comprano più: l'intervallo parte da oggi se
+    `start` è prima, e la scorta libera è quella rimasta da quel giorno.
+    Un solo INSERT in blocco, in un'unica transazione.
+    Restituisce i lotti creati.
+    """
+    start = max(start, timezone.localdate())
+    if start > end:
+        return []
+    with transaction.atomic():
+        rows = (
+            ShoppingListLine.objects
+            .filter(household=household_id, date__range=(start, end), quantity__gt=EPSILON)
+            .annotate(
+                bought=lots_total(pantry_lots('ingredient_id').filter(needed_on=OuterRef('date'))),
+                free=free_stock('ingredient_id', start),
+                base_unit_id=Coalesce(F('ingredient__unit__base_id'), F('ingredient__unit_id')),
+            )
+            .order_by('ingredient_id', 'date')
+            .values_list('ingredient_id', 'date', 'quantity', 'bought', 'free', 'base_unit_id')
+        )
+        items = []
+        available = {}
+        for ingredient_id, date, quantity, bought, free, unit_id in rows:
+            left = available.setdefault(ingredient_id, free)
+            missing = max(quantity - bought, 0.0)
+            taken = min(missing, left)
+            available[ingredient_id] = left - taken
+            if missing - taken > EPSILON:
+                items.append(PantryItem(
+                    ingredient_id=ingredient_id, quantity=missing - taken, unit_id=unit_id,
+                    expiry=expiry, needed_on=date,
+                ))
+        items = PantryItem.objects.bulk_create(items)
+        # bulk_create non invia segnali
+        versioning.bump_on_commit(household_id, versioning.PANTRY)
+    return items
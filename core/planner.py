@@ -0,0 +1,253 @@
+# File: core/planner.py
+
+"""
+Generatore automatico del piano settimanale.
+
+Riempie le celle vuote di una settimana (giorno x pasto) con ricette del
+ricettario, cercando il piano che minimizza:
+  - OBJECTIVE_INGREDIENTS: il numero di ingredienti distinti da comprare
+  - OBJECTIVE_QUANTITY:    la quantità totale (nelle unità base)
+con il vincolo che una ricetta non si ripeta entro `no_repeat_days` giorni.
+
+Gli ingredienti di ogni ricetta sono bitset (RecipeIngredientMatrix.
+ingredient_bitsets): gli ingredienti nuovi che una ricetta aggiunge al
+piano sono popcount(ricetta & ~piano), calcolato con numpy per tutto il
+ricettario in un colpo solo.
+
+La ricerca è una beam search cella per cella: a ogni passo si tengono solo
+i `beam_width` piani parziali migliori. Se il tempo a disposizione finisce,
+le celle rimanenti vengono completate in modo goloso (ampiezza 1), quindi
+il risultato arriva sempre entro il budget più un passo goloso per cella.
+Le ricette già pianificate nella settimana restano e contano sia per gli
+ingredienti sia per il vincolo di ripetizione, che guarda anche agli
+ultimi giorni della settimana precedente.
+"""
+
+import datetime
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from django.db import transaction
+
+from . import week_editor, weeks
+from .matrix import get_matrix
+from .models import MealRecipe, MealSlot, DAY_CHOICES, MEAL_TYPE_CHOICES
+
+OBJECTIVE_INGREDIENTS = 'ingredients'
+OBJECTIVE_QUANTITY = 'quantity'
+OBJECTIVES = (OBJECTIVE_INGREDIENTS, OBJECTIVE_QUANTITY)
+
+DEFAULT_NO_REPEAT_DAYS = 3
+DEFAULT_BEAM_WIDTH = 8
+DEFAULT_TIME_BUDGET = 0.5  # secondi
+
+@dataclass
+class State:
+    """Piano parziale della beam search."""
+    mask: np.ndarray                            # bitset degli ingredienti già necessari
+    quantity: float                             # quantità totale (unità base)
+    chosen: tuple                               # riga scelta per ogni cella (None se vuota)
+    score: tuple                                # valore dell'obiettivo (più basso = meglio)
+
+
+@dataclass
+class PlanResult:
+    """Esito della generazione: assegnazioni {(day, meal_type): recipe_id} e statistiche."""
+    assignments: dict
+    unfilled: list
+    distinct_ingredients: int
+    total_quantity: float
+    elapsed: float
+    timed_out: bool
+
+
+def empty_cells(household_id, week):
+    """
+    Celle (day, meal_type) della settimana del lunedì `week` del nucleo senza
+    slot o con uno slot senza ricette, in ordine di griglia.
+    """
+    filled = {
+        (weeks.day_code(date), meal_type)
+        for date, meal_type in MealSlot.objects
+        .filter(household=household_id, date__range=weeks.week_range(week), recipes__isnull=False)
+        .values_list('date', 'meal_type').distinct()
+    }
+    return [
+        (day, meal_type)
+        for day, _ in DAY_CHOICES for meal_type, _ in MEAL_TYPE_CHOICES
+        if (day, meal_type) not in filled
+    ]
+
+
+def planned_recipes(household_id, week, lookback_days=0):
+    """
+    Coppie (recipe_id, giorno) delle ricette pianificate dal nucleo nella
+    settimana del lunedì `week` e nei `lookback_days` giorni precedenti; il
+    giorno è la distanza dal lunedì (negativa per la settimana prima).
+    """
+    start, end = weeks.week_range(week)
+    rows = MealRecipe.objects.filter(
+        meal_slot__household=household_id,
+        meal_slot__date__range=(start - datetime.timedelta(days=lookback_days), end),
+    ).values_list('recipe_id', 'meal_slot__date')
+    return [(recipe_id, (date - week).days) for recipe_id, date in rows]
+
+
+class PlanGenerator:
+
+    def __init__(self, matrix, objective=OBJECTIVE_INGREDIENTS,
+                 no_repeat_days=DEFAULT_NO_REPEAT_DAYS, beam_width=DEFAULT_BEAM_WIDTH,
+                 time_budget=DEFAULT_TIME_BUDGET):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Obiettivo sconosciuto: {objective}")
+        self.matrix = matrix
+        self.objective = objective
+        self.no_repeat_days = max(0, no_repeat_days)
+        self.beam_width = max(1, beam_width)
+        self.time_budget = time_budget
+
+        self.bits = self.matrix.ingredient_bitsets()
+        self.totals = np.asarray(self.matrix.matrix.sum(axis=1)).ravel()
+
+    # ------------------------------------------------------------------
+
+    def blocked_rows(self, day, fixed, chosen_days):
+        """Righe (ricette) vietate nella cella del giorno `day` dal vincolo di ripetizione."""
+        if not self.no_repeat_days:
+            return []
+        return [
+            row for row, other_day in (*fixed, *chosen_days)
+            if abs(other_day - day) < self.no_repeat_days
+        ]
+
+    def candidates(self, state, blocked):
+        """
+        Valuta tutte le ricette rispetto al piano parziale e restituisce le
+        `beam_width` migliori (indici di riga, dalla migliore).
+        """
+        if not len(self.totals):
+            return []
+        new = np.bitwise_count(self.bits & ~state.mask).sum(axis=1, dtype=np.int64)
+        if self.objective == OBJECTIVE_INGREDIENTS:
+            # Quantità come criterio secondario, scalata sotto l'unità
+            cost = new + self.totals / (self.totals.max() + 1.0)
+        else:
+            cost = self.totals + new * 1e-9
+        if blocked:
+            cost[blocked] = np.inf
+
+        k = min(self.beam_width, len(cost))
+        best = np.argpartition(cost, k - 1)[:k]
+        return [int(row) for row in best[np.argsort(cost[best])] if np.isfinite(cost[row])]
+
+    def score(self, mask, quantity):
+        distinct = int(np.bitwise_count(mask).sum())
+        if self.objective == OBJECTIVE_INGREDIENTS:
+            return (distinct, quantity)
+        return (quantity, distinct)
+
+    def extend(self, state, row):
+        mask = state.mask | self.bits[row]
+        quantity = state.quantity + float(self.totals[row])
+        return State(mask=mask, quantity=quantity, chosen=state.chosen + (row,), score=self.score(mask, quantity))
+
+    def generate(self, cells, planned=()):
+        """
+        Sceglie una ricetta per ogni cella di `cells` [(day, meal_type)],
+        tenendo conto delle ricette già pianificate `planned` [(recipe_id,
+        giorno)], con il giorno contato dal lunedì (0-6, negativo prima).
+        """
+        started = time.perf_counter()
+        index = self.matrix.recipe_index
+        fixed = [(index[pk], day) for pk, day in planned if pk in index]
+
+        mask = np.zeros(self.bits.shape[1], dtype=np.uint64)
+        quantity = 0.0
+        for row, day in fixed:
+            if day < 0:
+                # Settimana precedente: conta solo per il vincolo di ripetizione
+                continue
+            mask |= self.bits[row]
+            quantity += float(self.totals[row])
+        root = State(mask=mask, quantity=quantity, chosen=(), score=self.score(mask, quantity))
+
+        beam, timed_out, skipped = [root], False, []
+        days = [weeks.DAY_OFFSETS[day] for day, _ in cells]
+        for position, day in enumerate(days):
+            if not timed_out and time.perf_counter() - started > self.time_budget:
+                timed_out = True
+                beam = beam[:1]
+            children = []
+            for state in beam:
+                chosen_days = [
+                    (row, days[i]) for i, row in enumerate(state.chosen) if row is not None
+                ]
+                blocked = self.blocked_rows(day, fixed, chosen_days)
+                options = self.candidates(state, blocked)
+                if timed_out:
+                    options = options[:1]
+                children.extend(self.extend(state, row) for row in options)
+
+            if not children:
+                # Nessuna ricetta ammessa: la cella resta vuota
+                skipped.append(cells[position])
+                beam = [
+                    State(mask=s.mask, quantity=s.quantity, chosen=s.chosen + (None,), score=s.score)
+                    for s in beam
+                ]
+                continue
+
+            children.sort(key=lambda s: s.score)
+            beam, seen = [], set()
+            for child in children:
+                key = frozenset(child.chosen)
+                if key in seen:
+                    continue
+                seen.add(key)
+                beam.append(child)
+                if len(beam) == (1 if timed_out else self.beam_width):
+                    break
+
+        best = beam[0]
+        recipe_ids = self.matrix.recipe_ids
+        assignments = {
+            cell: int(recipe_ids[row])
+            for cell, row in zip(cells, best.chosen) if row is not None
+        }
+        return PlanResult(
+            assignments=assignments,
+            unfilled=skipped,
+            distinct_ingredients=int(np.bitwise_count(best.mask).sum()),
+            total_quantity=best.quantity,
+            elapsed=time.perf_counter() - started,
+            timed_out=timed_out,
+        )
+
+
+def generate_plan(household_id, week, **options):
+    """
+    Calcola (senza salvarlo) il riempimento delle celle vuote della settimana
+    del lunedì `week` del nucleo, con le sole ricette del nucleo.
+    """
+    generator = PlanGenerator(get_matrix(household_id), **options)
+    return generator.generate(
+        empty_cells(household_id, week), planned_recipes(household_id, week, generator.no_repeat_days),
+    )
+
+
+def apply_plan(household_id, result, week):
+    """
+    Aggiunge le assegnazioni del risultato alla settimana del lunedì `week`
+    del nucleo, con il percorso in blocco di core/week_editor.py: un INSERT
+    per gli slot mancanti, uno per le pianificazioni e un solo
+    aggiornamento di lista materializzata, revisioni e versione.
+    """
+    with transaction.atomic():
+        current = week_editor.current_assignments(household_id, week)
+        desired = {
+            cell: current.get(cell, {}).keys() | {recipe_id}
+            for cell, recipe_id in result.assignments.items()
+        }
+        week_editor.apply_changes(household_id, week, current, week_editor.diff(current, desired))
@@ -0,0 +1,76 @@
+# File: core/routers.py
+
+"""
+Instradamento delle letture sulla connessione in sola lettura.
+
+Le viste di consultazione (griglia, lista della spesa, API di lettura) sono
+decorate con `read_only`: finché sono in esecuzione, il router manda le
+loro query all'alias 'read' (stesso file SQLite, connessione separata con
+PRAGMA query_only). Tutto il resto, e ogni scrittura, resta su 'default'.
+
+Lo stato è una ContextVar, quindi vale sia per le viste sincrone sia per
+quelle asincrone (sync_to_async copia il contesto nel thread dell'ORM) e
+non si mescola tra richieste concorrenti.
+
+Dentro una transazione su 'default' le letture restano su 'default', per
+vedere le scritture non ancora confermate (e nei TestCase, dove ogni test
+gira in una transazione).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'read'
+
+_read_only = ContextVar('core_read_only', default=False)
+
+
+@contextmanager
+def reading():
+    """Le query eseguite nel blocco vanno sulla connessione di lettura."""
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
+
+
+def read_only(view):
+    """Decoratore per viste (sincrone o asincrone) che non scrivono mai."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            with reading():
+                return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with reading():
+                return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReadOnlyRouter:
+
+    def db_for_read(self, model, **hints):
+        if not _read_only.get() or READ_ALIAS not in settings.DATABASES:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Le due connessioni puntano allo stesso database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,125 @@
+# File: core/search.py
+
+"""
+Ricerca full-text delle ricette di un nucleo familiare (per nome e per
+ingrediente) con paginazione a chiave (keyset / "seek").
+
+Su SQLite la ricerca usa la tabella virtuale FTS5 core_recipe_search
+(migrazioni 0007 e 0015), tenuta allineata da trigger su ricette, dosi e
+ingredienti. Sugli altri database si ripiega su un filtro icontains.
+
+La paginazione non usa OFFSET: ogni pagina riparte dall'ultima chiave
+vista (`name > ultimo nome`, oppure `(punteggio, nome) > ultimo` per
+l'ordine di pertinenza), quindi la centesima pagina costa quanto la prima.
+L'ordine per nome usa l'indice (household, name) del vincolo di unicità.
+
+L'indice FTS5 è unico per tutti i nuclei, ma ogni riga porta il nucleo
+della ricetta come token 'h<id>' (colonna household): il filtro sul nucleo
+fa parte della query MATCH, senza unire le corrispondenze degli altri nuclei.
+"""
+
+import re
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+PAGE_SIZE = 50
+
+FTS_TABLE = 'core_recipe_search'
+
+# Pesi bm25 delle colonne (name, ingredients, household): il nome conta più
+# degli ingredienti, il token del nucleo non conta
+NAME_WEIGHT = 10.0
+INGREDIENTS_WEIGHT = 1.0
+HOUSEHOLD_WEIGHT = 0.0
+
+ORDER_NAME = 'name'
+ORDER_RANK = 'rank'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+@dataclass
+class Page:
+    """Una pagina di risultati e la chiave da cui parte la successiva (None se è l'ultima)."""
+    recipes: list
+    next_after: str = None
+    next_score: float = None
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def fts_query(text):
+    """
+    Converte il testo digitato in una query FTS5 sicura: ogni parola diventa
+    un prefisso tra virgolette ("pom"*), tutte obbligatorie. Restituisce ''
+    se non ci sono parole.
+    """
+    return ' AND '.join(f'"{token}"*' for token in TOKEN_RE.findall(text or ''))
+
+
+def household_match(household_id, query):
+    """Restringe la query FTS5 alle ricette del nucleo (token della colonna household)."""
+    return f'household : "h{int(household_id)}" AND ({query})'
+
+
+def search_recipes(household_id, text='', after=None, score=None, order=ORDER_NAME, limit=PAGE_SIZE):
+    """
+    Restituisce una Page di ricette del nucleo che corrispondono a `text`
+    (tutte se vuoto), a partire dalla chiave (`after`, `score`) della
+    pagina precedente.
+    """
+    query = fts_query(text)
+    if query and order == ORDER_RANK and fts_available():
+        return _ranked_page(household_id, query, after, score, limit)
+
+    recipes = Recipe.objects.filter(household=household_id).order_by('name')
+    if query:
+        if fts_available():
+            recipes = recipes.filter(pk__in=RawSQL(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                [household_match(household_id, query)],
+            ))
+        else:
+            for token in TOKEN_RE.findall(text):
+                recipes = recipes.filter(
+                    Q(name__icontains=token)
+                    | Q(pk__in=Recipe.objects.filter(ingredients_list__ingredient__name__icontains=token))
+                )
+    if after is not None:
+        recipes = recipes.filter(name__gt=after)
+
+    found = list(recipes[:limit + 1])
+    if len(found) > limit:
+        return Page(found[:limit], next_after=found[limit - 1].name)
+    return Page(found)
+
+
+def _ranked_page(household_id, query, after, score, limit):
+    """Pagina in ordine di pertinenza bm25 (punteggio più basso = più pertinente)."""
+    params = [NAME_WEIGHT, INGREDIENTS_WEIGHT, HOUSEHOLD_WEIGHT, household_match(household_id, query)]
+    seek = ''
+    if after is not None and score is not None:
+        seek = 'WHERE score > %s OR (score = %s AND name > %s)'
+        params += [score, score, after]
+    sql = f"""
+        SELECT * FROM (
+            SELECT r.id, r.name, bm25({FTS_TABLE}, %s, %s, %s) AS score
+            FROM {FTS_TABLE} JOIN core_recipe r ON r.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+        )
+        {seek}
+        ORDER BY score, name
+        LIMIT %s
+    """
+    found = list(Recipe.objects.raw(sql, params + [limit + 1]))
+    if len(found) > limit:
+        last = found[limit - 1]
+        return Page(found[:limit], next_after=last.name, next_score=last.score)
+    return Page(found)
@@ -0,0 +1,359 @@
+# File: core/signals.py
+
+"""
+Ricevitori dei segnali che mantengono aggiornate le strutture derivate:
+la lista della spesa materializzata (core/materialized.py), la matrice
+ricette x ingredienti (core/matrix.py), l'indice invertito dei
+suggerimenti (core/suggestions.py), i totali nutrizionali delle ricette
+(core/nutrition.py), tabelle delle confezioni e costi (core/costs.py), i contatori di versione per gli
+ETag (core/versioning.py) e le revisioni degli slot usate dalla cache dei
+frammenti della griglia. Vengono collegati in CoreConfig.ready().
+
+Ogni aggiornamento riguarda solo il nucleo familiare dell'istanza
+(household_of): le versioni e le strutture in memoria degli altri nuclei
+restano valide. Le unità di misura sono comuni a tutti i nuclei e
+invalidano tutto.
+"""
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import costs, materialized, matrix, nutrition, suggestions, versioning
+from .aggregation import portion_scale
+from .models import Ingredient, MealRecipe, MealSlot, Pack, PantryItem, Recipe, RecipeIngredient, Unit
+
+
+# --- 1. Pianificazioni (MealRecipe) ---
+
+@receiver(pre_save, sender=MealRecipe)
+def remember_planned_recipe(sender, instance, **kwargs):
+    """Memorizza ricetta e porzioni precedenti per gestire le modifiche da formset."""
+    instance._previous_planned = None
+    if instance.pk and not materialized.is_suspended():
+        instance._previous_planned = (
+            MealRecipe.objects.filter(pk=instance.pk).values_list('recipe_id', 'portions').first()
+        )
+
+
+def slot_of(instance):
+    """
+    (household_id, data) dello slot della pianificazione, letti una volta per
+    istanza (lo slot è spesso già in memoria, es. nei formset).
+    """
+    if not hasattr(instance, '_slot'):
+        if MealRecipe.meal_slot.is_cached(instance):
+            instance._slot = (instance.meal_slot.household_id, instance.meal_slot.date)
+        else:
+            instance._slot = (
+                MealSlot.objects.filter(pk=instance.meal_slot_id)
+                .values_list('household_id', 'date').first()
+            ) or (None, None)
+    return instance._slot
+
+
+def slot_date(instance):
+    return slot_of(instance)[1]
+
+
+def household_of(instance):
+    """Nucleo familiare a cui appartiene l'istanza (None se non più rintracciabile)."""
+    if isinstance(instance, (MealSlot, Recipe, Ingredient)):
+        return instance.household_id
+    if isinstance(instance, MealRecipe):
+        return slot_of(instance)[0]
+    if not hasattr(instance, '_household_id'):
+        if isinstance(instance, RecipeIngredient):
+            if RecipeIngredient.recipe.is_cached(instance):
+                instance._household_id = instance.recipe.household_id
+            else:
+                instance._household_id = (
+                    Recipe.objects.filter(pk=instance.recipe_id).values_list('household_id', flat=True).first()
+                )
+        else:  # PantryItem, Pack
+            instance._household_id = (
+                Ingredient.objects.filter(pk=instance.ingredient_id).values_list('household_id', flat=True).first()
+            )
+    return instance._household_id
+
+
+@receiver(post_save, sender=MealRecipe)
+def meal_recipe_saved(sender, instance, created, **kwargs):
+    if materialized.is_suspended():
+        return
+    previous = getattr(instance, '_previous_planned', None)
+    current = (instance.recipe_id, instance.portions)
+    date = slot_date(instance)
+    if created or previous is None:
+        materialized.apply_recipe_deltas({(instance.recipe_id, date, instance.portions): 1})
+    elif previous != current:
+        materialized.apply_recipe_deltas({
+            (previous[0], date, previous[1]): -1,
+            (instance.recipe_id, date, instance.portions): 1,
+        })
+
+
+@receiver(post_delete, sender=MealRecipe)
+def meal_recipe_deleted(sender, instance, **kwargs):
+    if materialized.is_suspended():
+        return
+    date = slot_date(instance)
+    if date is not None:
+        materialized.apply_recipe_deltas({(instance.recipe_id, date, instance.portions): -1})
+
+
+# --- 2. Dosi delle ricette (RecipeIngredient) ---
+
+def planned_dates(recipe_id):
+    """
+    {data: pianificazioni della ricetta scalate sulle porzioni} (due
+    pianificazioni per metà delle porzioni della ricetta valgono 1).
+    """
+    return dict(
+        MealRecipe.objects.filter(recipe_id=recipe_id)
+        .order_by()
+        .values('meal_slot__date')
+        .annotate(count=Sum(portion_scale()))
+        .values_list('meal_slot__date', 'count')
+    )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, **kwargs):
+    """Memorizza ingrediente e dose precedenti per calcolare la variazione."""
+    instance._previous_dose = None
+    if instance.pk and not materialized.is_suspended():
+        instance._previous_dose = (
+            RecipeIngredient.objects.filter(pk=instance.pk)
+            .values_list('ingredient_id', 'quantity').first()
+        )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, created, **kwargs):
+    if materialized.is_suspended():
+        return
+    dates = planned_dates(instance.recipe_id)
+    if not dates:
+        return
+
+    doses = [(instance.ingredient_id, instance.quantity)]
+    previous = getattr(instance, '_previous_dose', None)
+    if not created and previous is not None:
+        ingredient_id, quantity = previous
+        doses.append((ingredient_id, -quantity))
+    details = materialized.ingredient_details({pk for pk, _ in doses})
+
+    # Le variazioni sono espresse nell'unità base di ciascun ingrediente
+    deltas = {}
+    for ingredient_id, quantity in doses:
+        factor = details[ingredient_id].factor
+        for date, count in dates.items():
+            key = (ingredient_id, date)
+            deltas[key] = deltas.get(key, 0) + quantity * factor * count
+    materialized.apply_ingredient_deltas(deltas, details)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    # Se la ricetta viene eliminata, le MealRecipe in cascata possono essere già
+    # state rimosse: in quel caso non restano date e il loro post_delete ha già
+    # sottratto le dosi (o lo farà senza trovare più queste righe).
+    if materialized.is_suspended():
+        return
+    dates = planned_dates(instance.recipe_id)
+    details = materialized.ingredient_details([instance.ingredient_id]) if dates else {}
+    if instance.ingredient_id in details:
+        factor = details[instance.ingredient_id].factor
+        materialized.apply_ingredient_deltas({
+            (instance.ingredient_id, date): -instance.quantity * factor * count
+            for date, count in dates.items()
+        })
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_servings_and_name(sender, instance, **kwargs):
+    """Memorizza porzioni e nome precedenti della ricetta (una sola query)."""
+    instance._previous = None
+    if instance.pk and not materialized.is_suspended():
+        instance._previous = Recipe.objects.filter(pk=instance.pk).values_list('servings', 'name').first()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    """Nuove porzioni della ricetta: cambia la scala di tutte le sue pianificazioni."""
+    if created or materialized.is_suspended():
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and previous[0] != instance.servings:
+        materialized.refresh_ingredients(
+            RecipeIngredient.objects.filter(recipe=instance).values_list('ingredient_id', flat=True)
+        )
+
+
+# --- 3. Anagrafica ingredienti e unità di misura ---
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    """Un cambio di nome o di unità ricalcola la sola riga dell'ingrediente."""
+    if created or materialized.is_suspended():
+        return
+    materialized.refresh_ingredients([instance.pk])
+
+
+@receiver(post_save, sender=Unit)
+def unit_saved(sender, instance, created, **kwargs):
+    """Un fattore di conversione modificato cambia tutte le quantità in unità base."""
+    if created or materialized.is_suspended():
+        return
+    materialized.rebuild()
+
+
+# --- 4. Matrice ricette x ingredienti (core/matrix.py) ---
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_matrix(sender, instance, **kwargs):
+    """Al commit: una ricostruzione prima vedrebbe i dati non ancora confermati."""
+    household_id = household_of(instance)
+    if household_id is not None:
+        transaction.on_commit(lambda: matrix.invalidate(household_id))
+
+
+@receiver(post_save, sender=Unit)
+def invalidate_all_matrices(sender, **kwargs):
+    transaction.on_commit(matrix.invalidate)
+
+
+# --- 4b. Indice invertito dei suggerimenti (core/suggestions.py) ---
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_suggestion_index(sender, instance, **kwargs):
+    """Al commit: rilette prima, le dosi di una transazione annullata resterebbero nell'indice."""
+    household_id, recipe_id = household_of(instance), instance.recipe_id
+    if household_id is not None:
+        transaction.on_commit(lambda: suggestions.refresh_recipe(household_id, recipe_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_suggestion_index(sender, instance, **kwargs):
+    household_id, recipe_id = instance.household_id, instance.pk
+    transaction.on_commit(lambda: suggestions.remove_recipe(household_id, recipe_id))
+
+
+# --- 4c. Totali nutrizionali delle ricette (core/nutrition.py) ---
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_recipe_nutrition(sender, instance, **kwargs):
+    """Ricalcola solo la ricetta della dose (le operazioni di massa usano nutrition.rebuild)."""
+    if not materialized.is_suspended():
+        nutrition.refresh_recipes([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_nutrition(sender, instance, created, **kwargs):
+    if not created and not materialized.is_suspended():
+        nutrition.refresh_ingredient(instance.pk)
+
+
+@receiver(post_save, sender=Unit)
+def rebuild_nutrition(sender, instance, created, **kwargs):
+    if not created and not materialized.is_suspended():
+        nutrition.rebuild()
+
+
+# --- 4d. Confezioni e costi (core/costs.py) ---
+
+@receiver(post_save, sender=Pack)
+@receiver(post_delete, sender=Pack)
+def refresh_pack_options(sender, instance, **kwargs):
+    if not materialized.is_suspended():
+        costs.refresh_ingredients([instance.ingredient_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_costs(sender, instance, created, **kwargs):
+    """L'unità può essere cambiata: le confezioni vanno riconvertite nell'unità base."""
+    if not created and not materialized.is_suspended():
+        costs.refresh_ingredients([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_recipe_cost(sender, instance, **kwargs):
+    if not materialized.is_suspended():
+        costs.refresh_recipes([instance.recipe_id])
+
+
+@receiver(post_save, sender=Unit)
+def rebuild_costs(sender, instance, created, **kwargs):
+    if not created and not materialized.is_suspended():
+        costs.rebuild()
+
+
+# --- 5. Contatori di versione per ETag (core/versioning.py) ---
+
+@receiver(post_save, sender=MealSlot)
+@receiver(post_delete, sender=MealSlot)
+@receiver(post_save, sender=MealRecipe)
+@receiver(post_delete, sender=MealRecipe)
+def bump_plan_version(sender, instance, **kwargs):
+    # Le modifiche in blocco (materialized.suspended) fanno avanzare la versione una volta sola
+    if materialized.is_suspended():
+        return
+    household_id = household_of(instance)
+    if household_id is not None:
+        versioning.bump_on_commit(household_id, versioning.PLAN)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Pack)
+@receiver(post_delete, sender=Pack)
+def bump_recipes_version(sender, instance, **kwargs):
+    household_id = household_of(instance)
+    if household_id is not None:
+        versioning.bump_on_commit(household_id, versioning.RECIPES)
+
+
+@receiver(post_save, sender=Unit)
+@receiver(post_delete, sender=Unit)
+def bump_all_recipes_versions(sender, **kwargs):
+    versioning.bump_all(versioning.RECIPES)
+
+
+@receiver(post_save, sender=PantryItem)
+@receiver(post_delete, sender=PantryItem)
+def bump_pantry_version(sender, instance, **kwargs):
+    household_id = household_of(instance)
+    if household_id is not None:
+        versioning.bump_on_commit(household_id, versioning.PANTRY)
+
+
+# --- 6. Revisioni degli slot per la cache dei frammenti della griglia ---
+
+@receiver(post_save, sender=MealRecipe)
+@receiver(post_delete, sender=MealRecipe)
+def bump_slot_revision(sender, instance, **kwargs):
+    if not materialized.is_suspended():
+        MealSlot.objects.filter(pk=instance.meal_slot_id).update(revision=F('revision') + 1)
+
+
+@receiver(post_save, sender=Recipe)
+def bump_slots_showing_recipe(sender, instance, created, **kwargs):
+    """Un cambio di nome invalida solo le celle in cui la ricetta compare."""
+    if created:
+        return
+    previous = getattr(instance, '_previous', None)
+    # Senza il nome precedente (segnali sospesi) si invalida comunque
+    if previous is None or previous[1] != instance.name:
+        MealSlot.objects.filter(recipes__recipe=instance).update(revision=F('revision') + 1)
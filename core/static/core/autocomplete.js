@@ -0,0 +1,53 @@
+// File: core/static/core/autocomplete.js
+//
+// Autocompletamento dei widget AutocompleteSelect (core/widgets.py).
+// Il listener è registrato sul documento, quindi funziona anche per le
+// righe aggiunte dinamicamente ai formset.
+
+(function() {
+    var DELAY_MS = 200;
+    var timers = new WeakMap();
+
+    function fill(select, results) {
+        var current = select.value;
+        var keep = [];
+        var kept = {};
+        Array.prototype.forEach.call(select.options, function(option) {
+            // Conserva l'opzione vuota e le scelte attuali (anche multiple)
+            if (option.value === '' || option.selected) {
+                keep.push(option);
+                kept[option.value] = true;
+            }
+        });
+        select.innerHTML = '';
+        keep.forEach(function(option) { select.appendChild(option); });
+        results.forEach(function(item) {
+            if (kept[String(item.id)]) {
+                return;
+            }
+            select.appendChild(new Option(item.text, item.id));
+        });
+        if (!select.multiple && !current && results.length) {
+            select.value = String(results[0].id);
+        }
+    }
+
+    function search(input) {
+        var wrapper = input.closest('.autocomplete');
+        var select = wrapper.querySelector('select');
+        var url = wrapper.dataset.url + '?q=' + encodeURIComponent(input.value);
+        fetch(url, {headers: {'Accept': 'application/json'}})
+            .then(function(response) { return response.ok ? response.json() : {results: []}; })
+            .then(function(data) { fill(select, data.results); })
+            .catch(function() {});
+    }
+
+    document.addEventListener('input', function(event) {
+        var input = event.target;
+        if (!input.classList || !input.classList.contains('autocomplete-search')) {
+            return;
+        }
+        clearTimeout(timers.get(input));
+        timers.set(input, setTimeout(function() { search(input); }, DELAY_MS));
+    });
+})();
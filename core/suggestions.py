@@ -0,0 +1,182 @@
+# File: core/suggestions.py
+
+"""
+Suggerimenti "usa quello che hai già comprato" per gli slot pasto.
+
+Un indice invertito in memoria associa a ogni ingrediente l'insieme delle
+ricette che lo usano. Per suggerire ricette basta scorrere le liste dei
+soli ingredienti già presenti nella lista della spesa e contare quante
+volte compare ogni ricetta: le ricette senza ingredienti in comune non
+vengono mai toccate.
+
+Ogni nucleo familiare ha il proprio indice (tenancy.PerHousehold),
+costruito con una sola query al primo uso e legato al timbro RECIPES del
+nucleo: una modifica al ricettario fatta da un altro processo lo fa
+ricostruire alla richiesta successiva. Le modifiche di questo processo lo
+aggiornano ricetta per ricetta al commit della transazione (segnali in
+core/signals.py), rileggendo le dosi confermate; l'importazione in blocco
+lo invalida.
+"""
+
+import heapq
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from .materialized import EPSILON
+from . import versioning
+from .models import Recipe, RecipeIngredient, ShoppingListLine
+from .tenancy import PerHousehold
+
+DEFAULT_SUGGESTIONS = 8
+
+
+@dataclass
+class Suggestion:
+    recipe_id: int
+    name: str
+    matched: int   # ingredienti già nella lista della spesa
+    total: int     # ingredienti della ricetta
+
+
+class IngredientIndex:
+    """Indice invertito ingrediente -> ricette, con la mappa diretta ricetta -> ingredienti."""
+
+    def __init__(self, pairs=()):
+        self.postings = {}   # ingredient_id -> set(recipe_id)
+        self.recipes = {}    # recipe_id -> frozenset(ingredient_id)
+        grouped = {}
+        for recipe_id, ingredient_id in pairs:
+            grouped.setdefault(recipe_id, set()).add(ingredient_id)
+        for recipe_id, ingredient_ids in grouped.items():
+            self.set_recipe(recipe_id, ingredient_ids)
+        self.build_seconds = 0.0
+
+    @classmethod
+    def from_database(cls, household_id):
+        started = time.perf_counter()
+        pairs = RecipeIngredient.objects.filter(recipe__household=household_id).values_list('recipe_id', 'ingredient_id')
+        index = cls(pairs.iterator())
+        index.build_seconds = time.perf_counter() - started
+        return index
+
+    # ------------------------------------------------------------------
+    # Aggiornamenti incrementali
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        """Sostituisce gli ingredienti della ricetta, toccando solo le liste che cambiano."""
+        old = self.recipes.get(recipe_id, frozenset())
+        new = frozenset(ingredient_ids)
+        for ingredient_id in old - new:
+            postings = self.postings[ingredient_id]
+            postings.discard(recipe_id)
+            if not postings:
+                del self.postings[ingredient_id]
+        for ingredient_id in new - old:
+            self.postings.setdefault(ingredient_id, set()).add(recipe_id)
+        if new:
+            self.recipes[recipe_id] = new
+        else:
+            self.recipes.pop(recipe_id, None)
+
+    def remove_recipe(self, recipe_id):
+        self.set_recipe(recipe_id, ())
+
+    # ------------------------------------------------------------------
+    # Interrogazione
+
+    def top_k(self, ingredient_ids, k=DEFAULT_SUGGESTIONS, exclude=()):
+        """
+        Le `k` ricette con più ingredienti in `ingredient_ids`, come coppie
+        (recipe_id, ingredienti in comune). A parità vince la ricetta con
+        meno ingredienti da comprare in aggiunta.
+        """
+        counts = Counter()
+        for ingredient_id in ingredient_ids:
+            counts.update(self.postings.get(ingredient_id, ()))
+        for recipe_id in exclude:
+            counts.pop(recipe_id, None)
+        return heapq.nsmallest(
+            k, counts.items(),
+            key=lambda item: (-item[1], len(self.recipes[item[0]]) - item[1], item[0]),
+        )
+
+    # ------------------------------------------------------------------
+    # Statistiche
+
+    def memory_bytes(self):
+        """Occupazione approssimata (contenitori e interi) misurata con sys.getsizeof."""
+        size = sys.getsizeof(self.postings) + sys.getsizeof(self.recipes)
+        seen = set()
+        for mapping in (self.postings, self.recipes):
+            for key, values in mapping.items():
+                size += sys.getsizeof(values)
+                for value in (key, *values):
+                    if id(value) not in seen:
+                        seen.add(id(value))
+                        size += sys.getsizeof(value)
+        return size
+
+    def stats(self):
+        return {
+            'recipes': len(self.recipes),
+            'ingredients': len(self.postings),
+            'postings': sum(len(recipes) for recipes in self.postings.values()),
+            'memory_bytes': self.memory_bytes(),
+            'build_seconds': self.build_seconds,
+        }
+
+
+_indexes = PerHousehold(IngredientIndex.from_database, scope=versioning.RECIPES)
+
+
+def get_index(household_id):
+    """Restituisce l'indice corrente del nucleo, costruendolo al primo uso."""
+    return _indexes.get(household_id)
+
+
+def invalidate(household_id=None):
+    """Scarta l'indice del nucleo (di tutti se None): verrà ricostruito al prossimo uso."""
+    _indexes.discard(household_id)
+
+
+def refresh_recipe(household_id, recipe_id):
+    """
+    Riallinea una sola ricetta (solo se l'indice del nucleo è già in
+    memoria). Va chiamata dopo il commit: rilegge le dosi della ricetta.
+    """
+    with _indexes.lock:
+        index = _indexes.peek(household_id)
+        if index is None:
+            return
+        ingredient_ids = RecipeIngredient.objects.filter(recipe_id=recipe_id).values_list('ingredient_id', flat=True)
+        index.set_recipe(recipe_id, ingredient_ids)
+
+
+def remove_recipe(household_id, recipe_id):
+    with _indexes.lock:
+        index = _indexes.peek(household_id)
+        if index is not None:
+            index.remove_recipe(recipe_id)
+
+
+def suggest_recipes(household_id, start, end, exclude=(), k=DEFAULT_SUGGESTIONS):
+    """
+    Ricette del nucleo ordinate per numero di ingredienti già presenti nella
+    lista della spesa dei giorni da `start` a `end` (ShoppingListLine),
+    escluse quelle in `exclude`.
+    """
+    on_list = (
+        ShoppingListLine.objects
+        .filter(household=household_id, date__range=(start, end), quantity__gt=EPSILON)
+        .values_list('ingredient_id', flat=True)
+        .distinct()
+    )
+    index = get_index(household_id)
+    best = index.top_k(on_list, k=k, exclude=exclude)
+    names = dict(Recipe.objects.filter(pk__in=[pk for pk, _ in best]).values_list('pk', 'name'))
+    return [
+        Suggestion(recipe_id=pk, name=names[pk], matched=matched, total=len(index.recipes[pk]))
+        for pk, matched in best if pk in names
+    ]
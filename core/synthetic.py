@@ -0,0 +1,175 @@
+# File: core/synthetic.py
+
+"""
+Generatore di dati sintetici per misurare le prestazioni con volumi
+realistici (comando `seed_synthetic` e benchmark in core/benchmarks.py).
+
+Ingredienti, confezioni, ricette, dosi, slot e pianificazioni sono inseriti con
+bulk_create a blocchi; i bulk_create non inviano segnali, quindi alla fine
+si ricostruiscono la lista materializzata, i totali nutrizionali, le
+tabelle delle confezioni e i costi delle ricette e le strutture in memoria e si
+fanno avanzare le versioni del nucleo, come dopo import_recipes. Con lo
+stesso `seed` il risultato è identico.
+"""
+
+import random
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import F
+
+from . import costs, materialized, matrix, nutrition, suggestions, versioning, weeks
+from .models import (
+    Ingredient, MealRecipe, MealSlot, Pack, PantryItem, Recipe, RecipeIngredient, ShoppingListLine, Unit,
+    DAY_CHOICES, MEAL_TYPE_CHOICES, default_household,
+)
+
+BATCH_SIZE = 5000
+
+# Unità canoniche usate per gli ingredienti (create dalla migrazione 0004)
+UNIT_NAMES = ('g', 'ml', 'pz')
+
+# Quantità tipiche per unità: (minimo, massimo)
+QUANTITY_RANGES = {'g': (5, 500), 'ml': (10, 1000), 'pz': (1, 6)}
+
+# Formati delle confezioni per unità e prezzo tipico per unità base: (minimo, massimo) in euro
+PACK_SIZES = {'g': (250, 500, 1000), 'ml': (250, 500, 1000), 'pz': (1, 6, 12)}
+UNIT_PRICES = {'g': (0.001, 0.02), 'ml': (0.001, 0.01), 'pz': (0.1, 1.0)}
+
+
+@dataclass
+class SeedResult:
+    ingredients: int
+    packs: int
+    recipes: int
+    recipe_ingredients: int
+    meal_slots: int
+    meal_recipes: int
+
+
+def clear(household_id=None):
+    """
+    Svuota piano, dispensa e ricettario del nucleo (di tutti i nuclei se
+    `household_id` è None); le unità di misura restano.
+    """
+    def of_household(model, lookup='household'):
+        rows = model.objects.all()
+        return rows if household_id is None else rows.filter(**{lookup: household_id})
+
+    with materialized.suspended():
+        of_household(MealRecipe, 'meal_slot__household').delete()
+        of_household(MealSlot).delete()
+        of_household(PantryItem, 'ingredient__household').delete()
+        of_household(Pack, 'ingredient__household').delete()
+        of_household(RecipeIngredient, 'recipe__household').delete()
+        of_household(Recipe).delete()
+        of_household(Ingredient).delete()
+        of_household(ShoppingListLine).delete()
+    # Con i segnali sospesi gli slot cancellati non fanno avanzare la versione del piano
+    if household_id is None:
+        versioning.bump_all(versioning.PLAN)
+    else:
+        versioning.bump_on_commit(household_id, versioning.PLAN)
+
+
+def seed(ingredients=500, recipes=2000, ingredients_per_recipe=8, recipes_per_slot=2,
+         prefix='Sintetico', random_seed=0, batch_size=BATCH_SIZE, week=None, household_id=None,
+         packs_per_ingredient=2):
+    """
+    Crea nel nucleo `household_id` (di default quello predefinito)
+    `ingredients` ingredienti con fino a `packs_per_ingredient` confezioni
+    ciascuno e `recipes` ricette con in media
+    `ingredients_per_recipe` dosi ciascuna, e pianifica `recipes_per_slot`
+    ricette in ognuno dei 28 slot della settimana del lunedì `week` (di
+    default la corrente), creando gli slot mancanti.
+    Solleva ValueError se nel nucleo esistono già ricette o ingredienti con `prefix`.
+    """
+    week = week or weeks.current_week()
+    household_id = household_id or default_household()
+    if Recipe.objects.filter(household=household_id, name__startswith=f'{prefix} ').exists() or \
+            Ingredient.objects.filter(household=household_id, name__startswith=f'{prefix} ').exists():
+        raise ValueError(f"Esistono già dati con il prefisso '{prefix}'.")
+
+    rng = random.Random(random_seed)
+    units = dict(Unit.objects.filter(name__in=UNIT_NAMES).values_list('name', 'pk'))
+    unit_names = [name for name in UNIT_NAMES if name in units]
+    if ingredients and not unit_names:
+        raise ValueError("Mancano le unità standard (migrazione 0004).")
+
+    with transaction.atomic(), materialized.suspended():
+        ingredient_units = [rng.choice(unit_names) for _ in range(ingredients)]
+        created_ingredients = Ingredient.objects.bulk_create(
+            (Ingredient(household_id=household_id, name=f'{prefix} ingrediente {i:06d}', unit_id=units[unit_name])
+             for i, unit_name in enumerate(ingredient_units)),
+            batch_size=batch_size,
+        )
+        ingredient_ids = [ingredient.pk for ingredient in created_ingredients]
+
+        packs = []
+        for pk, unit_name in zip(ingredient_ids, ingredient_units):
+            low, high = UNIT_PRICES[unit_name]
+            sizes = PACK_SIZES[unit_name]
+            for size in rng.sample(sizes, min(packs_per_ingredient, len(sizes))):
+                packs.append(Pack(
+                    ingredient_id=pk, quantity=size, price=round(size * rng.uniform(low, high), 2) or 0.01,
+                ))
+        Pack.objects.bulk_create(packs, batch_size=batch_size)
+
+        created_recipes = Recipe.objects.bulk_create(
+            (Recipe(household_id=household_id, name=f'{prefix} ricetta {i:07d}') for i in range(recipes)),
+            batch_size=batch_size,
+        )
+
+        doses = 0
+        per_recipe = min(ingredients_per_recipe, len(ingredient_ids))
+
+        def recipe_ingredients():
+            nonlocal doses
+            for recipe in created_recipes:
+                # Numero di ingredienti variabile attorno alla media
+                count = max(1, min(len(ingredient_ids), per_recipe + rng.randint(-2, 2)))
+                for index in rng.sample(range(len(ingredient_ids)), count):
+                    low, high = QUANTITY_RANGES[ingredient_units[index]]
+                    doses += 1
+                    yield RecipeIngredient(
+                        recipe=recipe, ingredient_id=ingredient_ids[index],
+                        quantity=rng.randint(low, high),
+                    )
+
+        if per_recipe:
+            RecipeIngredient.objects.bulk_create(recipe_ingredients(), batch_size=batch_size)
+
+        week_slots = MealSlot.objects.filter(household=household_id, date__range=weeks.week_range(week))
+        existing = {(slot.day, slot.meal_type) for slot in week_slots}
+        MealSlot.objects.bulk_create(
+            MealSlot(household_id=household_id, date=weeks.cell_date(week, day), meal_type=meal_type)
+            for day, _ in DAY_CHOICES for meal_type, _ in MEAL_TYPE_CHOICES
+            if (day, meal_type) not in existing
+        )
+        slots = list(week_slots.all())
+
+        planned = [
+            MealRecipe(meal_slot=slot, recipe=recipe)
+            for slot in slots
+            for recipe in rng.sample(created_recipes, min(recipes_per_slot, len(created_recipes)))
+        ]
+        MealRecipe.objects.bulk_create(planned, batch_size=batch_size, ignore_conflicts=True)
+
+    # bulk_create non invia segnali: si riallinea tutto esplicitamente
+    materialized.rebuild(household_id)
+    nutrition.rebuild(household_id)
+    costs.rebuild(household_id)
+    matrix.invalidate(household_id)
+    suggestions.invalidate(household_id)
+    # Nuove ricette negli slot: invalida le celle nella cache dei frammenti
+    MealSlot.objects.filter(pk__in=[slot.pk for slot in slots]).update(revision=F('revision') + 1)
+    versioning.bump(household_id, versioning.PLAN, versioning.RECIPES)
+
+    return SeedResult(
+        ingredients=len(ingredient_ids),
+        packs=len(packs),
+        recipes=len(created_recipes),
+        recipe_ingredients=doses,
+        meal_slots=len(slots),
+        meal_recipes=len(planned),
+    )
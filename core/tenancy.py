@@ -0,0 +1,150 @@
+# File: core/tenancy.py
+
+"""
+Nucleo familiare (tenant) della richiesta e strutture in memoria per nucleo.
+
+Ogni vista lavora sul nucleo di `request.household_id`, impostato da
+HouseholdMiddleware (core/middleware.py) leggendo la sessione:
+  - il nucleo scelto con la vista `household_switch` (solo tra quelli di
+    cui l'utente è membro);
+  - altrimenti, per un utente autenticato, il primo nucleo di cui è membro
+    (cercato una volta e poi memorizzato nella sessione);
+  - altrimenti il nucleo predefinito (models.default_household).
+
+Le richieste senza cookie di sessione non eseguono query; le altre leggono
+solo la sessione, come già fa l'autenticazione.
+
+`PerHousehold` conserva per nucleo le strutture costruite in memoria
+(matrice delle dosi, indice dei suggerimenti): ogni nucleo si costruisce e
+si invalida per conto suo, e i nuclei usati meno di recente escono quando
+se ne tengono più di MAX_HOUSEHOLDS_IN_MEMORY. Con `scope` ogni struttura
+è legata al timbro di quell'ambito (core/versioning.py) letto prima di
+costruirla: una scrittura di un altro processo cambia il timbro e la
+struttura si ricostruisce al primo uso. I bump di questo processo la fanno
+invece avanzare insieme al timbro, perché le sue scritture la aggiornano o
+la scartano da sé al commit (segnali in core/signals.py): fino al commit
+resta quella dei dati confermati, e un rollback non lascia tracce.
+"""
+
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import SESSION_KEY as USER_SESSION_KEY
+
+from . import versioning
+from .models import Household, default_household
+
+SESSION_KEY = '_core_household_id'
+
+# Nuclei con strutture in memoria per ogni processo (gli altri le ricostruiscono al primo uso)
+MAX_HOUSEHOLDS_IN_MEMORY = 64
+
+
+def member_households(user):
+    """Nuclei che l'utente può usare (tutti per i superutenti)."""
+    if user.is_superuser:
+        return Household.objects.all()
+    return Household.objects.filter(members=user)
+
+
+def first_household_of(user_id):
+    return Household.objects.filter(members=user_id).order_by('pk').values_list('pk', flat=True)
+
+
+def household_from_session(session):
+    """Id del nucleo della sessione (vedi il docstring del modulo)."""
+    household_id = session.get(SESSION_KEY)
+    if household_id is None:
+        user_id = session.get(USER_SESSION_KEY)
+        if user_id is not None:
+            household_id = first_household_of(user_id).first()
+        if household_id is None:
+            household_id = default_household()
+        if user_id is not None:
+            session[SESSION_KEY] = household_id
+    return household_id
+
+
+async def ahousehold_from_session(session):
+    """Come household_from_session, con l'ORM e la sessione asincroni."""
+    household_id = await session.aget(SESSION_KEY)
+    if household_id is None:
+        user_id = await session.aget(USER_SESSION_KEY)
+        if user_id is not None:
+            household_id = await first_household_of(user_id).afirst()
+        if household_id is None:
+            # Dopo la prima lettura è un valore in memoria
+            household_id = await sync_to_async(default_household)()
+        if user_id is not None:
+            await session.aset(SESSION_KEY, household_id)
+    return household_id
+
+
+def activate(request, household):
+    """Rende `household` il nucleo delle richieste successive della sessione."""
+    request.session[SESSION_KEY] = household.pk
+    request.household_id = household.pk
+
+
+class PerHousehold:
+    """
+    Oggetti costruiti con `build(household_id)` al primo uso e conservati per
+    nucleo, in ordine di uso (LRU), con il timbro dell'ambito `scope` (vedi
+    il docstring del modulo). `lock` protegge anche gli aggiornamenti
+    incrementali fatti dal chiamante sugli oggetti restituiti da `peek`.
+    """
+
+    def __init__(self, build, maxsize=MAX_HOUSEHOLDS_IN_MEMORY, scope=None):
+        self.build = build
+        self.maxsize = maxsize
+        self.scope = scope
+        self.lock = threading.RLock()
+        self._items = OrderedDict()   # household_id -> (timbro, oggetto)
+        if scope is not None:
+            versioning.on_bump(self.advance)
+
+    def stamp(self, household_id):
+        return versioning.stamp(household_id, self.scope) if self.scope is not None else None
+
+    def get(self, household_id):
+        # Il timbro si legge prima di costruire: una scrittura confermata
+        # durante la costruzione lo fa avanzare e l'oggetto verrà ricostruito
+        stamp = self.stamp(household_id)
+        with self.lock:
+            entry = self._items.get(household_id)
+            if entry is None or entry[0] != stamp:
+                entry = self._items[household_id] = (stamp, self.build(household_id))
+                self._items.move_to_end(household_id)
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+            else:
+                self._items.move_to_end(household_id)
+            return entry[1]
+
+    def peek(self, household_id):
+        """L'oggetto del nucleo se è già in memoria, senza costruirlo."""
+        with self.lock:
+            entry = self._items.get(household_id)
+            return entry[1] if entry is not None else None
+
+    def advance(self, household_id, scope, old, new):
+        """Un bump di questo processo: l'oggetto aggiornato fino a `old` resta valido per `new`."""
+        if scope != self.scope:
+            return
+        with self.lock:
+            entry = self._items.get(household_id)
+            if entry is not None and entry[0] == old:
+                self._items[household_id] = (new, entry[1])
+
+    def discard(self, household_id=None):
+        """Scarta l'oggetto del nucleo (di tutti i nuclei se `household_id` è None)."""
+        with self.lock:
+            if household_id is None:
+                self._items.clear()
+            else:
+                self._items.pop(household_id, None)
+
+    def __len__(self):
+        return len(self._items)
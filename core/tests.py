@@ -1,3 +1,2094 @@
-from django.test import TestCase
+import datetime
+import heapq
+import json
+import math
+import os
+import tempfile
+import timeit
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, router, transaction
+from django.forms import modelform_factory
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import (
+    autocomplete, benchmarks, costs, materialized, matrix, metrics, nutrition, pantry, planner, routers, search,
+    suggestions, synthetic, tenancy, versioning, week_editor, weeks,
+)
+from .aggregation import build_shopping_list, shopping_list_rows
+from .models import (
+    Household, Ingredient, Pack, Recipe, RecipeIngredient, MealSlot, MealRecipe, PantryItem, ShoppingListLine, Unit,
+    VersionStamp, DAY_CHOICES, MEAL_TYPE_CHOICES, default_household,
+)
+from .views import build_weekly_grid
+
+# I benchmark sono lenti: si attivano solo con BENCHMARK=1 python manage.py test
+BENCHMARK = os.environ.get('BENCHMARK') == '1'
+
+# Cache in memoria per i test: quella su disco del progetto (.django_cache) non si tocca
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'core-tests',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # I frammenti della griglia, attivi come con Redis
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'core-tests-fragments',
+    },
+}
+
+
+# ======================================================================
+# UTILITÀ PER I TEST
+# ======================================================================
+
+@override_settings(CACHES=TEST_CACHES)
+class CoreTestCase(TestCase):
+    """
+    La cache (versioni e pagine) è in memoria e condivisa: ogni test parte da
+    vuota, con i timbri del nucleo predefinito già letti come in un processo
+    avviato (la prima lettura di un ambito li crea nel database).
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches['fragments'].clear()
+        versioning.get_versions(home(), versioning.PLAN, versioning.RECIPES, versioning.PANTRY)
+        autocomplete.clear_cache()
+        # Le strutture in memoria non seguono il rollback dei test
+        matrix.invalidate()
+        suggestions.invalidate()
+        metrics.registry.clear()
+
+
+def home():
+    """Id del nucleo predefinito, a cui vanno i dati creati senza nucleo esplicito."""
+    return default_household()
+
+
+def unit(name):
+    """Unità di misura standard (create dalla migrazione 0004)."""
+    return Unit.objects.get(name=name)
+
+
+def make_recipe(name, *ingredients):
+    """Crea una ricetta con coppie (Ingredient, quantità)."""
+    recipe = Recipe.objects.create(name=name)
+    for ingredient, quantity in ingredients:
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity=quantity)
+    return recipe
+
+
+def day_date(day, week=None):
+    """Data del giorno `day` (MON, TUE, ...) nella settimana `week` (di default la corrente)."""
+    return weeks.cell_date(week or weeks.current_week(), day)
+
+
+def this_week():
+    """Intervallo (lunedì, domenica) della settimana corrente."""
+    return weeks.week_range(weeks.current_week())
+
+
+def plan(day, meal_type, *recipes, week=None):
+    """Assegna le ricette allo slot (day, meal_type) della settimana, creandolo se serve."""
+    slot, _ = MealSlot.objects.get_or_create(date=day_date(day, week), meal_type=meal_type)
+    for recipe in recipes:
+        MealRecipe.objects.create(meal_slot=slot, recipe=recipe)
+    return slot
+
+
+def fill_week(recipes_per_slot):
+    """Riempie tutti i 28 slot della settimana corrente con `recipes_per_slot` ricette diverse ciascuno."""
+    recipes = Recipe.objects.bulk_create(
+        Recipe(name=f'Ricetta {i}') for i in range(recipes_per_slot * 2)
+    )
+    slots = MealSlot.objects.bulk_create(
+        MealSlot(date=day_date(day), meal_type=meal_type)
+        for day, _ in DAY_CHOICES for meal_type, _ in MEAL_TYPE_CHOICES
+    )
+    MealRecipe.objects.bulk_create(
+        MealRecipe(meal_slot=slot, recipe=recipes[(i + k) % len(recipes)])
+        for i, slot in enumerate(slots) for k in range(recipes_per_slot)
+    )
+    return slots
+
+
+def report(label, seconds):
+    print(f'\n[benchmark] {label}: {seconds * 1000:.2f} ms')
+
+
+# ======================================================================
+# LISTA DELLA SPESA
+# ======================================================================
+
+class ShoppingListAggregationTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.milk = Ingredient.objects.create(name='Latte', unit=unit('l'))
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 100))
+        self.porridge = make_recipe('Porridge', (self.milk, 0.2))
+        self.lasagne = make_recipe('Lasagne', (self.pasta, 150), (self.milk, 0.05))
+
+    def test_quantities_are_multiplied_by_occurrences(self):
+        plan('MON', 'DIN', self.carbonara, self.lasagne)
+        plan('TUE', 'DIN', self.carbonara)
+        plan('WED', 'BRK', self.porridge)
+
+        rows = build_shopping_list()
+
+        self.assertEqual(
+            [(r['name'], r['quantity'], r['unit']) for r in rows],
+            [('Latte', 250, 'ml'), ('Pasta', 350, 'g')],
+        )
+
+    def test_units_are_converted_to_base_unit(self):
+        rice = Ingredient.objects.create(name='Riso', unit=unit('kg'))
+        flour = Ingredient.objects.create(name='Farina', unit=unit('grammi'))
+        plan('MON', 'LUN', make_recipe('Risotto', (rice, 0.3), (flour, 20)))
+
+        rows = build_shopping_list()
+
+        self.assertEqual(
+            [(r['name'], r['quantity'], r['unit']) for r in rows],
+            [('Farina', 20, 'g'), ('Riso', 300, 'g')],
+        )
+
+    def test_unit_symbols_are_normalized(self):
+        cup = Unit.objects.create(name=' Tazza ', factor=5)
+        self.assertEqual(cup.name, 'tazza')
+        self.assertEqual(cup.factor, 1)
+        self.assertEqual(cup.base_unit, cup)
+        self.assertEqual(unit('kg').base_unit, unit('g'))
+
+        # La normalizzazione precede il controllo di unicità: errore di validazione, non IntegrityError
+        with self.assertRaises(ValidationError) as raised:
+            Unit(name=' G ').full_clean()
+        self.assertIn('name', raised.exception.message_dict)
+        # Come il form dell'admin
+        form = modelform_factory(Unit, fields=['name', 'base', 'factor'])(data={'name': 'G', 'factor': 1})
+        self.assertFalse(form.is_valid())
+        self.assertIn('name', form.errors)
+
+    def test_empty_plan_gives_empty_list(self):
+        MealSlot.objects.create(date=day_date('MON'), meal_type='LUN')
+        self.assertEqual(build_shopping_list(), [])
+
+    def test_query_count_does_not_depend_on_plan_size(self):
+        recipes = [
+            make_recipe(f'Ricetta {i}', (self.pasta, 10), (self.milk, i))
+            for i in range(20)
+        ]
+        for i, (day, _) in enumerate(DAY_CHOICES):
+            for j, (meal_type, _) in enumerate(MEAL_TYPE_CHOICES):
+                plan(day, meal_type, *recipes[(i + j) % 20:(i + j) % 20 + 3])
+
+        with self.assertNumQueries(1):
+            rows = build_shopping_list()
+        self.assertEqual(len(rows), 2)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('shopping_list'))
+        self.assertContains(response, 'Pasta')
+
+
+class MaterializedShoppingListTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.eggs = Ingredient.objects.create(name='Uova', unit=unit('pezzi'))
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 100), (self.eggs, 2))
+        self.slot = plan('MON', 'DIN', self.carbonara)
+        plan('TUE', 'DIN', self.carbonara)
+
+    def assertConsistent(self):
+        self.assertEqual(materialized.diff(), [])
+
+    def lines(self):
+        return {line['name']: line['quantity'] for line in materialized.materialized_shopping_list(home(), *this_week())}
+
+    def test_planning_and_unplanning_recipes(self):
+        self.assertEqual(self.lines(), {'Pasta': 200, 'Uova': 4})
+        MealRecipe.objects.filter(meal_slot=self.slot).delete()
+        self.assertEqual(self.lines(), {'Pasta': 100, 'Uova': 2})
+        MealRecipe.objects.all().delete()
+        self.assertEqual(self.lines(), {})
+        self.assertFalse(ShoppingListLine.objects.exists())
+
+    def test_existing_lines_are_updated_in_one_statement(self):
+        monday, _ = this_week()
+        tuesday = monday + datetime.timedelta(days=1)
+        deltas = {(self.pasta.pk, monday): 50, (self.eggs.pk, monday): -2, (self.pasta.pk, tuesday): -100}
+        # SAVEPOINT, lettura delle righe, UPDATE con CASE, DELETE delle righe azzerate, RELEASE
+        with self.assertNumQueries(5):
+            materialized.apply_ingredient_deltas(deltas)
+        self.assertEqual(
+            set(ShoppingListLine.objects.values_list('ingredient__name', 'date', 'quantity')),
+            {('Pasta', monday, 150), ('Uova', tuesday, 2)},
+        )
+
+    def test_recipe_ingredient_changes(self):
+        dose = RecipeIngredient.objects.get(ingredient=self.eggs)
+        dose.quantity = 3
+        dose.save()
+        self.assertEqual(self.lines(), {'Pasta': 200, 'Uova': 6})
+
+        flour = Ingredient.objects.create(name='Farina', unit=unit('g'))
+        dose.ingredient = flour
+        dose.save()
+        self.assertEqual(self.lines(), {'Farina': 6, 'Pasta': 200})
+
+        dose.delete()
+        self.assertEqual(self.lines(), {'Pasta': 200})
+        self.assertConsistent()
+
+    def test_swapping_recipe_in_slot(self):
+        porridge = make_recipe('Porridge', (self.eggs, 1))
+        meal_recipe = MealRecipe.objects.get(meal_slot=self.slot)
+        meal_recipe.recipe = porridge
+        meal_recipe.save()
+        self.assertEqual(self.lines(), {'Pasta': 100, 'Uova': 3})
+        self.assertConsistent()
+
+    def test_deleting_recipe_or_ingredient(self):
+        make_recipe('Frittata', (self.eggs, 4))
+        plan('WED', 'LUN', Recipe.objects.get(name='Frittata'))
+        self.carbonara.delete()
+        self.assertEqual(self.lines(), {'Uova': 4})
+        self.eggs.delete()
+        self.assertEqual(self.lines(), {})
+        self.assertConsistent()
+
+    def test_ingredient_rename_is_propagated(self):
+        self.pasta.name = 'Spaghetti'
+        self.pasta.unit = unit('kg')
+        self.pasta.save()
+        self.assertEqual(self.lines(), {'Spaghetti': 200000, 'Uova': 4})
+        self.assertConsistent()
+
+    def test_unit_factor_change_rebuilds(self):
+        hg = unit('hg')
+        self.pasta.unit = hg
+        self.pasta.save()
+        hg.factor = 50
+        hg.save()
+        self.assertEqual(self.lines(), {'Pasta': 10000, 'Uova': 4})
+        self.assertConsistent()
+
+    def test_reset_clears_the_list(self):
+        before = versioning.stamp(home(), versioning.PLAN)
+        self.client.post(reverse('reset_weekly_plan'))
+        self.assertFalse(MealSlot.objects.exists())
+        self.assertFalse(MealRecipe.objects.exists())
+        self.assertFalse(ShoppingListLine.objects.exists())
+        self.assertGreater(versioning.stamp(home(), versioning.PLAN), before)
+
+    def test_reset_keeps_other_weeks(self):
+        next_week = weeks.current_week() + weeks.ONE_WEEK
+        plan('MON', 'DIN', self.carbonara, week=next_week)
+
+        self.client.post(f"{reverse('reset_weekly_plan')}?week={weeks.format_week(next_week)}")
+
+        self.assertEqual(MealSlot.objects.count(), 2)
+        self.assertEqual(self.lines(), {'Pasta': 200, 'Uova': 4})
+        self.assertFalse(ShoppingListLine.objects.filter(date__gte=next_week).exists())
+        self.assertConsistent()
+
+    def test_lines_are_per_day(self):
+        self.assertEqual(
+            sorted(ShoppingListLine.objects.values_list('date', 'name', 'quantity')),
+            [(day_date('MON'), 'Pasta', 100), (day_date('MON'), 'Uova', 2),
+             (day_date('TUE'), 'Pasta', 100), (day_date('TUE'), 'Uova', 2)],
+        )
+        monday = day_date('MON')
+        self.assertEqual(
+            {row['name']: row['quantity'] for row in materialized.materialized_shopping_list(home(), monday, monday)},
+            {'Pasta': 100, 'Uova': 2},
+        )
+
+    def test_check_command(self):
+        out = StringIO()
+        call_command('check_shopping_list', stdout=out)
+        self.assertIn('coerente', out.getvalue())
+
+        ShoppingListLine.objects.filter(ingredient=self.pasta).update(quantity=1)
+        with self.assertRaises(CommandError):
+            call_command('check_shopping_list', stdout=StringIO())
+
+        call_command('check_shopping_list', '--fix', stdout=StringIO())
+        self.assertEqual(self.lines(), {'Pasta': 200, 'Uova': 4})
+
+
+class PortionsTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.eggs = Ingredient.objects.create(name='Uova', unit=unit('pezzi'))
+        # Dosi per 4 porzioni (il default)
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 400), (self.eggs, 4))
+        self.slot = plan('MON', 'DIN', self.carbonara)
+        plan('TUE', 'DIN', self.carbonara)
+        self.monday = MealRecipe.objects.get(meal_slot=self.slot)
+
+    def lines(self):
+        return {line['name']: line['quantity'] for line in materialized.materialized_shopping_list(home(), *this_week())}
+
+    def aggregated(self):
+        return {row['name']: row['quantity'] for row in build_shopping_list()}
+
+    def test_portions_scale_the_shopping_list(self):
+        self.monday.portions = 2
+        self.monday.save()
+        expected = {'Pasta': 600, 'Uova': 6}
+        self.assertEqual(self.lines(), expected)
+        self.assertEqual(self.aggregated(), expected)
+        self.assertEqual(materialized.diff(), [])
+
+        self.monday.portions = None
+        self.monday.save()
+        self.assertEqual(self.lines(), {'Pasta': 800, 'Uova': 8})
+        self.monday.delete()
+        self.assertEqual(self.lines(), {'Pasta': 400, 'Uova': 4})
+        self.assertEqual(materialized.diff(), [])
+
+    def test_changing_servings_rescales_every_plan(self):
+        self.monday.portions = 6
+        self.monday.save()
+        self.carbonara.servings = 2
+        self.carbonara.save()
+        # Lunedì 6 porzioni su 2 (x3), martedì quelle della ricetta (x1)
+        self.assertEqual(self.lines(), {'Pasta': 1600, 'Uova': 16})
+        self.assertEqual(self.aggregated(), self.lines())
+        self.assertEqual(materialized.diff(), [])
+
+    def test_dose_change_keeps_the_scale(self):
+        self.monday.portions = 2
+        self.monday.save()
+        dose = RecipeIngredient.objects.get(ingredient=self.eggs)
+        dose.quantity = 8
+        dose.save()
+        self.assertEqual(self.lines(), {'Pasta': 600, 'Uova': 12})
+        self.assertEqual(materialized.diff(), [])
+
+    def test_scaling_adds_no_queries(self):
+        self.monday.portions = 3
+        self.monday.save()
+        with self.assertNumQueries(1):
+            build_shopping_list()
+        monday = weeks.current_week()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('shopping_list'), {
+                'start': monday - weeks.ONE_WEEK, 'end': monday + weeks.ONE_WEEK,
+            })
+        self.assertContains(response, 'Pasta')
+
+    def test_copy_week_keeps_portions(self):
+        self.monday.portions = 2
+        self.monday.save()
+        target = weeks.current_week() + weeks.ONE_WEEK
+        week_editor.copy_week(home(), weeks.current_week(), target)
+        self.assertEqual(
+            MealRecipe.objects.get(meal_slot__date=day_date('MON', target)).portions, 2,
+        )
+        self.assertEqual(materialized.diff(), [])
+
+    def test_formset_edits_portions(self):
+        response = self.client.post(reverse('meal_slot_update', args=[self.slot.pk]), {
+            'recipes-TOTAL_FORMS': '1', 'recipes-INITIAL_FORMS': '1',
+            'recipes-0-id': self.monday.pk, 'recipes-0-recipe': self.carbonara.pk,
+            'recipes-0-portions': '1',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.monday.refresh_from_db()
+        self.assertEqual(self.monday.portions, 1)
+        self.assertEqual(self.lines(), {'Pasta': 500, 'Uova': 5})
+        self.assertEqual(materialized.diff(), [])
+
+    def test_servings_must_be_positive(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Recipe.objects.filter(pk=self.carbonara.pk).update(servings=0)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MealRecipe.objects.filter(pk=self.monday.pk).update(portions=0)
+
+
+class NutritionTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Valori per 100 g (default) e per un uovo
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'), kcal=350, protein=12, carbs=70)
+        self.eggs = Ingredient.objects.create(
+            name='Uova', unit=unit('pezzi'), nutrition_basis=1, kcal=80, protein=6, fat=5,
+        )
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 400), (self.eggs, 4))
+
+    def totals(self, recipe):
+        recipe.refresh_from_db()
+        return nutrition.of(recipe)
+
+    def test_totals_are_stored_on_the_recipe(self):
+        self.assertEqual(self.totals(self.carbonara), nutrition.Nutrients(1720, 72, 20, 280, 0))
+        self.assertEqual(nutrition.per_portion(self.carbonara).kcal, 430)
+        self.assertEqual(nutrition.diff(), [])
+
+    def test_dose_changes_recompute_only_their_recipe(self):
+        frittata = make_recipe('Frittata', (self.eggs, 2))
+        dose = RecipeIngredient.objects.get(recipe=self.carbonara, ingredient=self.eggs)
+        with CaptureQueriesContext(connection) as queries:
+            dose.quantity = 2
+            dose.save()
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "core_recipe" SET "kcal"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn(f'"core_recipe"."id" IN ({self.carbonara.pk})', updates[0])
+        self.assertEqual(self.totals(self.carbonara).kcal, 1560)
+        self.assertEqual(self.totals(frittata).kcal, 160)
+
+        dose.delete()
+        self.assertEqual(self.totals(self.carbonara).kcal, 1400)
+        self.assertEqual(nutrition.diff(), [])
+
+    def test_ingredient_and_unit_changes_are_propagated(self):
+        self.pasta.kcal = 300
+        self.pasta.save()
+        self.assertEqual(self.totals(self.carbonara).kcal, 1520)
+
+        hg = unit('hg')
+        self.pasta.unit = hg
+        self.pasta.save()
+        hg.factor = 50
+        hg.save()
+        # 400 hg da 50 g = 20 kg di pasta
+        self.assertEqual(self.totals(self.carbonara).kcal, 60000 + 320)
+        self.assertEqual(nutrition.diff(), [])
+
+    def test_weekly_plan_summary(self):
+        plan('MON', 'DIN', self.carbonara)
+        plan('MON', 'LUN', self.carbonara)
+        plan('WED', 'DIN', self.carbonara)
+        grid = build_weekly_grid(home(), weeks.current_week())
+        with self.assertNumQueries(0):
+            summary = nutrition.summarize(grid)
+        self.assertEqual(grid[0]['nutrition'].kcal, 860)
+        self.assertEqual([day.kcal for day in summary.days], [860, 0, 430, 0, 0, 0, 0])
+        self.assertEqual(summary.total.protein, 54)
+        self.assertAlmostEqual(summary.daily_average.kcal, 1290 / 7)
+
+    def test_weekly_plan_page_shows_summary_without_extra_queries(self):
+        plan('MON', 'DIN', self.carbonara)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('weekly_plan'))
+        self.assertContains(response, 'Valori Nutrizionali')
+        self.assertContains(response, '<td>430</td>')
+
+    def test_quick_form_defaults_nutrients(self):
+        response = self.client.post(reverse('ingredient_create'), {'name': 'Sale', 'unit': unit('g').pk})
+        self.assertEqual(response.status_code, 302)
+        salt = Ingredient.objects.get(name='Sale')
+        self.assertEqual((salt.kcal, salt.nutrition_basis), (0, 100))
+
+    def test_import_computes_totals(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'ricette.csv'
+            path.write_text('recipe,ingredient,quantity,unit\nPasta in bianco,Pasta,1,hg\n', encoding='utf-8')
+            call_command('import_recipes', str(path), stdout=StringIO())
+        self.assertEqual(Recipe.objects.get(name='Pasta in bianco').kcal, 350)
+
+
+def cheapest_cover(packs, quantity):
+    """Costo minimo (centesimi) per coprire `quantity` con confezioni [(dimensione, prezzo)], per forza bruta."""
+    best = [0] + [None] * quantity
+    for k in range(1, quantity + 1):
+        best[k] = min(price + best[max(0, k - size)] for size, price in packs)
+    return best[quantity]
+
+
+class PackCostTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.milk = Ingredient.objects.create(name='Latte', unit=unit('l'))
+        Pack.objects.create(ingredient=self.pasta, quantity=500, price='0.89')
+        Pack.objects.create(ingredient=self.pasta, quantity=1000, price='1.49')
+        Pack.objects.create(ingredient=self.milk, quantity=1, price='1.20')
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 400))
+        self.porridge = make_recipe('Porridge', (self.milk, 0.2))
+
+    def basket(self):
+        rows = list(materialized.materialized_shopping_list(home(), *this_week(), net=True, packs=True))
+        return rows, costs.price_shopping_list(rows)
+
+    def test_cheapest_combination_covers_the_quantity(self):
+        options = costs.build_options([(500, 89, '500 g'), (1000, 149, '1000 g')])
+        self.assertEqual(costs.solve(options, 1200), (238, [('500 g', 1), ('1000 g', 1)]))
+        self.assertEqual(costs.solve(options, 2000), (298, [('1000 g', 2)]))
+        self.assertEqual(costs.solve(options, 0), (0, []))
+
+    def test_solution_is_optimal_beyond_the_table(self):
+        packs = [(250, 100), (400, 150), (1000, 390)]
+        options = costs.build_options([(size, price, str(size)) for size, price in packs])
+        steps = [(size // options['quantum'], price) for size, price in packs]
+        for quantity in range(1, 6000, 37):
+            purchase = costs.solve(options, quantity)
+            self.assertEqual(purchase.cost, cheapest_cover(steps, math.ceil(quantity / options['quantum'])))
+            covered = sum(int(label) * count for label, count in purchase.packs)
+            self.assertGreaterEqual(covered, quantity)
+
+    def test_shopping_list_cost_in_the_same_query(self):
+        plan('MON', 'DIN', self.carbonara)
+        plan('TUE', 'DIN', self.carbonara, self.porridge)
+        plan('WED', 'DIN', self.carbonara)
+        with self.assertNumQueries(1):
+            rows, basket = self.basket()
+        by_name = {row['name']: row for row in rows}
+        self.assertEqual(by_name['Pasta']['packs'], [('500 g', 1), ('1000 g', 1)])
+        self.assertEqual(by_name['Latte']['packs'], [('1 l', 1)])
+        self.assertAlmostEqual(basket.total, 2.38 + 1.20)
+        self.assertEqual(basket.unpriced, 0)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('shopping_list'))
+        self.assertContains(response, '1 × 500 g + 1 × 1000 g')
+        self.assertContains(response, '3.58 €')
+
+    def test_ingredients_without_packs_are_not_counted(self):
+        eggs = Ingredient.objects.create(name='Uova', unit=unit('pezzi'))
+        plan('MON', 'DIN', make_recipe('Frittata', (eggs, 4)), self.carbonara)
+        rows, basket = self.basket()
+        self.assertEqual({row['name']: row['cost'] for row in rows}, {'Pasta': 0.89, 'Uova': None})
+        self.assertEqual(basket, costs.Basket(total=0.89, unpriced=1))
+
+    def test_pantry_stock_is_not_bought(self):
+        plan('MON', 'DIN', self.carbonara, make_recipe('Bis', (self.pasta, 800)))
+        PantryItem.objects.create(ingredient=self.pasta, quantity=300, unit=unit('g'))
+        rows, basket = self.basket()
+        # 1200 g meno 300 g in dispensa: 900 g
+        self.assertEqual(rows[0]['packs'], [('1000 g', 1)])
+        self.assertAlmostEqual(basket.total, 1.49)
+
+    def test_pack_changes_refresh_options_and_recipe_costs(self):
+        self.carbonara.refresh_from_db()
+        self.assertAlmostEqual(self.carbonara.cost, 400 * 0.00149)
+
+        Pack.objects.create(ingredient=self.pasta, quantity=5000, price='5.00')
+        self.pasta.refresh_from_db()
+        self.assertAlmostEqual(self.pasta.unit_price, 0.001)
+        self.carbonara.refresh_from_db()
+        self.assertAlmostEqual(self.carbonara.cost, 0.4)
+
+        Pack.objects.filter(ingredient=self.pasta).delete()
+        self.pasta.refresh_from_db()
+        self.assertEqual((self.pasta.pack_options, self.pasta.unit_price), (None, None))
+        self.carbonara.refresh_from_db()
+        self.assertEqual(self.carbonara.cost, 0)
+
+    def test_unit_changes_convert_the_packs(self):
+        self.milk.unit = unit('ml')
+        self.milk.save()
+        self.milk.refresh_from_db()
+        # La confezione ora è da 1 ml
+        self.assertEqual(self.milk.pack_options['labels'], ['1 ml'])
+        self.assertAlmostEqual(self.milk.unit_price, 1.20)
+
+    def test_weekly_plan_shows_recipe_costs_from_stored_values(self):
+        slot = plan('MON', 'DIN', self.carbonara)
+        MealRecipe.objects.filter(meal_slot=slot).update(portions=8)
+        plan('TUE', 'DIN', self.carbonara)
+        grid = build_weekly_grid(home(), weeks.current_week())
+        with self.assertNumQueries(0):
+            rows, total = costs.summarize(grid)
+        self.assertEqual([(row.recipe.name, row.portions) for row in rows], [('Carbonara', 12)])
+        self.assertAlmostEqual(total, 400 * 0.00149 * 3)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('weekly_plan'))
+        self.assertContains(response, 'Costo Stimato delle Ricette')
+        self.assertContains(response, '<td>1.79</td>')
+
+
+class PantryTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.eggs = Ingredient.objects.create(name='Uova', unit=unit('pz'))
+        plan('MON', 'DIN', make_recipe('Carbonara', (self.pasta, 100), (self.eggs, 3)))
+
+    def net(self):
+        return {row['name']: (row['quantity'], row['stock'], row['net'])
+                for row in materialized.materialized_shopping_list(home(), *this_week(), net=True)}
+
+    def net_of(self, monday):
+        return {row['name']: (row['quantity'], row['stock'], row['net'])
+                for row in materialized.materialized_shopping_list(home(), *weeks.week_range(monday), net=True)}
+
+    def test_stock_is_subtracted_in_the_same_query(self):
+        PantryItem.objects.create(ingredient=self.pasta, quantity=0.03, unit=unit('kg'))
+        PantryItem.objects.create(ingredient=self.pasta, quantity=20, unit=unit('g'))
+        PantryItem.objects.create(ingredient=self.eggs, quantity=10, unit=unit('pz'))
+        # I lotti scaduti non contano
+        PantryItem.objects.create(ingredient=self.pasta, quantity=1, unit=unit('kg'),
+                                  expiry=datetime.date(2000, 1, 1))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.net(), {'Pasta': (100, 50, 50), 'Uova': (3, 10, 0)})
+        # Stesso risultato calcolando la lista dal piano
+        computed = {row['name']: row['net'] for row in shopping_list_rows(net=True)}
+        self.assertEqual(computed, {'Pasta': 50, 'Uova': 0})
+
+    def test_mark_as_bought(self):
+        PantryItem.objects.create(ingredient=self.pasta, quantity=40, unit=unit('g'))
+        self.client.get(reverse('shopping_list'))
+        etag = self.client.get(reverse('api_shopping_list'))['ETag']
+
+        # Le pianificazioni di un'altra settimana non finiscono in dispensa
+        plan('MON', 'DIN', Recipe.objects.get(), week=weeks.current_week() + weeks.ONE_WEEK)
+
+        with mock.patch('core.pantry.timezone.localdate', return_value=this_week()[0]):
+            with self.assertNumQueries(4):  # SAVEPOINT, lettura netta, INSERT in blocco, RELEASE
+                self.client.post(reverse('shopping_list_bought'))
+            self.assertEqual(self.net(), {'Pasta': (100, 100, 0), 'Uova': (3, 3, 0)})
+        self.assertEqual(
+            set(PantryItem.objects.values_list('ingredient__name', 'quantity', 'unit__name')),
+            {('Pasta', 40, 'g'), ('Pasta', 60, 'g'), ('Uova', 3, 'pz')},
+        )
+        response = self.client.get(reverse('api_shopping_list'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_past_days_are_not_bought(self):
+        monday, _ = this_week()
+        wednesday = monday + datetime.timedelta(days=2)
+        plan('WED', 'DIN', Recipe.objects.get())
+        PantryItem.objects.create(ingredient=self.pasta, quantity=150, unit=unit('g'))
+        with mock.patch('core.pantry.timezone.localdate', return_value=wednesday):
+            pantry.mark_shopping_list_bought(home(), *this_week())
+            # Lunedì è passato: la scorta libera resta tutta a mercoledì
+            self.assertEqual(
+                sorted(PantryItem.objects.values_list('ingredient__name', 'quantity', 'needed_on')),
+                [('Pasta', 150, None), ('Uova', 3, wednesday)],
+            )
+            self.assertEqual(pantry.mark_shopping_list_bought(home(), monday, monday), [])
+
+    def test_stock_is_consumed_in_date_order(self):
+        monday, _ = this_week()
+        next_week = weeks.current_week() + weeks.ONE_WEEK
+        plan('MON', 'DIN', Recipe.objects.get(), week=next_week)
+        PantryItem.objects.create(ingredient=self.pasta, quantity=150, unit=unit('g'))
+        with mock.patch('core.aggregation.timezone.localdate', return_value=monday):
+            self.assertEqual(self.net(), {'Pasta': (100, 150, 0), 'Uova': (3, 0, 3)})
+            # Alla settimana dopo resta solo ciò che non consuma questa
+            self.assertEqual(self.net_of(next_week), {'Pasta': (100, 50, 50), 'Uova': (3, 0, 3)})
+
+            pantry.mark_shopping_list_bought(home(), *this_week())
+            self.assertEqual(self.net(), {'Pasta': (100, 150, 0), 'Uova': (3, 3, 0)})
+            # Le uova comprate per questa settimana non coprono la successiva
+            self.assertEqual(self.net_of(next_week), {'Pasta': (100, 50, 50), 'Uova': (3, 0, 3)})
+            self.assertEqual(
+                list(PantryItem.objects.filter(ingredient=self.eggs).values_list('quantity', 'needed_on')),
+                [(3, monday)],
+            )
+
+    def test_etag_changes_with_the_day(self):
+        monday, _ = this_week()
+        url = f"{reverse('api_shopping_list')}?week={weeks.format_week(weeks.current_week())}"
+        with mock.patch('core.versioning.timezone.localdate', return_value=monday):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+        # Il giorno dopo un lotto può essere scaduto: stessa versione, nuovo ETag
+        with mock.patch('core.versioning.timezone.localdate', return_value=monday + datetime.timedelta(days=1)):
+            self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 200)
+
+
+class RecipeMatrixTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        matrix.invalidate()
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.eggs = Ingredient.objects.create(name='Uova', unit=unit('pezzi'))
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 100), (self.eggs, 2))
+        self.frittata = make_recipe('Frittata', (self.eggs, 4))
+        self.empty = Recipe.objects.create(name='Acqua')
+
+    def test_batch_matches_database_aggregation(self):
+        plan('MON', 'DIN', self.carbonara, self.frittata)
+        plan('TUE', 'LUN', self.carbonara, self.empty)
+        current = {self.carbonara.pk: 2, self.frittata.pk: 1, self.empty.pk: 1}
+
+        results = matrix.evaluate_plans(home(), [current, {self.frittata.pk: 3}, {}])
+
+        expected = build_shopping_list()
+        self.assertEqual(
+            [(r['name'], r['quantity']) for r in results[0]],
+            [(r['name'], r['quantity']) for r in expected],
+        )
+        self.assertEqual([(r['name'], r['quantity']) for r in results[1]], [('Uova', 12)])
+        self.assertEqual(results[2], [])
+
+    def test_matrix_follows_recipe_changes(self):
+        self.assertEqual(matrix.get_matrix(home()).shape, (2, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.filter(recipe=self.frittata).update(quantity=5)
+            RecipeIngredient.objects.get(recipe=self.frittata).save()
+            # Prima del commit resta la matrice dei dati confermati
+            self.assertEqual(matrix.evaluate_plans(home(), [{self.frittata.pk: 1}])[0][0]['quantity'], 4)
+
+        with self.assertNumQueries(1):
+            result = matrix.evaluate_plans(home(), [{self.frittata.pk: 1}])
+        self.assertEqual(result[0][0]['quantity'], 5)
+
+        with self.assertNumQueries(0):
+            matrix.evaluate_plans(home(), [{self.frittata.pk: 1}])
+
+    def test_rolled_back_write_keeps_the_matrix(self):
+        built = matrix.get_matrix(home())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RecipeIngredient.objects.create(recipe=self.empty, ingredient=self.pasta, quantity=10)
+            raise IntegrityError
+        self.assertIs(matrix.get_matrix(home()), built)
+
+    def test_matrix_follows_writes_of_other_processes(self):
+        built = matrix.get_matrix(home())
+        # Un altro processo: nessun segnale qui, solo il timbro condiviso che avanza
+        RecipeIngredient.objects.filter(recipe=self.frittata).update(quantity=5)
+        versioning.bump_all(versioning.RECIPES)
+        rebuilt = matrix.get_matrix(home())
+        self.assertIsNot(rebuilt, built)
+        self.assertEqual(rebuilt.evaluate([{self.frittata.pk: 1}])[0][0]['quantity'], 5)
+
+    def test_api(self):
+        url = reverse('api_plan_evaluate')
+        response = self.client.post(
+            url,
+            json.dumps({'plans': [{str(self.carbonara.pk): 1}, {str(self.frittata.pk): 2}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        lists = response.json()['shopping_lists']
+        self.assertEqual([item['name'] for item in lists[0]], ['Pasta', 'Uova'])
+        self.assertEqual(lists[1][0]['quantity'], 8)
+
+        for body in ('{"plans": 3}', '[1]', 'non json', json.dumps({'plans': [{'x': 1}]})):
+            self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 400)
+        pk = self.carbonara.pk
+        for count in ('NaN', 'Infinity', '-Infinity', '-1', '"nan"'):
+            body = f'{{"plans": [{{"{pk}": {count}}}]}}'
+            response = self.client.post(url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, count)
+            self.assertIn('finiti', response.json()['error'])
+
+        response = self.client.post(url, json.dumps({'plans': [{'999': 1}]}), content_type='application/json')
+        self.assertEqual(response.json()['recipe_ids'], [999])
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+
+# ======================================================================
+# ESPORTAZIONI
+# ======================================================================
+
+class ExportTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        eggs = Ingredient.objects.create(name='Uova', unit=unit('pz'))
+        carbonara = make_recipe('Carbonara, alla romana', (pasta, 100), (eggs, 2))
+        plan('TUE', 'DIN', carbonara)
+        plan('MON', 'LUN', carbonara)
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_shopping_list_exports(self):
+        csv_text = self.content(self.client.get(reverse('export_shopping_list', args=['csv'])))
+        self.assertEqual(csv_text.splitlines(), ['ingrediente,quantita,unita', 'Pasta,200.0,g', 'Uova,4.0,pz'])
+
+        response = self.client.get(reverse('export_shopping_list', args=['json']))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        items = json.loads(self.content(response))
+        self.assertEqual([(i['name'], i['quantity']) for i in items], [('Pasta', 200), ('Uova', 4)])
+
+        self.assertEqual(self.client.get(reverse('export_shopping_list', args=['xml'])).status_code, 404)
+
+    def test_weekly_plan_exports(self):
+        csv_text = self.content(self.client.get(reverse('export_weekly_plan', args=['csv'])))
+        self.assertEqual(csv_text.splitlines()[1:], [
+            f'{day_date("MON")},Lunedì,Pranzo,"Carbonara, alla romana"',
+            f'{day_date("TUE")},Martedì,Cena,"Carbonara, alla romana"',
+        ])
+
+        items = json.loads(self.content(self.client.get(reverse('export_weekly_plan', args=['json']))))
+        self.assertEqual([item['day'] for item in items], ['MON', 'TUE'])
+
+        ics = self.content(self.client.get(reverse('export_weekly_plan', args=['ics'])))
+        self.assertTrue(ics.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(ics.count('BEGIN:VEVENT'), 2)
+        self.assertIn('SUMMARY:Cena: Carbonara\\, alla romana\r\n', ics)
+        self.assertIn(f'DTSTART:{day_date("TUE"):%Y%m%d}T200000\r\n', ics)
+
+    def test_exports_follow_the_requested_range(self):
+        monday = day_date('MON')
+        url = reverse('export_shopping_list', args=['csv'])
+        csv_text = self.content(self.client.get(url, {'start': monday, 'end': monday}))
+        self.assertEqual(csv_text.splitlines()[1:], ['Pasta,100.0,g', 'Uova,2.0,pz'])
+
+        next_week = weeks.format_week(weeks.current_week() + weeks.ONE_WEEK)
+        items = json.loads(self.content(self.client.get(reverse('export_weekly_plan', args=['json']), {'week': next_week})))
+        self.assertEqual(items, [])
+        self.assertEqual(self.client.get(url, {'start': 'ieri'}).status_code, 404)
+
+
+# ======================================================================
+# API JSON CON ETAG
+# ======================================================================
+
+class ReadApiTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('kg'))
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 0.1))
+        plan('WED', 'DIN', self.carbonara)
+
+    def get(self, name, *args, **headers):
+        return self.client.get(reverse(name, args=args), headers=headers)
+
+    def test_payloads(self):
+        days = self.get('api_weekly_plan').json()['days']
+        self.assertEqual(days[2]['meals'][1]['recipes'], [{'id': self.carbonara.pk, 'name': 'Carbonara'}])
+
+        recipe = self.get('api_recipe_detail', self.carbonara.pk).json()
+        self.assertEqual(recipe['ingredients'][0]['unit'], 'kg')
+        self.assertEqual(recipe['ingredients'][0]['base_unit'], 'g')
+        self.assertEqual(self.get('api_recipe_detail', 999).status_code, 404)
+
+        items = self.get('api_shopping_list').json()['items']
+        self.assertEqual([(i['name'], i['quantity'], i['unit']) for i in items], [('Pasta', 100, 'g')])
+
+    def test_not_modified_without_queries(self):
+        for name, args in (('api_weekly_plan', ()), ('api_recipe_detail', (self.carbonara.pk,)),
+                           ('api_shopping_list', ())):
+            with self.subTest(name):
+                response = self.get(name, *args)
+                etag = response['ETag']
+                self.assertFalse(etag.startswith('W/'))
+                with self.assertNumQueries(0):
+                    response = self.get(name, *args, if_none_match=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_survives_cache_eviction(self):
+        # I bump del setUp non arrivano mai al commit (TestCase): si riparte dai timbri salvati
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            plan('THU', 'LUN', self.carbonara)
+        etag = self.get('api_weekly_plan')['ETag']
+        # La cache perde i timbri: si rileggono dal database, non ripartono da capo
+        cache.clear()
+        self.assertEqual(self.get('api_weekly_plan', if_none_match=etag).status_code, 304)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('api_weekly_plan', if_none_match=etag).status_code, 304)
+
+        # Il timbro provvisorio di una transazione resta in cache; al commit va nel database
+        stored = VersionStamp.objects.get(household=home(), scope=versioning.PLAN).stamp
+        with self.captureOnCommitCallbacks() as callbacks:
+            plan('FRI', 'LUN', self.carbonara)
+        self.assertEqual(VersionStamp.objects.get(household=home(), scope=versioning.PLAN).stamp, stored)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            VersionStamp.objects.get(household=home(), scope=versioning.PLAN).stamp,
+            versioning.stamp(home(), versioning.PLAN),
+        )
+        self.assertGreater(versioning.stamp(home(), versioning.PLAN), stored)
+
+    def test_writes_change_the_etag(self):
+        plan_etag = self.get('api_weekly_plan')['ETag']
+        recipe_etag = self.get('api_recipe_detail', self.carbonara.pk)['ETag']
+
+        plan('THU', 'LUN', self.carbonara)
+        self.assertEqual(self.get('api_weekly_plan', if_none_match=plan_etag).status_code, 200)
+        self.assertEqual(
+            self.get('api_recipe_detail', self.carbonara.pk, if_none_match=recipe_etag).status_code, 304
+        )
+
+        RecipeIngredient.objects.filter(recipe=self.carbonara).get().save()
+        self.assertEqual(
+            self.get('api_recipe_detail', self.carbonara.pk, if_none_match=recipe_etag).status_code, 200
+        )
+
+    def test_date_ranges(self):
+        next_week = weeks.current_week() + weeks.ONE_WEEK
+        plan('WED', 'DIN', self.carbonara, week=next_week)
+        url = reverse('api_shopping_list')
+
+        start, end = weeks.current_week(), weeks.week_end(next_week)
+        payload = self.client.get(url, {'start': start, 'end': end}).json()
+        self.assertEqual((payload['start'], payload['end']), (str(start), str(end)))
+        self.assertEqual([(i['name'], i['quantity']) for i in payload['items']], [('Pasta', 200)])
+
+        payload = self.client.get(url, {'week': weeks.format_week(next_week)}).json()
+        self.assertEqual([(i['name'], i['quantity']) for i in payload['items']], [('Pasta', 100)])
+
+        days = self.client.get(reverse('api_weekly_plan'), {'week': weeks.format_week(next_week)}).json()['days']
+        self.assertEqual(days[2]['date'], str(weeks.cell_date(next_week, 'WED')))
+
+        for query in ({'start': end, 'end': start}, {'week': '2026-W99'}, {'start': 'domani'}):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(url, query).status_code, 400)
+
+    def test_range_page_is_one_query(self):
+        start, end = weeks.current_week() - weeks.ONE_WEEK, weeks.week_end(weeks.current_week())
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('shopping_list'), {'start': start, 'end': end})
+        self.assertContains(response, 'Pasta')
+        self.assertEqual(self.client.get(reverse('shopping_list'), {'start': start, 'end': 'x'}).status_code, 404)
+
+
+class AutocompleteTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('Farina 00', 'farro', 'Fagioli', 'Zenzero'):
+            Ingredient.objects.create(name=name, unit=unit('g'))
+        self.lasagne = make_recipe('Lasagne', (Ingredient.objects.get(name='Farina 00'), 200))
+        make_recipe('Lenticchie')
+
+    def search(self, name, q, **params):
+        return self.client.get(reverse(name), {'q': q, **params}).json()['results']
+
+    def test_case_insensitive_prefix(self):
+        results = self.search('api_ingredient_autocomplete', 'FAR')
+        self.assertEqual([r['text'] for r in results], ['Farina 00 (g)', 'farro (g)'])
+        self.assertEqual(
+            [r['text'] for r in self.search('api_recipe_autocomplete', 'la')], ['Lasagne'],
+        )
+        self.assertEqual(len(self.search('api_ingredient_autocomplete', 'f', limit=1)), 1)
+
+    def test_accented_initial(self):
+        Ingredient.objects.create(name='Èrba cipollina', unit=unit('g'))
+        make_recipe('Òrzo  al pesto')
+        for q in ('èr', 'ÈR', 'Èrba'):
+            self.assertEqual(
+                [r['text'] for r in self.search('api_ingredient_autocomplete', q)], ['Èrba cipollina (g)'],
+            )
+        self.assertEqual([r['text'] for r in self.search('api_recipe_autocomplete', 'òrzo al')], ['Òrzo  al pesto'])
+        # Anche le scritture in blocco riempiono la colonna
+        Ingredient.objects.bulk_create([Ingredient(name='Élite', unit=unit('g'))])
+        self.assertEqual(Ingredient.objects.get(name='Élite').name_ci, 'élite')
+
+    def test_hot_prefix_cache_follows_recipe_version(self):
+        first = autocomplete.search(home(), 'recipes', 'le')
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.search(home(), 'recipes', 'LE'), first)
+        Recipe.objects.create(name='Lenticchie in umido')
+        self.assertEqual(len(self.search('api_recipe_autocomplete', 'le')), 2)
+
+    def test_formsets_render_only_selected_options(self):
+        response = self.client.get(reverse('recipe_detail', args=[self.lasagne.pk]))
+        select = response.content.decode().split('name="ingredients_list-0-ingredient"')[1].split('</select>')[0]
+        self.assertEqual(select.count('<option'), 2)
+        self.assertIn('Farina 00 (g)', select)
+        self.assertNotIn('Zenzero', response.content.decode())
+
+        slot = plan('MON', 'DIN', self.lasagne)
+        response = self.client.get(reverse('meal_slot_update', args=[slot.pk]))
+        self.assertNotIn('Lenticchie', response.content.decode())
+        self.assertIn('Lasagne', response.content.decode())
+
+
+class RecipeSearchTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pomodoro = Ingredient.objects.create(name='Pomodoro', unit=unit('g'))
+        self.uova = Ingredient.objects.create(name='Uova', unit=unit('pz'))
+        make_recipe('Pasta al pomodoro', (self.pomodoro, 200))
+        make_recipe('Frittata', (self.uova, 3))
+        make_recipe('Shakshuka', (self.pomodoro, 300), (self.uova, 2))
+
+    def names(self, text, **kwargs):
+        return [r.name for r in search.search_recipes(home(), text, **kwargs).recipes]
+
+    def test_name_and_ingredient_matches(self):
+        self.assertEqual(self.names('pomod'), ['Pasta al pomodoro', 'Shakshuka'])
+        self.assertEqual(self.names('uova pomodoro'), ['Shakshuka'])
+        # Il nome pesa più degli ingredienti
+        self.assertEqual(self.names('pomodoro', order=search.ORDER_RANK)[0], 'Pasta al pomodoro')
+        self.assertEqual(self.names('"; DROP TABLE core_recipe; --'), [])
+
+    def test_index_follows_writes(self):
+        self.pomodoro.name = 'Pelati'
+        self.pomodoro.save()
+        self.assertEqual(self.names('pelati'), ['Pasta al pomodoro', 'Shakshuka'])
+        RecipeIngredient.objects.filter(ingredient=self.uova).delete()
+        self.assertEqual(self.names('uova'), [])
+        Recipe.objects.filter(name='Frittata').update(name='Omelette')
+        self.assertEqual(self.names('omel'), ['Omelette'])
+        Recipe.objects.filter(name='Omelette').delete()
+        self.assertEqual(self.names('omel'), [])
+
+    @skipUnless(search.fts_available(), "FTS5 solo su SQLite")
+    def test_index_is_filtered_by_household(self):
+        other = Household.objects.create(name='Altra casa', slug='altra')
+        Recipe.objects.create(name='Pomodori ripieni', household=other)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT household FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} MATCH 'ripieni'")
+            self.assertEqual(cursor.fetchall(), [(f'h{other.pk}',)])
+        for order in (search.ORDER_NAME, search.ORDER_RANK):
+            with self.subTest(order=order):
+                self.assertEqual(self.names('pomod', order=order)[-1], 'Shakshuka')
+                found = search.search_recipes(other.pk, 'pomod', order=order).recipes
+                self.assertEqual([r.name for r in found], ['Pomodori ripieni'])
+
+    def test_keyset_pages(self):
+        Recipe.objects.bulk_create(Recipe(name=f'Zuppa {i:02d}') for i in range(5))
+        for order in (search.ORDER_NAME, search.ORDER_RANK):
+            with self.subTest(order=order):
+                seen, page = [], search.search_recipes(home(), 'zuppa', order=order, limit=2)
+                while True:
+                    seen += [r.name for r in page.recipes]
+                    if page.next_after is None:
+                        break
+                    page = search.search_recipes(
+                        home(), 'zuppa', after=page.next_after, score=page.next_score, order=order, limit=2,
+                    )
+                self.assertEqual(seen, [f'Zuppa {i:02d}' for i in range(5)])
+
+    def test_management_page(self):
+        response = self.client.get(reverse('recipe_management'), {'q': 'uova'})
+        self.assertEqual([r.name for r in response.context['recipes']], ['Frittata', 'Shakshuka'])
+        self.assertIsNone(response.context['next_url'])
+
+
+class PlanGeneratorTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        a, b, c, d, e = (
+            Ingredient.objects.create(name=name, unit=unit('g')) for name in 'abcde'
+        )
+        self.x = make_recipe('X', (a, 100), (b, 100))
+        self.y = make_recipe('Y', (a, 50), (b, 50))
+        self.z = make_recipe('Z', (c, 10), (d, 10))
+        self.w = make_recipe('W', (a, 10), (e, 10))
+
+    def generate(self, cells, planned=(), **options):
+        return planner.PlanGenerator(matrix.RecipeIngredientMatrix.from_database(home()), **options).generate(cells, planned)
+
+    def test_prefers_overlapping_recipes(self):
+        result = self.generate([('MON', 'LUN'), ('TUE', 'LUN')], no_repeat_days=7)
+        self.assertEqual(set(result.assignments.values()), {self.x.pk, self.y.pk})
+        self.assertEqual(result.distinct_ingredients, 2)
+
+        result = self.generate([('MON', 'LUN'), ('TUE', 'LUN')], no_repeat_days=7,
+                               objective=planner.OBJECTIVE_QUANTITY)
+        self.assertEqual(set(result.assignments.values()), {self.z.pk, self.w.pk})
+
+    def test_no_repeat_rule_and_planned_recipes(self):
+        cells = [(day, 'DIN') for day, _ in DAY_CHOICES]
+        # Senza vincolo conviene ripetere sempre la stessa ricetta
+        result = self.generate(cells, no_repeat_days=0)
+        self.assertEqual(len(set(result.assignments.values())), 1)
+        self.assertEqual(result.distinct_ingredients, 2)
+
+        result = self.generate(cells, planned=[(self.x.pk, 0)], no_repeat_days=7)
+        self.assertNotIn(self.x.pk, result.assignments.values())
+        self.assertEqual(len(result.assignments), 3)
+        self.assertEqual(len(result.unfilled), 4)
+
+        result = self.generate(cells, no_repeat_days=2)
+        days = {recipe_id: [] for recipe_id in result.assignments.values()}
+        for (day, _), recipe_id in result.assignments.items():
+            days[recipe_id].append(weeks.DAY_OFFSETS[day])
+        for indexes in days.values():
+            self.assertTrue(all(b - a >= 2 for a, b in zip(indexes, indexes[1:])))
+
+    def test_previous_week_counts_for_the_no_repeat_rule(self):
+        week = weeks.current_week()
+        plan('SUN', 'DIN', self.x, week=week - weeks.ONE_WEEK)
+        self.assertEqual(planner.planned_recipes(home(), week, lookback_days=3), [(self.x.pk, -1)])
+        self.assertEqual(planner.planned_recipes(home(), week), [])
+
+    def test_view_fills_only_empty_cells(self):
+        plan('MON', 'LUN', self.z)
+        self.client.post(reverse('generate_weekly_plan'), {'objective': 'ingredients', 'no_repeat_days': 0})
+        self.assertEqual(MealRecipe.objects.count(), 28)
+        self.assertEqual(MealSlot.objects.get(date=day_date('MON'), meal_type='LUN').recipes.get().recipe, self.z)
+        self.assertEqual(materialized.diff(), [])
+
+    def test_apply_plan_writes_in_bulk(self):
+        plan('MON', 'LUN', self.z)
+        week = weeks.current_week()
+        result = planner.generate_plan(home(), week, no_repeat_days=0)
+        self.assertEqual(len(result.assignments), 27)
+        with self.assertNumQueries(15):
+            planner.apply_plan(home(), result, week)
+        self.assertEqual(MealRecipe.objects.count(), 28)
+        self.assertEqual(materialized.diff(), [])
+
+    def test_command_dry_run(self):
+        out = StringIO()
+        call_command('generate_plan', '--dry-run', '--no-repeat-days', '7', stdout=out)
+        self.assertIn('4 pasti proposti', out.getvalue())
+        self.assertFalse(MealRecipe.objects.exists())
+
+
+class SuggestionIndexTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pasta, self.uova, self.guanciale, self.riso = (
+            Ingredient.objects.create(name=name, unit=unit('g'))
+            for name in ('Pasta', 'Uova', 'Guanciale', 'Riso')
+        )
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 100), (self.uova, 2), (self.guanciale, 50))
+        self.gricia = make_recipe('Gricia', (self.pasta, 100), (self.guanciale, 50))
+        self.risotto = make_recipe('Risotto', (self.riso, 80))
+
+    def test_top_k_by_overlap(self):
+        index = suggestions.get_index(home())
+        on_list = [self.pasta.pk, self.guanciale.pk]
+        # A parità di ingredienti in comune vince chi richiede meno acquisti
+        self.assertEqual(index.top_k(on_list), [(self.gricia.pk, 2), (self.carbonara.pk, 2)])
+        self.assertEqual(index.top_k(on_list, exclude=[self.gricia.pk], k=1), [(self.carbonara.pk, 2)])
+        stats = index.stats()
+        self.assertEqual((stats['recipes'], stats['ingredients'], stats['postings']), (3, 4, 6))
+        self.assertGreater(stats['memory_bytes'], 0)
+
+    def test_incremental_refresh(self):
+        index = suggestions.get_index(home())
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(recipe=self.risotto, ingredient=self.guanciale, quantity=20)
+            self.assertNotIn(self.risotto.pk, index.postings[self.guanciale.pk])
+        self.assertIn(self.risotto.pk, index.postings[self.guanciale.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.filter(recipe=self.risotto, ingredient=self.riso).delete()
+        self.assertNotIn(self.riso.pk, index.postings)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gricia.delete()
+        self.assertNotIn(self.gricia.pk, index.recipes)
+        self.assertIs(suggestions.get_index(home()), index)
+
+    def test_rolled_back_write_leaves_no_postings(self):
+        index = suggestions.get_index(home())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RecipeIngredient.objects.create(recipe=self.risotto, ingredient=self.uova, quantity=1)
+            raise IntegrityError
+        self.assertNotIn(self.risotto.pk, index.postings[self.uova.pk])
+        self.assertIs(suggestions.get_index(home()), index)
+
+    def test_index_follows_writes_of_other_processes(self):
+        index = suggestions.get_index(home())
+        # Un altro processo: nessun segnale qui, solo il timbro condiviso che avanza
+        RecipeIngredient.objects.filter(recipe=self.risotto).update(ingredient=self.pasta)
+        versioning.bump_all(versioning.RECIPES)
+        rebuilt = suggestions.get_index(home())
+        self.assertIsNot(rebuilt, index)
+        self.assertIn(self.risotto.pk, rebuilt.postings[self.pasta.pk])
+
+    def test_slot_page_suggests_recipes_using_the_shopping_list(self):
+        slot = plan('MON', 'DIN', self.carbonara)
+        response = self.client.get(reverse('meal_slot_update', args=[slot.pk]))
+        found = [(s.name, s.matched, s.total) for s in response.context['suggestions']]
+        self.assertEqual(found, [('Gricia', 2, 2)])
+
+
+class AsyncViewTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.carbonara = make_recipe('Carbonara', (pasta, 100))
+        plan('MON', 'DIN', self.carbonara)
+
+    async def test_read_views_under_async_client(self):
+        response = await self.async_client.get(reverse('api_shopping_list'))
+        self.assertEqual(response.json()['items'][0]['net'], 100)
+        response = await self.async_client.get(reverse('api_recipe_detail', args=[self.carbonara.pk]))
+        self.assertEqual(response.json()['name'], 'Carbonara')
+        response = await self.async_client.get(reverse('api_recipe_detail', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get(reverse('weekly_plan'))
+        self.assertContains(response, 'Carbonara')
+        cached = await self.async_client.get(reverse('shopping_list'), headers={'if-none-match': '"x"'})
+        self.assertContains(cached, 'Pasta')
+
+
+class DatabaseRoutingTests(CoreTestCase):
+
+    def test_connection_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -20000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_reads_routed_only_inside_read_only_views(self):
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+        with routers.reading():
+            # Dentro una transazione (come in ogni TestCase) si legge da default
+            self.assertEqual(router.db_for_read(Recipe), 'default')
+            with mock.patch.object(connection, 'in_atomic_block', False):
+                self.assertEqual(router.db_for_read(Recipe), routers.READ_ALIAS)
+                self.assertEqual(router.db_for_write(Recipe), 'default')
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(router.db_for_read(Recipe), 'default')
+
+
+class MetricsTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        plan('MON', 'DIN', make_recipe('Carbonara', (pasta, 100)))
+
+    def test_histograms_per_view(self):
+        self.client.get(reverse('weekly_plan'))
+        self.client.get(reverse('api_shopping_list'))
+
+        queries = metrics.registry.get('core_request_queries', 'weekly_plan')
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.sum, 0)
+        self.assertGreater(metrics.registry.get('core_request_template_seconds', 'weekly_plan').sum, 0)
+        self.assertEqual(metrics.registry.get('core_request_template_seconds', 'api_shopping_list').sum, 0)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('# TYPE core_request_duration_seconds histogram', text)
+        self.assertIn('core_request_duration_seconds_bucket{view="weekly_plan",le="+Inf"} 1', text)
+        self.assertIn('core_request_queries_count{view="api_shopping_list"} 1', text)
+
+    async def test_async_views_count_queries(self):
+        await self.async_client.get(reverse('api_weekly_plan'))
+        self.assertGreater(metrics.registry.get('core_request_queries', 'api_weekly_plan').sum, 0)
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_logs_queries(self):
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.client.get(reverse('shopping_list'))
+        self.assertIn('shopping_list', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_streaming_responses_are_measured_until_closed(self):
+        response = self.client.get(reverse('export_shopping_list', args=['csv']))
+        self.assertIsNone(metrics.registry.get('core_request_queries', 'export_shopping_list'))
+        content = b''.join(response.streaming_content)
+        response.close()
+        self.assertIn(b'Pasta', content)
+        queries = metrics.registry.get('core_request_queries', 'export_shopping_list')
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.sum, 0)
+        # Chiusa senza essere letta: la misura si chiude comunque, una volta
+        self.client.get(reverse('export_weekly_plan', args=['json'])).close()
+        self.assertEqual(metrics.registry.get('core_request_queries', 'export_weekly_plan').count, 1)
+
+    async def test_async_streaming_is_measured(self):
+        async def rows():
+            yield 'a'
+            yield 'b'
+
+        response = StreamingHttpResponse(rows())
+        closed = []
+        metrics.measure_stream(metrics.RequestStats(), response, lambda: closed.append(True))
+        self.assertTrue(response.is_async)
+        self.assertEqual([chunk async for chunk in response.streaming_content], [b'a', b'b'])
+        self.assertEqual(closed, [True])
+
+    def test_metrics_are_for_staff_and_internal_ips(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 200)  # 127.0.0.1
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.7').status_code, 403)
+        user = get_user_model().objects.create_user('ops', password='x', is_staff=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.7').status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(reverse('weekly_plan'))
+        self.assertIsNone(metrics.registry.get('core_request_queries', 'weekly_plan'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class HtmlCacheValidationTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.carbonara = make_recipe('Carbonara', (pasta, 100))
+        plan('MON', 'DIN', self.carbonara)
+
+    def test_conditional_get(self):
+        for name in ('weekly_plan', 'shopping_list', 'recipe_management'):
+            with self.subTest(name):
+                self.client.get(reverse(name))  # riceve il cookie CSRF
+                response = self.client.get(reverse(name))
+                self.assertIn('Last-Modified', response)
+                with self.assertNumQueries(0):
+                    response = self.client.get(reverse(name), headers={'if-none-match': response['ETag']})
+                self.assertEqual(response.status_code, 304)
+
+    def test_rendered_page_is_cached_per_version(self):
+        url = reverse('shopping_list')
+        self.client.get(url)  # riceve il cookie CSRF (la pagina ha un form)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, '100 g')
+
+        plan('TUE', 'DIN', self.carbonara)
+        self.assertContains(self.client.get(url), '200 g')
+
+    def test_pages_with_forms_are_cached_per_csrf_cookie(self):
+        url = reverse('weekly_plan')
+        self.assertIn('csrftoken', self.client.get(url).cookies)
+        # Senza cookie la pagina non va in cache; con il cookie sì
+        with self.assertNumQueries(2):
+            first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+
+        other = self.client_class()
+        with self.assertNumQueries(2):
+            other.get(url)
+
+        self.carbonara.name = 'Amatriciana'
+        self.carbonara.save()
+        self.assertContains(self.client.get(url), 'Amatriciana')
+
+    def test_default_week_changes_cache_key_and_etag(self):
+        next_monday = weeks.current_week() + weeks.ONE_WEEK
+        for name in ('weekly_plan', 'shopping_list', 'api_weekly_plan', 'api_shopping_list'):
+            with self.subTest(name):
+                url = reverse(name)
+                self.client.get(url)  # riceve il cookie CSRF
+                response = self.client.get(url)
+                etag, modified = response['ETag'], response.get('Last-Modified')
+                with mock.patch('core.weeks.timezone.localdate', return_value=next_monday):
+                    response = self.client.get(url, headers={'if-none-match': etag})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotContains(response, 'Pasta' if 'shopping' in name else 'Carbonara')
+                    if modified:
+                        response = self.client.get(url, headers={'if-modified-since': modified})
+                        self.assertEqual(response.status_code, 200)
+
+
+# ======================================================================
+# NUCLEI FAMILIARI
+# ======================================================================
+
+class HouseholdTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = Household.objects.create(name='Altra', slug='altra')
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 100))
+        plan('MON', 'DIN', self.carbonara)
+
+        # Stessi nomi nell'altro nucleo, con dosi diverse
+        self.other_pasta = Ingredient.objects.create(household=self.other, name='Pasta', unit=unit('g'))
+        self.other_carbonara = Recipe.objects.create(household=self.other, name='Carbonara')
+        RecipeIngredient.objects.create(recipe=self.other_carbonara, ingredient=self.other_pasta, quantity=300)
+        slot = MealSlot.objects.create(household=self.other, date=day_date('MON'), meal_type='DIN')
+        MealRecipe.objects.create(meal_slot=slot, recipe=self.other_carbonara)
+
+        self.member = get_user_model().objects.create_user('altro', password='x')
+        self.other.members.add(self.member)
+
+    def login_other(self):
+        self.client.force_login(self.member)
+
+    def test_names_are_unique_per_household(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Recipe.objects.create(name='Carbonara')
+        self.client.post(reverse('recipe_create'), {
+            'name': 'Carbonara', 'ingredients_list-TOTAL_FORMS': 0, 'ingredients_list-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(Recipe.objects.filter(name='Carbonara').count(), 2)
+
+    def test_lists_are_per_household(self):
+        self.assertEqual(
+            [(row['name'], row['quantity']) for row in materialized.materialized_shopping_list(home(), *this_week())],
+            [('Pasta', 100)],
+        )
+        self.assertEqual(
+            [(row['name'], row['quantity']) for row in materialized.materialized_shopping_list(self.other.pk, *this_week())],
+            [('Pasta', 300)],
+        )
+        self.assertEqual(materialized.diff(), [])
+
+    def test_views_and_api_see_only_the_session_household(self):
+        self.login_other()
+        items = self.client.get(reverse('api_shopping_list')).json()['items']
+        self.assertEqual([(i['name'], i['quantity']) for i in items], [('Pasta', 300)])
+        days = self.client.get(reverse('api_weekly_plan')).json()['days']
+        self.assertEqual(days[0]['meals'][1]['recipes'], [{'id': self.other_carbonara.pk, 'name': 'Carbonara'}])
+
+        self.assertEqual(self.client.get(reverse('recipe_detail', args=[self.carbonara.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_recipe_detail', args=[self.carbonara.pk])).status_code, 404)
+        response = self.client.get(reverse('api_recipe_autocomplete'), {'q': 'carb'})
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.other_carbonara.pk])
+        response = self.client.get(reverse('recipe_management'), {'q': 'pasta'})
+        self.assertEqual([r.pk for r in response.context['recipes']], [self.other_carbonara.pk])
+
+    def test_formsets_only_accept_own_recipes(self):
+        self.login_other()
+        response = self.client.post(reverse('meal_slot_create', args=[day_date('TUE'), 'LUN']), {
+            'recipes-TOTAL_FORMS': 1, 'recipes-INITIAL_FORMS': 0, 'recipes-0-recipe': self.carbonara.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(MealSlot.objects.filter(household=self.other, date=day_date('TUE')).exists())
+
+    def test_writes_leave_other_households_cached(self):
+        etag = self.client.get(reverse('api_weekly_plan'))['ETag']
+        own_matrix = matrix.get_matrix(home())
+
+        RecipeIngredient.objects.filter(recipe=self.other_carbonara).update(quantity=1)
+        RecipeIngredient.objects.get(recipe=self.other_carbonara).save()
+        MealRecipe.objects.filter(meal_slot__household=self.other).delete()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api_weekly_plan'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertIs(matrix.get_matrix(home()), own_matrix)
+
+        plan('TUE', 'DIN', self.carbonara)
+        self.assertEqual(self.client.get(reverse('api_weekly_plan'), headers={'if-none-match': etag}).status_code, 200)
+
+    def test_unit_changes_reach_every_household(self):
+        before = versioning.get_versions(self.other.pk, versioning.RECIPES)[versioning.RECIPES]
+        unit('kg').save()
+        self.assertGreater(versioning.get_versions(self.other.pk, versioning.RECIPES)[versioning.RECIPES], before)
+        self.assertEqual(materialized.diff(), [])
+
+    def test_switch_requires_membership(self):
+        url = reverse('household_switch', args=['altra'])
+        self.assertEqual(self.client.post(url).status_code, 404)
+
+        stranger = get_user_model().objects.create_user('estraneo', password='x')
+        self.client.force_login(stranger)
+        self.assertEqual(self.client.post(url).status_code, 404)
+        # Senza appartenenze resta il nucleo predefinito
+        self.assertEqual(self.client.session[tenancy.SESSION_KEY], home())
+
+        Household.objects.get(pk=home()).members.add(self.member)
+        self.login_other()
+        self.assertEqual(self.client.session.get(tenancy.SESSION_KEY), None)
+        self.client.get(reverse('weekly_plan'))
+        self.assertEqual(self.client.session[tenancy.SESSION_KEY], home())
+        self.assertRedirects(self.client.post(url), reverse('weekly_plan'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session[tenancy.SESSION_KEY], self.other.pk)
+
+    def test_admin_lists_only_member_households(self):
+        self.member.is_staff = True
+        self.member.save()
+        self.member.user_permissions.add(Permission.objects.get(codename='view_recipe'))
+        self.login_other()
+        response = self.client.get(reverse('admin:core_recipe_changelist'))
+        self.assertEqual([r.pk for r in response.context['cl'].result_list], [self.other_carbonara.pk])
+
+    def test_recipe_and_ingredient_must_share_the_household(self):
+        dose = RecipeIngredient(recipe=self.carbonara, ingredient=self.other_pasta, quantity=10)
+        with self.assertRaises(ValidationError) as raised:
+            dose.full_clean()
+        self.assertIn('ingredient', raised.exception.message_dict)
+
+    def test_admin_keeps_edits_inside_the_household(self):
+        self.member.is_staff = True
+        self.member.save()
+        Household.objects.get(pk=home()).members.add(self.member)
+        self.member.user_permissions.add(*Permission.objects.filter(codename__in=(
+            'view_recipe', 'change_recipe', 'add_recipeingredient', 'change_recipeingredient',
+        )))
+        self.login_other()
+        url = reverse('admin:core_recipe_change', args=[self.other_carbonara.pk])
+        response = self.client.get(url)
+        self.assertNotIn('household', response.context['adminform'].form.fields)
+        choices = response.context['inline_admin_formsets'][0].formset.forms[0].fields['ingredient'].queryset
+        self.assertEqual(list(choices), [self.other_pasta])
+
+        # Un ingrediente di un altro nucleo viene rifiutato anche se inviato a mano
+        dose = RecipeIngredient.objects.get(recipe=self.other_carbonara)
+        response = self.client.post(url, {
+            'name': 'Carbonara', 'servings': 4,
+            'ingredients_list-TOTAL_FORMS': 1, 'ingredients_list-INITIAL_FORMS': 1,
+            'ingredients_list-0-id': dose.pk, 'ingredients_list-0-recipe': self.other_carbonara.pk,
+            'ingredients_list-0-ingredient': self.pasta.pk, 'ingredients_list-0-quantity': 10,
+        })
+        self.assertEqual(response.status_code, 200)
+        dose.refresh_from_db()
+        self.assertEqual(dose.ingredient, self.other_pasta)
+        self.assertEqual(materialized.diff(), [])
+
+    def test_structures_in_memory_are_bounded(self):
+        built = []
+        items = tenancy.PerHousehold(lambda household_id: built.append(household_id) or household_id, maxsize=2)
+        for household_id in (1, 2, 1, 3, 1, 2):
+            items.get(household_id)
+        self.assertEqual(built, [1, 2, 3, 2])
+        self.assertEqual(len(items), 2)
+        items.discard()
+        self.assertIsNone(items.peek(1))
+
+
+# ======================================================================
+# IMPORTAZIONE RICETTE
+# ======================================================================
+
+class ImportRecipesTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        Ingredient.objects.create(name='Pasta', unit=unit('g'))
+
+    def write(self, name, content):
+        path = Path(self.tmp.name) / name
+        path.write_text(content, encoding='utf-8')
+        return str(path)
+
+    def test_csv_import(self):
+        path = self.write('ricette.csv', (
+            'recipe,ingredient,quantity,unit\n'
+            'Carbonara,Pasta,0.1,kg\n'
+            'Carbonara,Uova,2,pezzi\n'
+            'Carbonara,Uova,1,\n'
+            'Frittata,Uova,4,\n'
+        ))
+        out = StringIO()
+        call_command('import_recipes', path, '--batch-size', '1', stdout=out)
+
+        self.assertIn('righe/s', out.getvalue())
+        carbonara = Recipe.objects.get(name='Carbonara')
+        doses = {ri.ingredient.name: ri.quantity for ri in carbonara.ingredients_list.select_related('ingredient')}
+        self.assertEqual(doses, {'Pasta': 100, 'Uova': 3})
+        self.assertEqual(Ingredient.objects.get(name='Uova').unit, unit('pezzi'))
+        self.assertEqual(Path(path + '.checkpoint').read_text(), '2')
+
+        # Reimportare lo stesso file non duplica nulla
+        call_command('import_recipes', path, stdout=StringIO())
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_jsonl_import_and_resume(self):
+        good = json.dumps({'name': 'Porridge', 'ingredients': [{'name': 'Avena', 'quantity': 50, 'unit': 'g'}]})
+        bad = json.dumps({'name': 'Rotta', 'ingredients': [{'name': 'Pasta', 'quantity': 1, 'unit': 'ml'}]})
+        path = self.write('ricette.jsonl', f'{good}\n{bad}\n')
+
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', path, '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(list(Recipe.objects.values_list('name', flat=True)), ['Porridge'])
+
+        fixed = json.dumps({'name': 'Rotta', 'ingredients': [{'name': 'Pasta', 'quantity': 1, 'unit': 'hg'}]})
+        self.write('ricette.jsonl', f'{good}\n{fixed}\n')
+        # Nucleo (1) + caricamento cache (2) + un blocco: ricette esistenti, ricette, dosi,
+        # totali nutrizionali, costi (+ savepoint) + timbro del ricettario
+        with self.assertNumQueries(11):
+            call_command('import_recipes', path, '--resume', stdout=StringIO())
+        self.assertEqual(RecipeIngredient.objects.get(recipe__name='Rotta').quantity, 100)
+
+
+# ======================================================================
+# GRIGLIA SETTIMANALE
+# ======================================================================
+
+class WeeklyGridTests(CoreTestCase):
+
+    def test_grid_layout(self):
+        carbonara = Recipe.objects.create(name='Carbonara')
+        plan('TUE', 'DIN', carbonara)
+        MealSlot.objects.create(date=day_date('SUN'), meal_type='BRK')
+        # Gli slot di altre settimane non compaiono nella griglia
+        plan('TUE', 'LUN', carbonara, week=weeks.current_week() - weeks.ONE_WEEK)
+
+        grid = build_weekly_grid(home(), weeks.current_week())
+
+        self.assertEqual([day['code'] for day in grid], [code for code, _ in DAY_CHOICES])
+        tuesday = grid[1]['cells']
+        self.assertEqual([cell['meal_type'] for cell in tuesday], [code for code, _ in MEAL_TYPE_CHOICES])
+        self.assertEqual(tuesday[1]['recipes'], [carbonara])
+        self.assertEqual(tuesday[1]['date'], day_date('TUE'))
+        self.assertIsNone(tuesday[0]['slot'])
+        sunday_breakfast = grid[6]['cells'][2]
+        self.assertIsNotNone(sunday_breakfast['slot'])
+        self.assertEqual(sunday_breakfast['recipes'], [])
+
+    def test_query_count_is_constant(self):
+        fill_week(recipes_per_slot=5)
+
+        with self.assertNumQueries(2):
+            grid = build_weekly_grid(home(), weeks.current_week())
+        self.assertTrue(all(len(cell['recipes']) == 5 for day in grid for cell in day['cells']))
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('weekly_plan'))
+        self.assertContains(response, 'Ricetta 4')
+
+    def test_weeks_at_the_calendar_edges_are_rejected(self):
+        for params in ({'week': '9999-W52'}, {'week': '0001-W01'}, {'week': '9999-12-30'}):
+            self.assertEqual(self.client.get(reverse('weekly_plan'), params).status_code, 404)
+            self.assertEqual(self.client.get(reverse('api_weekly_plan'), params).status_code, 400)
+        for params in ({'start': '9999-12-30'}, {'start': '2026-01-01', 'end': '9999-12-31'}):
+            self.assertEqual(self.client.get(reverse('shopping_list'), params).status_code, 404)
+            self.assertEqual(self.client.get(reverse('api_shopping_list'), params).status_code, 400)
+        self.assertEqual(weeks.parse_week('9999-W50'), datetime.date(9999, 12, 13))
+        self.assertEqual(self.client.get(reverse('weekly_plan'), {'week': '9999-W50'}).status_code, 200)
+
+
+class WeeklyGridFragmentCacheTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.carbonara = Recipe.objects.create(name='Carbonara')
+        self.monday = plan('MON', 'DIN', self.carbonara)
+        self.tuesday = plan('TUE', 'DIN', Recipe.objects.create(name='Frittata'))
+
+    def cell_key(self, slot):
+        slot.refresh_from_db()
+        return make_template_fragment_key('plan_cell', [slot.pk, slot.revision])
+
+    def test_editing_a_slot_invalidates_only_its_cell(self):
+        self.client.get(reverse('weekly_plan'))
+        monday_key, tuesday_key = self.cell_key(self.monday), self.cell_key(self.tuesday)
+        self.assertIsNotNone(caches['fragments'].get(monday_key))
+
+        porridge = Recipe.objects.create(name='Porridge')
+        self.client.post(reverse('meal_slot_update', args=[self.monday.pk]), {
+            'recipes-TOTAL_FORMS': '1', 'recipes-INITIAL_FORMS': '0',
+            'recipes-0-recipe': porridge.pk,
+        })
+
+        self.assertNotEqual(self.cell_key(self.monday), monday_key)
+        self.assertEqual(self.cell_key(self.tuesday), tuesday_key)
+        self.assertContains(self.client.get(reverse('weekly_plan')), 'Porridge')
+
+    def test_recipe_rename_invalidates_cells_showing_it(self):
+        tuesday_key = self.cell_key(self.tuesday)
+        self.carbonara.name = 'Amatriciana'
+        self.carbonara.save()
+        self.assertEqual(self.cell_key(self.tuesday), tuesday_key)
+        self.assertContains(self.client.get(reverse('weekly_plan')), 'Amatriciana')
+
+    def test_saving_without_rename_keeps_the_cells(self):
+        monday_key = self.cell_key(self.monday)
+        self.carbonara.servings = 2
+        self.carbonara.save()
+        self.assertEqual(self.cell_key(self.monday), monday_key)
+
+    def test_empty_cells_are_rendered_without_the_cache(self):
+        response = self.client.get(reverse('weekly_plan'))
+        self.assertContains(response, reverse('meal_slot_create', args=[day_date('WED'), 'DIN']))
+        self.assertIsNone(caches['fragments'].get(make_template_fragment_key('plan_cell_empty', [day_date('WED'), 'DIN'])))
+
+
+class MealSlotCreateTests(CoreTestCase):
+
+    def test_get_does_not_create_the_slot(self):
+        response = self.client.get(reverse('meal_slot_create', args=[day_date('MON'), 'DIN']))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(MealSlot.objects.exists())
+
+    def test_post_creates_the_slot(self):
+        carbonara = Recipe.objects.create(name='Carbonara')
+        response = self.client.post(reverse('meal_slot_create', args=[day_date('MON'), 'DIN']), {
+            'recipes-TOTAL_FORMS': '1', 'recipes-INITIAL_FORMS': '0',
+            'recipes-0-recipe': carbonara.pk,
+        })
+        self.assertRedirects(response, f"{reverse('weekly_plan')}?week={weeks.format_week(weeks.current_week())}")
+        slot = MealSlot.objects.get(date=day_date('MON'), meal_type='DIN')
+        self.assertEqual(list(MealRecipe.objects.filter(meal_slot=slot).values_list('recipe', flat=True)), [carbonara.pk])
+
+
+class WeekEditorTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pasta = Ingredient.objects.create(name='Pasta', unit=unit('g'))
+        self.carbonara = make_recipe('Carbonara', (self.pasta, 100))
+        self.lasagne = make_recipe('Lasagne', (self.pasta, 150))
+        self.frittata = Recipe.objects.create(name='Frittata')
+        self.monday = plan('MON', 'DIN', self.carbonara, self.lasagne)
+        self.tuesday = plan('TUE', 'DIN', self.frittata)
+
+    def post(self, cells):
+        """POST del form con {(day, meal_type): [ricette]}; le altre celle restano vuote."""
+        data = {f'{day}_{meal_type}': [r.pk for r in recipes] for (day, meal_type), recipes in cells.items()}
+        return self.client.post(reverse('week_edit'), data)
+
+    def planned(self, week=None):
+        rows = MealRecipe.objects.filter(meal_slot__date__range=weeks.week_range(week or weeks.current_week()))
+        return sorted(
+            (weeks.day_code(date), meal_type, name)
+            for date, meal_type, name in rows.values_list('meal_slot__date', 'meal_slot__meal_type', 'recipe__name')
+        )
+
+    def test_diff_contains_only_changes(self):
+        changes = week_editor.diff(
+            week_editor.current_assignments(home(), weeks.current_week()),
+            {('MON', 'DIN'): [self.carbonara.pk, self.frittata.pk], ('WED', 'LUN'): [self.lasagne.pk]},
+        )
+        self.assertEqual(changes.inserts, [
+            (('MON', 'DIN'), self.frittata.pk), (('WED', 'LUN'), self.lasagne.pk),
+        ])
+        self.assertEqual(changes.deletes, [(('MON', 'DIN'), self.lasagne.pk)])
+
+    def test_get_shows_current_plan(self):
+        response = self.client.get(reverse('week_edit'))
+        self.assertContains(response, 'Carbonara')
+        self.assertContains(response, 'Frittata')
+
+    def test_post_applies_the_week(self):
+        kept = MealRecipe.objects.get(meal_slot=self.monday, recipe=self.carbonara)
+        monday_revision = self.monday.revision
+
+        response = self.post({
+            ('MON', 'DIN'): [self.carbonara, self.frittata],
+            ('WED', 'LUN'): [self.lasagne],
+        })
+
+        self.assertRedirects(response, f"{reverse('weekly_plan')}?week={weeks.format_week(weeks.current_week())}")
+        self.assertEqual(self.planned(), [
+            ('MON', 'DIN', 'Carbonara'), ('MON', 'DIN', 'Frittata'), ('WED', 'LUN', 'Lasagne'),
+        ])
+        # Le righe invariate non vengono riscritte
+        self.assertTrue(MealRecipe.objects.filter(pk=kept.pk).exists())
+        # Solo lo slot che riceve ricette viene creato
+        self.assertEqual(MealSlot.objects.count(), 3)
+        self.monday.refresh_from_db()
+        self.assertGreater(self.monday.revision, monday_revision)
+        self.assertEqual(materialized.diff(), [])
+
+    def test_unchanged_week_writes_nothing(self):
+        # Savepoint, lettura del piano, rilascio del savepoint
+        with self.assertNumQueries(3):
+            changes = week_editor.apply_week(home(), weeks.current_week(), {
+                ('MON', 'DIN'): [self.carbonara.pk, self.lasagne.pk], ('TUE', 'DIN'): [self.frittata.pk],
+            })
+        self.assertFalse(changes)
+
+    def test_unknown_recipe_is_rejected(self):
+        response = self.client.post(reverse('week_edit'), {'MON_DIN': [self.carbonara.pk, 9999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Ricette inesistenti: 9999')
+        self.assertEqual(MealRecipe.objects.count(), 3)
+
+    def test_copy_week_is_one_bulk_insert(self):
+        target = weeks.current_week() + weeks.ONE_WEEK
+        plan('MON', 'DIN', self.frittata, week=target)
+
+        with CaptureQueriesContext(connection) as queries:
+            changes = week_editor.copy_week(home(), weeks.current_week(), target)
+
+        # Tutte le pianificazioni copiate con un solo INSERT
+        inserts = [q['sql'] for q in queries if q['sql'].startswith('INSERT INTO "core_mealrecipe"')]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertEqual(len(changes.inserts), 3)
+        self.assertEqual(self.planned(target), [
+            ('MON', 'DIN', 'Carbonara'), ('MON', 'DIN', 'Frittata'), ('MON', 'DIN', 'Lasagne'),
+            ('TUE', 'DIN', 'Frittata'),
+        ])
+        # La settimana di partenza resta com'è
+        self.assertEqual(len(self.planned()), 3)
+        self.assertEqual(materialized.diff(), [])
+
+    def test_copy_week_view_defaults_to_next_week(self):
+        next_week = weeks.current_week() + weeks.ONE_WEEK
+        response = self.client.post(reverse('copy_week'))
+        self.assertRedirects(response, f"{reverse('weekly_plan')}?week={weeks.format_week(next_week)}")
+        self.assertEqual(self.planned(next_week), self.planned())
+
+
+@skipUnless(BENCHMARK, 'Benchmark disattivati (usa BENCHMARK=1)')
+class WeeklyGridBenchmark(CoreTestCase):
+
+    def test_build_weekly_grid(self):
+        for recipes_per_slot in (1, 5, 20):
+            with self.subTest(recipes_per_slot=recipes_per_slot):
+                MealSlot.objects.all().delete()
+                Recipe.objects.all().delete()
+                fill_week(recipes_per_slot)
+                best = min(timeit.repeat(lambda: build_weekly_grid(home(), weeks.current_week()), number=10, repeat=5)) / 10
+                report(f'build_weekly_grid 28 slot x {recipes_per_slot} ricette', best)
+
+
+@skipUnless(BENCHMARK, 'Benchmark disattivati (usa BENCHMARK=1)')
+class WeeklyGridRenderBenchmark(CoreTestCase):
+
+    def render(self):
+        return render_to_string('core/weekly_plan.html', self.context, request=RequestFactory().get('/'))
+
+    def fragments(self, backend, location='core-benchmark'):
+        return override_settings(CACHES={**TEST_CACHES, 'fragments': {
+            'BACKEND': f'django.core.cache.backends.{backend}', 'LOCATION': location,
+        }})
+
+    def best(self):
+        return min(timeit.repeat(self.render, number=10, repeat=5)) / 10
+
+    def touch_slots(self):
+        for day in self.context['meal_grid']:
+            for cell in day['cells']:
+                if cell['slot']:
+                    cell['slot'].revision += 1
+
+    def test_render_with_and_without_fragment_cache(self):
+        for recipes_per_slot in (2, 4, 8):
+            MealSlot.objects.all().delete()
+            Recipe.objects.all().delete()
+            fill_week(recipes_per_slot)
+            # Solo il rendering del template: la griglia è costruita una volta
+            self.context = {
+                'day_choices': DAY_CHOICES,
+                'meal_types': MEAL_TYPE_CHOICES,
+                'meal_grid': build_weekly_grid(home(), weeks.current_week()),
+            }
+            label = f'weekly_plan.html 28 slot x {recipes_per_slot} ricette'
+            with self.fragments('dummy.DummyCache'):
+                report(f'{label}, senza cache', self.best())
+            with self.fragments('locmem.LocMemCache'):
+                self.render()  # riscalda la cache dei frammenti
+                report(f'{label}, cache in memoria', self.best())
+            with tempfile.TemporaryDirectory() as location, self.fragments('filebased.FileBasedCache', location):
+                self.render()
+                report(f'{label}, cache su file', self.best())
+                # Ogni cella cambiata: scrittura e cull della cartella, quasi piena (limite predefinito)
+                caches['fragments'].set_many({f'riempimento {i}': i for i in range(250)})
+                missed = min(timeit.repeat(self.render, setup=self.touch_slots, number=1, repeat=5))
+                report(f'{label}, cache su file, tutte da riscrivere', missed)
+
+
+@skipUnless(BENCHMARK, 'Benchmark disattivati (usa BENCHMARK=1)')
+class RecipeSearchBenchmark(CoreTestCase):
+    """Ricettario sintetico: BENCHMARK_RECIPES ricette (default 100.000) da 6 ingredienti."""
+
+    WORDS = ['pasta', 'riso', 'zuppa', 'torta', 'insalata', 'vellutata', 'risotto', 'crema']
+
+    def setUp(self):
+        super().setUp()
+        total = int(os.environ.get('BENCHMARK_RECIPES', 100_000))
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ingrediente {i}', unit_id=unit('g').pk) for i in range(2000)
+        )
+        for start in range(0, total, 10_000):
+            recipes = Recipe.objects.bulk_create(
+                Recipe(name=f'{self.WORDS[i % len(self.WORDS)]} {i:06d}')
+                for i in range(start, min(start + 10_000, total))
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredients[(recipe.pk * 7 + k * 131) % 2000], quantity=1)
+                for recipe in recipes for k in range(6)
+            )
+        self.total = total
+
+    def time(self, label, func):
+        best = min(timeit.repeat(func, number=5, repeat=3)) / 5
+        report(f'{label} ({self.total} ricette)', best)
+
+    def test_search_latency(self):
+        self.time('prima pagina alfabetica', lambda: search.search_recipes(home()))
+        self.time('pagina profonda alfabetica', lambda: search.search_recipes(home(), after='zuppa 090000'))
+        self.time('ricerca per nome, prima pagina', lambda: search.search_recipes(home(), 'risotto'))
+        self.time('ricerca per nome, pagina profonda', lambda: search.search_recipes(home(), 'risotto', after='risotto 090000'))
+        self.time('ricerca per ingrediente', lambda: search.search_recipes(home(), 'ingrediente 42'))
+        self.time('ricerca per pertinenza (bm25)', lambda: search.search_recipes(home(), 'torta ingrediente', order=search.ORDER_RANK))
+
+
+@skipUnless(BENCHMARK, 'Benchmark disattivati (usa BENCHMARK=1)')
+class PlanGeneratorBenchmark(CoreTestCase):
+    """Generazione su un ricettario di 10.000 ricette (8 ingredienti su 1.500)."""
+
+    def test_generate_week(self):
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ingrediente {i}', unit_id=unit('g').pk) for i in range(1500)
+        )
+        recipes = Recipe.objects.bulk_create(Recipe(name=f'Ricetta {i}') for i in range(10_000))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredients[(n * 37 + k * k * 101) % 1500], quantity=k + 1)
+            for n, recipe in enumerate(recipes) for k in range(8)
+        )
+        matrix.invalidate()
+        started = timeit.default_timer()
+        matrix.get_matrix(home()).ingredient_bitsets()
+        report('matrice e bitset, 10.000 ricette', timeit.default_timer() - started)
+
+        for objective in planner.OBJECTIVES:
+            result = planner.generate_plan(home(), weeks.current_week(), objective=objective, time_budget=0.8)
+            report(
+                f'generate_plan {objective}: 28 celle, {result.distinct_ingredients} ingredienti'
+                f'{" (budget esaurito)" if result.timed_out else ""}',
+                result.elapsed,
+            )
+            self.assertEqual(len(result.assignments), 28)
+            self.assertLess(result.elapsed, 1.0)
+
+
+@skipUnless(BENCHMARK, 'Benchmark disattivati (usa BENCHMARK=1)')
+class SuggestionIndexBenchmark(CoreTestCase):
+    """Indice invertito su 50.000 ricette da 8 ingredienti (su 2.000)."""
+
+    def test_build_and_query(self):
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ingrediente {i}', unit_id=unit('g').pk) for i in range(2000)
+        )
+        recipes = Recipe.objects.bulk_create(Recipe(name=f'Ricetta {i}') for i in range(50_000))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredients[(n * 53 + k * k * 97) % 2000], quantity=1)
+            for n, recipe in enumerate(recipes) for k in range(8)
+        )
+        index = suggestions.get_index(home())
+        stats = index.stats()
+        report(f"costruzione indice ({stats['postings']} voci, {stats['memory_bytes'] / 2**20:.1f} MiB)",
+               stats['build_seconds'])
+
+        on_list = [ingredient.pk for ingredient in ingredients[:40]]
+        best = min(timeit.repeat(lambda: index.top_k(on_list), number=10, repeat=3)) / 10
+        report('top_k con 40 ingredienti in lista', best)
+        scan = min(timeit.repeat(
+            lambda: heapq.nsmallest(8, ((pk, len(ids & set(on_list))) for pk, ids in index.recipes.items()),
+                                    key=lambda item: -item[1]),
+            number=3, repeat=3)) / 3
+        report('confronto: scansione di tutte le ricette', scan)
+
+
+@skipUnless(BENCHMARK, 'Benchmark disattivati (usa BENCHMARK=1)')
+class PackCostBenchmark(CoreTestCase):
+    """Costo di una lista da 500 righe con confezioni di formati diversi."""
+
+    def test_solve_hundreds_of_lines(self):
+        formats = [(250, 400, 1000), (500, 750), (6, 10, 12), (330, 1000, 1500)]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ingrediente {i:03d}', unit_id=unit('g').pk) for i in range(500)
+        )
+        Pack.objects.bulk_create(
+            Pack(ingredient=ingredient, quantity=size, price=round(size * (0.002 + (i % 7) / 1000 - k / 5000), 2))
+            for i, ingredient in enumerate(ingredients)
+            for k, size in enumerate(formats[i % len(formats)])
+        )
+        started = timeit.default_timer()
+        costs.rebuild(home())
+        report('precalcolo delle tabelle di 500 ingredienti', timeit.default_timer() - started)
+
+        recipe = make_recipe('Tutto', *((ingredient, 1 + (i * 37) % 4000) for i, ingredient in enumerate(ingredients)))
+        for day, _ in DAY_CHOICES:
+            plan(day, 'DIN', recipe)
+        rows = list(materialized.materialized_shopping_list(home(), *this_week(), net=True, packs=True))
+        self.assertEqual(len(rows), 500)
+
+        best = min(timeit.repeat(
+            lambda: costs.price_shopping_list([dict(row) for row in rows]), number=10, repeat=3,
+        )) / 10
+        report('costo di 500 righe', best)
+        self.assertLess(best, 0.05)
+
+
+# ======================================================================
+# DATI SINTETICI E BENCHMARK DELLE VISTE
+# ======================================================================
+
+class SeedSyntheticTests(CoreTestCase):
+
+    def test_seed_command(self):
+        out = StringIO()
+        call_command('seed_synthetic', ingredients=30, recipes=100, ingredients_per_recipe=5,
+                     recipes_per_slot=2, stdout=out)
+        self.assertIn('100 ricette', out.getvalue())
+        self.assertEqual(Recipe.objects.count(), 100)
+        self.assertEqual(MealSlot.objects.count(), 28)
+        self.assertEqual(MealRecipe.objects.count(), 56)
+        self.assertEqual(materialized.diff(), [])
+
+        with self.assertRaises(CommandError):
+            call_command('seed_synthetic', recipes=10, stdout=StringIO())
+        call_command('seed_synthetic', recipes=10, ingredients=5, clear=True, stdout=StringIO())
+        self.assertEqual(Recipe.objects.count(), 10)
+
+    def test_every_route_has_a_benchmark_sample(self):
+        self.assertEqual(set(benchmarks.samples(1, 1)), benchmarks.route_names())
+
+
+@skipUnless(BENCHMARK, 'Benchmark disattivati (usa BENCHMARK=1)')
+class ViewBenchmark(CoreTestCase):
+    """
+    Tutte le rotte su un database sintetico, confrontate con
+    core/benchmark_baseline.json (BENCHMARK_SAVE=1 la riscrive).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        synthetic.seed(ingredients=500, recipes=5000, ingredients_per_recipe=8, recipes_per_slot=2)
+
+    def test_views_against_baseline(self):
+        results = benchmarks.run(self.client)
+        baseline = benchmarks.load_baseline()
+        print('\n' + benchmarks.format_table(results, baseline))
+        if os.environ.get('BENCHMARK_SAVE') == '1':
+            benchmarks.save_baseline(results)
+            return
+        self.assertTrue(baseline, 'Nessuna baseline: esegui con BENCHMARK_SAVE=1')
+        regressions = benchmarks.compare(results, baseline)
+        if regressions:
+            self.fail('Regressioni rispetto alla baseline:\n' + '\n'.join(regressions))
+
+
+@skipUnless(BENCHMARK, 'Benchmark disattivati (usa BENCHMARK=1)')
+class HouseholdScalingBenchmark(CoreTestCase):
+    """
+    Costo per richiesta di un nucleo piccolo da solo e con altri 999 nuclei
+    nel database, uno dei quali grande: stesse query e tempi entro la
+    tolleranza dei benchmark delle viste (core/benchmarks.py).
+    """
+    TENANTS = 1000
+    ROUTES = (
+        'weekly_plan', 'shopping_list', 'recipe_management', 'recipe_detail', 'meal_slot_update',
+        'api_weekly_plan', 'api_shopping_list', 'api_plan_evaluate', 'api_recipe_autocomplete',
+    )
+
+    def measure(self):
+        all_samples = benchmarks.default_samples()
+        return benchmarks.run(self.client, {name: all_samples[name] for name in self.ROUTES})
+
+    def test_per_request_cost_is_flat(self):
+        synthetic.seed(ingredients=50, recipes=200, ingredients_per_recipe=6, recipes_per_slot=1)
+        alone = self.measure()
+
+        large = Household.objects.create(name='Grande', slug='grande')
+        synthetic.seed(ingredients=500, recipes=5000, ingredients_per_recipe=8, recipes_per_slot=2,
+                       household_id=large.pk)
+        others = Household.objects.bulk_create(
+            Household(name=f'Nucleo {i}', slug=f'nucleo-{i:04d}') for i in range(self.TENANTS - 2)
+        )
+        for household in others:
+            synthetic.seed(ingredients=5, recipes=10, ingredients_per_recipe=3, recipes_per_slot=1,
+                           household_id=household.pk)
+        self.assertEqual(Household.objects.count(), self.TENANTS)
+        crowded = self.measure()
+
+        print('\n' + benchmarks.format_table(crowded, alone))
+        regressions = benchmarks.compare(crowded, alone)
+        if regressions:
+            self.fail(f'Costo per richiesta cresciuto con {self.TENANTS} nuclei:\n' + '\n'.join(regressions))
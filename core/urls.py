@@ -1,19 +1,23 @@
-from django.urls import path
-from . import views
+from django.urls import path, register_converter
+from . import api, converters, exports, metrics, views
+
+# Date ISO (AAAA-MM-GG) nei percorsi, passate alle viste come datetime.date
+register_converter(converters.IsoDateConverter, 'isodate')
 
 urlpatterns = [
     # ===============================================
     # VISTE PRINCIPALI E PIANIFICAZIONE
     # ===============================================
     
-    # 1. Homepage (Piano Settimanale)
+    # 1. Homepage (Piano Settimanale; ?week=AAAA-Www per le altre settimane)
     path('', views.weekly_plan, name='weekly_plan'),
     
-    # 2. Lista della Spesa
+    # 2. Lista della Spesa (?week= oppure ?start=&end=)
     path('shopping-list/', views.shopping_list, name='shopping_list'),
+    path('shopping-list/bought/', views.shopping_list_bought, name='shopping_list_bought'),
     
     # 3. Creazione/Inizializzazione di un nuovo slot pasto
-    path('meal-slot/create/<str:day>/<str:meal_type>/', 
+    path('meal-slot/create/<isodate:date>/<str:meal_type>/', 
          views.meal_slot_create, 
          name='meal_slot_create'),
     
@@ -22,8 +26,11 @@ urlpatterns = [
          views.meal_slot_update, 
          name='meal_slot_update'),
     
-    # 5. Reset Settimana (usa POST)
+    # 5. Reset, generazione automatica, modifica in blocco e copia della settimana (?week=)
     path('reset/', views.reset_weekly_plan, name='reset_weekly_plan'),
+    path('generate/', views.generate_weekly_plan, name='generate_weekly_plan'),
+    path('week/edit/', views.week_edit, name='week_edit'),
+    path('week/copy/', views.copy_week, name='copy_week'),
     
     # ===============================================
 
@@ -41,4 +48,44 @@ urlpatterns = [
     
     # 10. Rotta per la creazione di un nuovo ingrediente 
     path('ingredient/new/', views.ingredient_create, name='ingredient_create'),
-]
\ No newline at end of file
+
+    # ===============================================
+    # ESPORTAZIONI (in streaming)
+    # ===============================================
+
+    # 11. Lista della spesa (csv, json), con ?week= oppure ?start=&end=
+    path('export/shopping-list.<str:fmt>', exports.export_shopping_list, name='export_shopping_list'),
+
+    # 12. Piano settimanale (csv, json, ics), con ?week= oppure ?start=&end=
+    path('export/weekly-plan.<str:fmt>', exports.export_weekly_plan, name='export_weekly_plan'),
+
+    # ===============================================
+    # API JSON
+    # ===============================================
+
+    # 13. Piano settimanale, ricetta e lista della spesa (GET con ETag)
+    path('api/plan/', api.weekly_plan, name='api_weekly_plan'),
+    path('api/recipes/<int:pk>/', api.recipe_detail, name='api_recipe_detail'),
+    path('api/shopping-list/', api.shopping_list, name='api_shopping_list'),
+
+    # 14. Valutazione in blocco di piani candidati (POST)
+    path('api/plans/evaluate/', api.plan_evaluate, name='api_plan_evaluate'),
+
+    # 15. Autocompletamento per prefisso (?q=) di ingredienti e ricette
+    path('api/ingredients/autocomplete/', api.ingredient_autocomplete, name='api_ingredient_autocomplete'),
+    path('api/recipes/autocomplete/', api.recipe_autocomplete, name='api_recipe_autocomplete'),
+
+    # ===============================================
+    # METRICHE (formato testo Prometheus)
+    # ===============================================
+
+    # 16. Istogrammi per rotta: query, tempo SQL, template e totale
+    path('metrics', metrics.metrics_view, name='metrics'),
+
+    # ===============================================
+    # NUCLEO FAMILIARE
+    # ===============================================
+
+    # 17. Cambio del nucleo della sessione (POST, solo per i membri)
+    path('household/<slug:slug>/switch/', views.household_switch, name='household_switch'),
+]
@@ -0,0 +1,234 @@
+# File: core/versioning.py
+
+"""
+Contatori di versione per la validazione HTTP (ETag) senza toccare l'ORM.
+
+Ogni "ambito" di ogni nucleo familiare ha un timbro monotono, salvato nel
+database (modello VersionStamp) e copiato nella cache di Django:
+  - PLAN:    slot e ricette pianificate (MealSlot, MealRecipe)
+  - RECIPES: ricettario (Recipe, RecipeIngredient, Ingredient, Unit)
+  - PANTRY:  dispensa (PantryItem)
+
+Le chiavi comprendono l'id del nucleo: una scrittura invalida solo le
+risposte del proprio nucleo. Le unità di misura sono condivise, quindi
+una loro modifica fa avanzare RECIPES di tutti i nuclei (bump_all).
+
+I timbri sono istanti in nanosecondi, quindi valgono anche come
+Last-Modified. I segnali in core/signals.py li fanno avanzare a ogni
+scrittura; le viste calcolano l'ETag leggendo la cache, quindi una
+richiesta condizionale invariata riceve di norma un 304 senza alcuna query.
+Se la cache ha espulso un timbro lo si rilegge dal database (e lo si
+ricopia in cache): un timbro non riparte mai da capo, quindi un ETag già
+emesso non può tornare valido per dati diversi. Il timbro provvisorio
+scritto durante una transazione (bump_on_commit) resta solo in cache: al
+commit quello definitivo va anche nel database.
+
+Le viste asincrone leggono i timbri con `aget_versions` prima della
+validazione condizionale (vedi `prefetch`), senza bloccare il ciclo degli
+eventi su cache o database.
+
+PANTRY dipende anche dal giorno corrente: i lotti scadono e la scorta
+libera si consuma a partire da oggi senza alcuna scrittura, quindi ETag,
+chiavi e Last-Modified di quell'ambito comprendono la data di oggi
+(`day_marker`).
+
+La cache deve essere condivisa tra i processi (vedi CACHES in
+planner/settings.py), altrimenti ogni worker vedrebbe i timbri degli altri
+solo dopo un'espulsione.
+
+Le strutture in memoria per nucleo (tenancy.PerHousehold) ricordano il
+timbro con cui sono state costruite e si ricostruiscono quando cambia,
+anche per le scritture degli altri processi. `on_bump` permette loro di
+seguire i timbri fatti avanzare da questo processo senza ricostruirsi: le
+sue scritture le aggiornano (o le invalidano) al commit.
+"""
+
+import datetime
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Household, VersionStamp
+
+PLAN = 'plan'
+RECIPES = 'recipes'
+PANTRY = 'pantry'
+
+# Ambiti il cui contenuto cambia anche al cambio di giorno
+DAILY_SCOPES = {PANTRY}
+
+KEY_PREFIX = 'core:version:'
+
+# Chiamati con (household_id, ambito, timbro precedente, timbro nuovo) dopo ogni bump del processo
+_listeners = []
+
+
+def _key(household_id, scope):
+    return f'{KEY_PREFIX}{household_id}:{scope}'
+
+
+def get_versions(household_id, *scopes):
+    """
+    Restituisce {ambito: timbro} del nucleo. I timbri assenti dalla cache si
+    leggono dal database; un ambito mai visto riceve lì un timbro nuovo (i
+    client rivalidano, mai dati vecchi).
+    """
+    keys = [_key(household_id, scope) for scope in scopes]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return _load(household_id, scopes)
+    return {scope: found[_key(household_id, scope)] for scope in scopes}
+
+
+async def aget_versions(household_id, *scopes):
+    """Come get_versions, per le viste asincrone."""
+    keys = [_key(household_id, scope) for scope in scopes]
+    found = await cache.aget_many(keys)
+    if len(found) < len(keys):
+        return await sync_to_async(_load)(household_id, scopes)
+    return {scope: found[_key(household_id, scope)] for scope in scopes}
+
+
+def _load(household_id, scopes):
+    """Timbri dal database (creati se mai visti), ricopiati nella cache."""
+    rows = VersionStamp.objects.filter(household_id=household_id, scope__in=scopes)
+    stamps = dict(rows.values_list('scope', 'stamp'))
+    missing = [scope for scope in scopes if scope not in stamps]
+    if missing:
+        now = time.time_ns()
+        VersionStamp.objects.bulk_create(
+            [VersionStamp(household_id=household_id, scope=scope, stamp=now) for scope in missing],
+            ignore_conflicts=True,
+        )
+        # Un altro processo può averli creati nel frattempo: vale il suo timbro
+        stamps.update(rows.filter(scope__in=missing).values_list('scope', 'stamp'))
+    cache.set_many({_key(household_id, scope): stamps[scope] for scope in scopes}, timeout=None)
+    return {scope: stamps[scope] for scope in scopes}
+
+
+def _persist(household_id, stamps):
+    """Salva i timbri {ambito: timbro} nel database, senza mai farli tornare indietro."""
+    for scope, value in stamps.items():
+        updated = VersionStamp.objects.filter(household_id=household_id, scope=scope).update(
+            stamp=Greatest(F('stamp') + 1, Value(value)),
+        )
+        if not updated:
+            VersionStamp.objects.bulk_create(
+                [VersionStamp(household_id=household_id, scope=scope, stamp=value)], ignore_conflicts=True,
+            )
+
+
+def for_request(request, *scopes):
+    """Timbri degli ambiti per la richiesta, letti una volta sola (vedi prefetch)."""
+    versions = getattr(request, '_core_versions', {})
+    missing = [scope for scope in scopes if scope not in versions]
+    if missing:
+        versions = request._core_versions = {**versions, **get_versions(request.household_id, *missing)}
+    return {scope: versions[scope] for scope in scopes}
+
+
+async def prefetch(request, *scopes):
+    """
+    Legge in anticipo i timbri della richiesta di una vista asincrona:
+    ETag e Last-Modified (django.views.decorators.http.condition) sono
+    calcolati in modo sincrono, dentro il ciclo degli eventi.
+    """
+    request._core_versions = await aget_versions(request.household_id, *scopes)
+
+
+def stamp(household_id, scope):
+    """Timbro corrente di un ambito del nucleo."""
+    return get_versions(household_id, scope)[scope]
+
+
+def on_bump(listener):
+    """Registra `listener(household_id, scope, old, new)` per i bump di questo processo."""
+    _listeners.append(listener)
+    return listener
+
+
+def bump(household_id, *scopes, persist=True):
+    """
+    Fa avanzare il timbro degli ambiti indicati del nucleo, in cache e (con
+    `persist`) nel database.
+    """
+    current = get_versions(household_id, *scopes)
+    now = time.time_ns()
+    stamps = {scope: max(now, current[scope] + 1) for scope in scopes}
+    if persist:
+        _persist(household_id, stamps)
+    cache.set_many({_key(household_id, scope): stamps[scope] for scope in scopes}, timeout=None)
+    for listener in _listeners:
+        for scope in scopes:
+            listener(household_id, scope, current[scope], stamps[scope])
+
+
+def bump_on_commit(household_id, *scopes):
+    """
+    Invalida subito e di nuovo al commit della transazione: chi rilegge
+    tra la scrittura e il commit non può restare con un ETag "nuovo"
+    associato a dati vecchi. Il timbro provvisorio resta solo in cache: se
+    viene espulso prima del commit vale quello salvato, che descrive ancora
+    i dati confermati.
+    """
+    bump(household_id, *scopes, persist=False)
+    transaction.on_commit(lambda: bump(household_id, *scopes))
+
+
+def bump_all(*scopes):
+    """
+    Fa avanzare gli ambiti di tutti i nuclei (dati condivisi, es. le unità
+    di misura), subito e al commit, con una lettura e una scrittura multiple
+    sulla cache; al commit anche nel database, con un solo UPDATE.
+    """
+    keys = [
+        _key(household_id, scope)
+        for household_id in Household.objects.values_list('pk', flat=True)
+        for scope in scopes
+    ]
+
+    def run(persist=True):
+        # Un timbro unico, oltre qualunque timbro esistente
+        stamp = max([time.time_ns(), *(value + 1 for value in cache.get_many(keys).values())])
+        if persist:
+            VersionStamp.objects.filter(scope__in=scopes).update(stamp=Greatest(F('stamp') + 1, Value(stamp)))
+        cache.set_many(dict.fromkeys(keys, stamp), timeout=None)
+
+    run(persist=False)
+    transaction.on_commit(run)
+
+
+def day_marker(*scopes):
+    """Data di oggi se uno degli ambiti dipende dal giorno (DAILY_SCOPES), altrimenti ''."""
+    return timezone.localdate().isoformat() if DAILY_SCOPES.intersection(scopes) else ''
+
+
+def etag(household_id, *scopes, period='', versions=None):
+    """
+    ETag forte derivato dal nucleo, dai timbri degli ambiti indicati (già
+    letti in `versions`, se forniti), dall'eventuale intervallo di date
+    della risposta (weeks.requested_period) e dal giorno corrente per gli
+    ambiti che ne dipendono (day_marker).
+    """
+    versions = versions or get_versions(household_id, *scopes)
+    parts = [str(household_id)] + [part for part in (period, day_marker(*scopes)) if part]
+    parts += [f'{scope}.{versions[scope]:x}' for scope in scopes]
+    return '"' + '-'.join(parts) + '"'
+
+
+def last_modified(household_id, *scopes, versions=None):
+    """
+    Istante dell'ultima modifica tra gli ambiti indicati (per Last-Modified);
+    per gli ambiti che dipendono dal giorno almeno l'inizio di oggi.
+    """
+    latest = datetime.datetime.fromtimestamp(
+        max((versions or get_versions(household_id, *scopes)).values()) / 1e9, tz=datetime.timezone.utc
+    )
+    if day_marker(*scopes):
+        latest = max(latest, timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time.min)))
+    return latest
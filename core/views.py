@@ -1,66 +1,141 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.forms import inlineformset_factory
+from django.forms import BaseInlineFormSet, inlineformset_factory
 from django.urls import reverse
-from django.db.models import Sum, F, Count
-from django.db.models.functions import Lower 
+from django.utils.http import urlencode
+from django.db import transaction
+from django.db.models import Prefetch
 from .models import (
     Recipe, Ingredient, RecipeIngredient, 
     MealSlot, MealRecipe, 
-    DAY_CHOICES, MEAL_TYPE_CHOICES
+    DAY_CHOICES, MEAL_TYPE_CHOICES, NUTRIENTS
 )
-from .forms import RecipeForm, IngredientForm
-from django.http import Http404, HttpResponse
+from .forms import RecipeForm, IngredientForm, RecipeIngredientForm, MealRecipeForm, PlanGeneratorForm, WeekPlanForm
+from . import costs, materialized, nutrition, pantry, planner, search, suggestions, tenancy, versioning, week_editor, weeks
+from .caching import versioned_page
+from .routers import read_only
+from django.http import Http404
 
 # ======================================================================
 # FUNZIONE DI UTILITÀ: Costruzione della Griglia Settimanale
 # ======================================================================
 
-def build_weekly_grid():
-    """Costruisce la struttura dati per la griglia settimanale."""
-    
-    meal_grid = {
-        day_code: {
-            'name': day_name,
-            'meals': {meal_code: None for meal_code, _ in MEAL_TYPE_CHOICES}
-        } 
-        for day_code, day_name in DAY_CHOICES
-    }
+def build_weekly_grid(household_id, week):
+    """
+    Costruisce la struttura dati per la griglia della settimana del nucleo
+    che inizia il lunedì `week`.
 
-    all_slots = MealSlot.objects.prefetch_related('recipes').all()
+    Carica gli slot della settimana e le relative ricette con due sole query
+    (slot per intervallo di date + prefetch delle MealRecipe con la ricetta)
+    e restituisce una lista di righe già ordinate, una per giorno:
 
-    for slot in all_slots:
-        
-        # Filtra MealRecipe usando 'meal_slot' (il nome del campo)
-        meal_recipes = MealRecipe.objects.filter(meal_slot=slot).select_related('recipe')
-        recipes_list = [mr.recipe for mr in meal_recipes]
-        
-        if not recipes_list and not slot:
-             continue 
-        
-        slot_data = {
-            'slot_obj': slot,
-            'recipes': recipes_list
-        }
-        
-        try:
-            meal_grid[slot.day]['meals'][slot.meal_type] = slot_data
-        except KeyError:
-            continue
+        [{'code': 'MON', 'name': 'Lunedì', 'date': date(...),
+          'cells': [{'meal_type': 'LUN', 'date': date(...), 'slot': <MealSlot|None>,
+                     'recipes': [...], 'portions': [...]}, ...]},
+         ...]
+
+    Il template può percorrerla direttamente, senza lookup tramite `get_item`.
+    """
+
+    return assemble_weekly_grid(weekly_grid_slots(household_id, week), week)
+
+
+async def abuild_weekly_grid(household_id, week):
+    """Come build_weekly_grid, ma con l'ORM asincrono (stesse due query)."""
+    return assemble_weekly_grid([slot async for slot in weekly_grid_slots(household_id, week)], week)
+
+
+def weekly_grid_slots(household_id, week):
+    # Indice (household, date, meal_type): la griglia legge solo gli slot del nucleo
+    slots = MealSlot.objects.filter(household=household_id, date__range=weeks.week_range(week))
+    return slots.prefetch_related(
+        Prefetch('recipes', queryset=MealRecipe.objects.select_related('recipe'))
+    )
+
+
+def assemble_weekly_grid(slots, week):
+    """Dispone gli slot (con le ricette già caricate) nella griglia giorni x pasti."""
+    slots_by_key = {(slot.date, slot.meal_type): slot for slot in slots}
+
+    meal_grid = []
+    for day_code, day_name in DAY_CHOICES:
+        date = weeks.cell_date(week, day_code)
+        cells = []
+        for meal_code, _ in MEAL_TYPE_CHOICES:
+            slot = slots_by_key.get((date, meal_code))
+            # Usa la prefetch: nessuna query aggiuntiva per slot
+            planned = slot.recipes.all() if slot else []
+            cells.append({
+                'meal_type': meal_code,
+                'date': date,
+                'slot': slot,
+                'recipes': [mr.recipe for mr in planned],
+                # Porzioni di ciascuna ricetta (quelle della ricetta se non indicate)
+                'portions': [mr.portions or mr.recipe.servings for mr in planned],
+            })
+        meal_grid.append({'code': day_code, 'name': day_name, 'date': date, 'cells': cells})
 
     return meal_grid
 
 
+def requested_week(request):
+    """Lunedì della settimana di ?week= (la corrente se assente)."""
+    try:
+        return weeks.week_from_request(request)
+    except ValueError:
+        raise Http404("Settimana non valida.")
+
+
+def requested_range(request):
+    """Intervallo di date (inizio, fine) di ?week= o ?start=&end=."""
+    try:
+        return weeks.range_from_request(request)
+    except ValueError:
+        raise Http404("Intervallo di date non valido.")
+
+
+def week_url(name, week):
+    return f"{reverse(name)}?{urlencode({'week': weeks.format_week(week)})}"
+
+
+def redirect_to_week(week):
+    """Torna alla griglia della settimana del lunedì `week`."""
+    return redirect(week_url('weekly_plan', week))
+
+
 # ======================================================================
 # VISTE PRINCIPALI
 # ======================================================================
 
-def weekly_plan(request):
-    """Visualizza il piano settimanale e la griglia dei pasti."""
+# Le pagine di sola lettura sono viste asincrone: sotto ASGI le query
+# passano dall'ORM asincrono e non occupano un thread per tutta la richiesta.
+# Con @read_only leggono dalla connessione 'read' (vedi core/routers.py).
+# Il template riceve solo dati già caricati (nessuna query pigra).
+
+@versioned_page(versioning.PLAN, versioning.RECIPES, vary_on_csrf=True, dated=True)
+@read_only
+async def weekly_plan(request):
+    """Visualizza il piano e la griglia dei pasti della settimana di ?week=."""
     
+    week = requested_week(request)
+    meal_grid = await abuild_weekly_grid(request.household_id, week)
+    # Anche i costi vengono dai valori salvati sulle ricette della griglia
+    recipe_costs, week_cost = costs.summarize(meal_grid)
     context = {
         'day_choices': DAY_CHOICES,
         'meal_types': MEAL_TYPE_CHOICES,
-        'meal_grid': build_weekly_grid(),
+        'meal_grid': meal_grid,
+        # Dai totali salvati sulle ricette già caricate: nessuna query in più
+        'nutrition': nutrition.summarize(meal_grid),
+        'nutrients': NUTRIENTS,
+        'recipe_costs': recipe_costs,
+        'week_cost': week_cost,
+        'generator_form': PlanGeneratorForm(),
+        'week': week,
+        'week_end': weeks.week_end(week),
+        'week_param': weeks.format_week(week),
+        'previous_week': weeks.format_week(week - weeks.ONE_WEEK),
+        'next_week': weeks.format_week(week + weeks.ONE_WEEK),
+        'is_current_week': week == weeks.current_week(),
     }
     return render(request, 'core/weekly_plan.html', context)
 
@@ -69,20 +144,43 @@ def weekly_plan(request):
 # VISTE GESTIONE RICETTE E INGREDIENTI (CENTRALIZZATE)
 # ======================================================================
 
+@versioned_page(versioning.RECIPES, vary_on_csrf=True)
+@read_only
 def recipe_management(request):
     """
     Pagina centrale per la gestione (lista e link al CRUD) delle ricette 
     e per il form di creazione rapida degli ingredienti.
     """
     
-    # 1. Gestione Lista Ricette
-    recipes = Recipe.objects.all().order_by('name')
+    # 1. Gestione Lista Ricette: ricerca full-text e paginazione a chiave
+    query = request.GET.get('q', '').strip()
+    order = request.GET.get('order')
+    if order != search.ORDER_RANK:
+        order = search.ORDER_NAME
+    try:
+        score = float(request.GET['score']) if 'score' in request.GET else None
+    except ValueError:
+        score = None
+    page = search.search_recipes(
+        request.household_id, query, after=request.GET.get('after'), score=score, order=order,
+    )
+
+    next_url = None
+    if page.next_after is not None:
+        params = {'q': query, 'order': order, 'after': page.next_after}
+        if page.next_score is not None:
+            params['score'] = repr(page.next_score)
+        next_url = f"{reverse('recipe_management')}?{urlencode(params)}"
     
     # 2. Gestione Form Ingrediente
     ingredient_form = IngredientForm()
     
     context = {
-        'recipes': recipes, 
+        'recipes': page.recipes, 
+        'query': query,
+        'order': order,
+        'is_first_page': 'after' not in request.GET,
+        'next_url': next_url,
         'title': 'Gestione Ricette e Ingredienti',
         'ingredient_form': ingredient_form,
     }
@@ -95,7 +193,7 @@ def ingredient_create(request):
     o recipe_management).
     """
     if request.method == 'POST':
-        form = IngredientForm(request.POST)
+        form = IngredientForm(request.POST, instance=Ingredient(household_id=request.household_id))
         if form.is_valid():
             form.save()
             
@@ -119,8 +217,31 @@ def ingredient_create(request):
 # VISTE RICETTE (Creazione, Dettaglio, Eliminazione)
 # ======================================================================
 
+class RelatedInlineFormSet(BaseInlineFormSet):
+    """
+    Formset inline che carica con select_related gli oggetti mostrati dai
+    widget di autocompletamento (una query per tutte le righe, non una per riga).
+    Ogni riga riceve il nucleo dell'oggetto padre, per limitare le scelte.
+    """
+    select_related = ()
+
+    def __init__(self, *args, queryset=None, **kwargs):
+        if queryset is None:
+            queryset = self.model._default_manager.select_related(*self.select_related)
+        super().__init__(*args, queryset=queryset, **kwargs)
+
+    def get_form_kwargs(self, index):
+        return {**super().get_form_kwargs(index), 'household': self.instance.household_id}
+
+
+class RecipeIngredientBaseFormSet(RelatedInlineFormSet):
+    select_related = ('ingredient__unit',)
+
+
 RecipeIngredientFormSet = inlineformset_factory(
     Recipe, RecipeIngredient, 
+    formset=RecipeIngredientBaseFormSet,
+    form=RecipeIngredientForm,
     fields=('ingredient', 'quantity'), 
     extra=1, can_delete=True
 )
@@ -128,10 +249,11 @@ RecipeIngredientFormSet = inlineformset_factory(
 def recipe_create(request):
     """Crea una nuova ricetta con i suoi ingredienti."""
     
+    # Ricetta vuota del nucleo corrente, per il form e per il formset
+    new_recipe = Recipe(household_id=request.household_id)
     if request.method == 'POST':
-        form = RecipeForm(request.POST)
-        # Passiamo un'istanza vuota (Recipe()) per l'inizializzazione del formset
-        formset = RecipeIngredientFormSet(request.POST, instance=Recipe()) 
+        form = RecipeForm(request.POST, instance=new_recipe)
+        formset = RecipeIngredientFormSet(request.POST, instance=new_recipe)
         
         if form.is_valid() and formset.is_valid():
             recipe = form.save()
@@ -140,8 +262,8 @@ def recipe_create(request):
             formset.save()
             return redirect('recipe_detail', pk=recipe.pk) 
     else:
-        form = RecipeForm()
-        formset = RecipeIngredientFormSet(instance=Recipe())
+        form = RecipeForm(instance=new_recipe)
+        formset = RecipeIngredientFormSet(instance=new_recipe)
         
     context = {
         'form': form,
@@ -156,7 +278,7 @@ def recipe_create(request):
 def recipe_detail(request, pk):
     """Visualizza o modifica una ricetta esistente."""
     
-    recipe = get_object_or_404(Recipe, pk=pk)
+    recipe = get_object_or_404(Recipe, household=request.household_id, pk=pk)
     
     if request.method == 'POST':
         form = RecipeForm(request.POST, instance=recipe)
@@ -177,13 +299,15 @@ def recipe_detail(request, pk):
         'recipe': recipe,
         'is_new': False,
         'ingredient_form': IngredientForm(), # Form ingrediente rapido
+        # Totali salvati sulla ricetta (core/nutrition.py)
+        'portion_nutrition': list(zip(NUTRIENTS, nutrition.per_portion(recipe))),
     }
     return render(request, 'core/recipe_detail.html', context)
 
 
 def recipe_delete(request, pk):
     """Elimina una ricetta esistente."""
-    recipe = get_object_or_404(Recipe, pk=pk)
+    recipe = get_object_or_404(Recipe, household=request.household_id, pk=pk)
     
     if request.method == 'POST':
         recipe.delete()
@@ -195,42 +319,63 @@ def recipe_delete(request, pk):
 
 
 # ======================================================================
-# VISTE SLOT PASTO (Creazione, Aggiornamento)
+# VISTE SLOT PASTO (Creazione, Aggiornamento, Modifica in blocco)
 # ======================================================================
 
+class MealRecipeBaseFormSet(RelatedInlineFormSet):
+    select_related = ('recipe',)
+
+
 MealRecipeFormSet = inlineformset_factory(
     MealSlot, MealRecipe, 
-    fields=('recipe',), 
+    formset=MealRecipeBaseFormSet,
+    form=MealRecipeForm,
+    fields=('recipe', 'portions'), 
     extra=1, can_delete=True
 )
 
 
-def meal_slot_create(request, day, meal_type):
+def slot_suggestions(slot):
+    """
+    Ricette che sfruttano gli ingredienti già in lista nella settimana dello
+    slot, escluse quelle dello slot.
+    """
+    planned = slot.recipes.values_list('recipe_id', flat=True) if slot.pk else []
+    start, end = weeks.week_range(weeks.week_start(slot.date))
+    return suggestions.suggest_recipes(slot.household_id, start, end, exclude=list(planned))
+
+
+def meal_slot_create(request, date, meal_type):
     """Crea un nuovo MealSlot e assegna le ricette."""
     
-    day_name = dict(DAY_CHOICES).get(day)
     meal_name = dict(MEAL_TYPE_CHOICES).get(meal_type)
-    if not day_name or not meal_name:
-        raise Http404("Giorno o tipo di pasto non valido.")
+    if not meal_name:
+        raise Http404("Tipo di pasto non valido.")
 
-    slot, created = MealSlot.objects.get_or_create(
-        day=day, 
-        meal_type=meal_type
-    )
+    # Nessuna scrittura in GET: lo slot viene salvato solo con il POST valido
+    cell = {'household_id': request.household_id, 'date': date, 'meal_type': meal_type}
+    slot = MealSlot.objects.filter(**cell).first() or MealSlot(**cell)
+    created = slot.pk is None
 
     if request.method == 'POST':
         formset = MealRecipeFormSet(request.POST, instance=slot)
         if formset.is_valid():
-            formset.save()
-            return redirect('weekly_plan')
+            with transaction.atomic():
+                if slot.pk is None:
+                    slot, _ = MealSlot.objects.get_or_create(**cell)
+                    formset.instance = slot
+                formset.save()
+            return redirect_to_week(weeks.week_start(date))
     else:
         formset = MealRecipeFormSet(instance=slot)
 
     context = {
         'slot': slot,
         'formset': formset,
-        'title': f'Pianifica: {meal_name} del {day_name}',
-        'created': created 
+        'title': f'Pianifica: {meal_name} di {slot.get_day_display()} {date:%d/%m}',
+        'week_param': weeks.format_week(weeks.week_start(date)),
+        'created': created,
+        'suggestions': slot_suggestions(slot),
     }
     return render(request, 'core/meal_slot_form.html', context)
 
@@ -238,90 +383,172 @@ def meal_slot_create(request, day, meal_type):
 def meal_slot_update(request, pk):
     """Aggiorna un MealSlot esistente e le sue ricette."""
     
-    slot = get_object_or_404(MealSlot, pk=pk)
+    slot = get_object_or_404(MealSlot, household=request.household_id, pk=pk)
     
     if request.method == 'POST':
         formset = MealRecipeFormSet(request.POST, instance=slot)
         if formset.is_valid():
             formset.save()
-            return redirect('weekly_plan')
+            return redirect_to_week(weeks.week_start(slot.date))
     else:
         formset = MealRecipeFormSet(instance=slot)
 
-    day_name = dict(DAY_CHOICES).get(slot.day)
     meal_name = dict(MEAL_TYPE_CHOICES).get(slot.meal_type)
     
     context = {
         'slot': slot,
         'formset': formset,
-        'title': f'Modifica: {meal_name} del {day_name}',
-        'created': False 
+        'title': f'Modifica: {meal_name} di {slot.get_day_display()} {slot.date:%d/%m}',
+        'week_param': weeks.format_week(weeks.week_start(slot.date)),
+        'created': False,
+        'suggestions': slot_suggestions(slot),
     }
     return render(request, 'core/meal_slot_form.html', context)
 
 
+def week_edit(request):
+    """
+    Modifica in blocco della settimana di ?week=: un solo form con le ricette
+    di tutte le 28 celle, applicato come differenza in un'unica transazione
+    (core/week_editor.py).
+    """
+    
+    week = requested_week(request)
+    household_id = request.household_id
+    current = week_editor.current_assignments(household_id, week)
+    known = {
+        str(recipe.pk): recipe
+        for recipe in Recipe.objects.filter(
+            pk__in={pk for recipes in current.values() for pk in recipes}
+        )
+    }
+    initial = {
+        WeekPlanForm.field_name(day, meal_type): sorted(recipes)
+        for (day, meal_type), recipes in current.items()
+    }
+
+    if request.method == 'POST':
+        form = WeekPlanForm(request.POST, initial=initial, household=household_id, known_recipes=known)
+        if form.is_valid():
+            week_editor.apply_week(household_id, week, form.assignments())
+            return redirect_to_week(week)
+    else:
+        form = WeekPlanForm(initial=initial, household=household_id, known_recipes=known)
+
+    context = {
+        'title': f'Modifica la Settimana dal {week:%d/%m/%Y}',
+        'form': form,
+        'meal_types': MEAL_TYPE_CHOICES,
+        'week_param': weeks.format_week(week),
+    }
+    return render(request, 'core/week_editor.html', context)
+
+
 # ======================================================================
 # VISTE AZIONI RAPIDE
 # ======================================================================
 
 def reset_weekly_plan(request):
-    """Azione rapida: Cancella tutti i MealSlot."""
+    """Azione rapida: cancella i MealSlot della settimana di ?week= (le altre restano)."""
     
+    week = requested_week(request)
     if request.method == 'POST':
-        MealSlot.objects.all().delete()
-        return redirect('weekly_plan')
+        # Niente aggiornamenti riga per riga della lista materializzata: le
+        # righe dei giorni della settimana si svuotano con un'istruzione
+        week_editor.clear_week(request.household_id, week)
     
-    return redirect('weekly_plan')
+    return redirect_to_week(week)
 
 
-def shopping_list(request):
+def generate_weekly_plan(request):
     """
-    Genera la lista della spesa aggregando gli ingredienti, moltiplicando 
-    le dosi per il numero di volte che la ricetta è pianificata.
+    Azione rapida: riempie le celle vuote della settimana di ?week= con il
+    generatore automatico (core/planner.py). Le ricette già pianificate restano.
     """
     
-    # Dizionario finale che conterrà { (pk_ingrediente, unità): {dati} }
-    final_shopping_list = {}
-    
-    # 1. Trova quante volte ogni ricetta è stata pianificata nella settimana
-    recipe_counts = MealRecipe.objects.values('recipe__pk').annotate(count=Count('recipe__pk'))
+    week = requested_week(request)
+    if request.method == 'POST':
+        form = PlanGeneratorForm(request.POST)
+        if form.is_valid():
+            result = planner.generate_plan(request.household_id, week, **form.cleaned_data)
+            planner.apply_plan(request.household_id, result, week)
     
-    # 2. Cicla su ogni ricetta pianificata e il suo conteggio totale
-    for item in recipe_counts:
-        recipe_pk = item['recipe__pk']
-        count = item['count'] # Numero di volte in cui la ricetta è stata pianificata
+    return redirect_to_week(week)
 
-        # Ottieni tutti gli ingredienti (RecipeIngredient) per questa ricetta specifica
-        ingredients = RecipeIngredient.objects.filter(recipe__pk=recipe_pk).select_related('ingredient')
-        
-        for ri in ingredients:
-            name = ri.ingredient.name
-            # Normalizza l'unità di misura per l'aggregazione
-            unit = ri.ingredient.unit.lower().strip()
-            # Chiave univoca per l'aggregazione: PK dell'Ingrediente e unità normalizzata
-            key = (ri.ingredient.pk, unit)
-            
-            # Calcola la quantità totale moltiplicando la dose base per il conteggio
-            total_quantity = ri.quantity * count 
-            
-            # Aggiorna il dizionario finale
-            if key not in final_shopping_list:
-                final_shopping_list[key] = {
-                    'name': name,
-                    'quantity': total_quantity,
-                    'unit': unit
-                }
-            else:
-                final_shopping_list[key]['quantity'] += total_quantity
 
-
-    # 3. Preparazione dei dati per il template e ordinamento
-    shopping_list = list(final_shopping_list.values())
-    shopping_list.sort(key=lambda x: x['name'])
+def copy_week(request):
+    """
+    Azione rapida: copia le ricette della settimana di ?week= in quella di
+    ?target= (di default la successiva) con un solo inserimento in blocco
+    (core/week_editor.py), poi mostra la settimana di destinazione.
+    """
+    
+    week = requested_week(request)
+    try:
+        target = weeks.parse_week(request.GET['target']) if 'target' in request.GET else week + weeks.ONE_WEEK
+    except ValueError:
+        raise Http404("Settimana di destinazione non valida.")
+    
+    if request.method == 'POST':
+        week_editor.copy_week(request.household_id, week, target)
+        return redirect_to_week(target)
+    
+    return redirect_to_week(week)
 
 
+@versioned_page(versioning.PLAN, versioning.RECIPES, versioning.PANTRY, vary_on_csrf=True, dated=True)
+@read_only
+async def shopping_list(request):
+    """
+    Genera la lista della spesa dei giorni richiesti (?week= o ?start=&end=,
+    di default la settimana corrente) aggregando gli ingredienti,
+    moltiplicando le dosi per il numero di volte che la ricetta è pianificata.
+    """
+    
+    # La lista è mantenuta precalcolata per giorno (vedi core/materialized.py):
+    # la lettura è una sola SUM raggruppata sui giorni dell'intervallo, e la
+    # scorta in dispensa viene sottratta nella stessa query, che porta anche
+    # le tabelle delle confezioni precalcolate (core/costs.py).
+    start, end = requested_range(request)
+    rows = materialized.materialized_shopping_list(request.household_id, start, end, net=True, packs=True)
+    shopping_list = [row async for row in rows.aiterator()]
     context = {
         'title': 'Lista della Spesa Aggregata',
         'shopping_list': shopping_list,
+        'basket': costs.price_shopping_list(shopping_list),
+        'start': start,
+        'end': end,
+        'range_query': urlencode({'start': start.isoformat(), 'end': end.isoformat()}),
+        'week_param': weeks.format_week(weeks.week_start(start)),
     }
-    return render(request, 'core/shopping_list.html', context)
\ No newline at end of file
+    return render(request, 'core/shopping_list.html', context)
+
+
+def shopping_list_bought(request):
+    """Azione rapida: sposta in dispensa tutto ciò che resta da comprare nell'intervallo."""
+    
+    start, end = requested_range(request)
+    if request.method == 'POST':
+        pantry.mark_shopping_list_bought(request.household_id, start, end)
+    
+    query = urlencode({'start': start.isoformat(), 'end': end.isoformat()})
+    return redirect(f"{reverse('shopping_list')}?{query}")
+
+
+# ======================================================================
+# NUCLEO FAMILIARE
+# ======================================================================
+
+def household_switch(request, slug):
+    """
+    Azione rapida: rende `slug` il nucleo familiare della sessione e torna
+    alla griglia. Solo per gli utenti autenticati che ne sono membri (404
+    altrimenti).
+    """
+    if not request.user.is_authenticated:
+        raise Http404("Nucleo familiare non trovato.")
+    household = get_object_or_404(tenancy.member_households(request.user), slug=slug)
+    if request.method == 'POST':
+        tenancy.activate(request, household)
+    
+    return redirect('weekly_plan')
@@ -0,0 +1,188 @@
+# File: core/week_editor.py
+
+"""
+Modifica in blocco di un'intera settimana e copia di una settimana in un'altra.
+
+Il chiamante fornisce le ricette desiderate per ogni cella (giorno, pasto)
+della settimana; qui si calcola la differenza rispetto alle MealRecipe
+attuali e si applicano solo inserimenti e cancellazioni, ciascuno in
+blocco (bulk_create e QuerySet.delete()), in una sola transazione. Gli
+slot mancanti vengono creati solo se ricevono almeno una ricetta.
+`copy_week` usa lo stesso percorso: la copia è una differenza fatta di
+soli inserimenti, che conservano le porzioni della settimana copiata.
+
+Le modifiche passano da `bulk_plan_changes`: i segnali per riga sono
+sospesi e lista materializzata, revisioni degli slot (cache dei frammenti)
+e versione del piano vengono aggiornate qui, una volta per tutta la
+modifica invece che una volta per riga. Lo stesso percorso svuota una
+settimana (`clear_week`, azione "reset" della griglia).
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import F
+
+from . import materialized, versioning, weeks
+from .models import MealRecipe, MealSlot, DAY_CHOICES, MEAL_TYPE_CHOICES
+
+CELLS = [(day, meal_type) for day, _ in DAY_CHOICES for meal_type, _ in MEAL_TYPE_CHOICES]
+
+
+class Planned(NamedTuple):
+    """Una MealRecipe del piano attuale: id e porzioni (None = quelle della ricetta)."""
+    pk: int
+    portions: int
+
+
+@dataclass
+class WeekChanges:
+    """Differenza tra piano attuale e desiderato: coppie ((day, meal_type), recipe_id)."""
+    inserts: list
+    deletes: list
+
+    def __bool__(self):
+        return bool(self.inserts or self.deletes)
+
+
+@contextmanager
+def bulk_plan_changes(household_id):
+    """
+    Transazione per modifiche in blocco al piano del nucleo: dentro il
+    blocco i segnali per riga di MealSlot e MealRecipe non toccano lista
+    materializzata, revisioni e versione (le riallinea il chiamante); la
+    versione del piano avanza una volta, anche al commit. Dentro una
+    transazione già aperta non crea un savepoint.
+    """
+    with transaction.atomic(savepoint=False):
+        with materialized.suspended():
+            yield
+        versioning.bump_on_commit(household_id, versioning.PLAN)
+
+
+def clear_week(household_id, week):
+    """
+    Cancella slot e pianificazioni della settimana del lunedì `week` del
+    nucleo; le righe materializzate dei suoi giorni si svuotano con una
+    sola istruzione (le revisioni degli slot eliminati non servono più).
+    """
+    start, end = weeks.week_range(week)
+    with bulk_plan_changes(household_id):
+        MealSlot.objects.filter(household=household_id, date__range=(start, end)).delete()
+        materialized.clear(household_id, start, end)
+
+
+def current_assignments(household_id, week):
+    """
+    {(day, meal_type): {recipe_id: Planned}} della settimana del nucleo che
+    inizia il lunedì `week`, con una query.
+    """
+    current = {}
+    rows = (
+        MealRecipe.objects
+        .filter(meal_slot__household=household_id, meal_slot__date__range=weeks.week_range(week))
+        .order_by()
+        .values_list('pk', 'recipe_id', 'portions', 'meal_slot__date', 'meal_slot__meal_type')
+    )
+    for pk, recipe_id, portions, date, meal_type in rows:
+        current.setdefault((weeks.day_code(date), meal_type), {})[recipe_id] = Planned(pk, portions)
+    return current
+
+
+def diff(current, desired):
+    """
+    Confronta {(day, meal_type): insieme di recipe_id} desiderato con il piano
+    attuale. Le celle assenti da `desired` restano come sono.
+    """
+    inserts, deletes = [], []
+    for cell in CELLS:
+        if cell not in desired:
+            continue
+        wanted = set(desired[cell])
+        planned = set(current.get(cell, ()))
+        inserts.extend((cell, recipe_id) for recipe_id in sorted(wanted - planned))
+        deletes.extend((cell, recipe_id) for recipe_id in sorted(planned - wanted))
+    return WeekChanges(inserts=inserts, deletes=deletes)
+
+
+def apply_week(household_id, week, desired):
+    """
+    Porta la settimana del lunedì `week` del nucleo a `desired` ({(day,
+    meal_type): recipe_id iterabili}) e restituisce le WeekChanges applicate.
+    """
+    with transaction.atomic():
+        # La differenza si calcola dentro la transazione (IMMEDIATE su SQLite):
+        # nessun'altra scrittura può cambiare il piano nel frattempo
+        current = current_assignments(household_id, week)
+        changes = diff(current, desired)
+        apply_changes(household_id, week, current, changes)
+    return changes
+
+
+def copy_week(household_id, source, target):
+    """
+    Copia le ricette della settimana `source` del nucleo nella settimana
+    `target` (due lunedì), in aggiunta a quelle già presenti: un solo INSERT
+    in blocco per tutte le pianificazioni copiate. Restituisce le
+    WeekChanges applicate.
+    """
+    with transaction.atomic():
+        copied = current_assignments(household_id, source)
+        current = current_assignments(household_id, target)
+        desired = {
+            cell: current.get(cell, {}).keys() | recipes.keys()
+            for cell, recipes in copied.items()
+        }
+        changes = diff(current, desired)
+        portions = {
+            (cell, recipe_id): planned.portions
+            for cell, recipes in copied.items() for recipe_id, planned in recipes.items()
+        }
+        apply_changes(household_id, target, current, changes, portions)
+    return changes
+
+
+def apply_changes(household_id, week, current, changes, portions=None):
+    """
+    Scrive le WeekChanges della settimana `week` del nucleo e aggiorna le
+    strutture derivate (con `bulk_plan_changes`, come clear_week).
+    `portions` ({(cell, recipe_id): porzioni}) indica le porzioni degli
+    inserimenti; quelli assenti usano le porzioni della ricetta.
+    """
+    if not changes:
+        return
+    portions = portions or {}
+
+    with bulk_plan_changes(household_id):
+        dates = {cell: weeks.cell_date(week, cell[0]) for cell, _ in changes.inserts + changes.deletes}
+        week_slots = MealSlot.objects.filter(household=household_id, date__range=weeks.week_range(week))
+        slots = {(slot.day, slot.meal_type): slot for slot in week_slots}
+        missing = {cell for cell, _ in changes.inserts if cell not in slots}
+        if missing:
+            MealSlot.objects.bulk_create(
+                MealSlot(household_id=household_id, date=dates[cell], meal_type=cell[1]) for cell in sorted(missing)
+            )
+            slots = {(slot.day, slot.meal_type): slot for slot in week_slots.all()}
+
+        if changes.deletes:
+            # I segnali per riga sono sospesi: le variazioni si applicano sotto in blocco
+            MealRecipe.objects.filter(
+                pk__in=[current[cell][recipe_id].pk for cell, recipe_id in changes.deletes]
+            ).delete()
+        MealRecipe.objects.bulk_create(
+            MealRecipe(meal_slot=slots[cell], recipe_id=recipe_id, portions=portions.get((cell, recipe_id)))
+            for cell, recipe_id in changes.inserts
+        )
+
+        counts = Counter()
+        for cell, recipe_id in changes.inserts:
+            counts[(recipe_id, dates[cell], portions.get((cell, recipe_id)))] += 1
+        for cell, recipe_id in changes.deletes:
+            counts[(recipe_id, dates[cell], current[cell][recipe_id].portions)] -= 1
+        materialized.apply_recipe_deltas(counts)
+
+        touched = {slots[cell].pk for cell, _ in changes.inserts + changes.deletes}
+        MealSlot.objects.filter(pk__in=touched).update(revision=F('revision') + 1)
@@ -0,0 +1,132 @@
+# File: core/weeks.py
+
+"""
+Settimane ISO e intervalli di date del piano.
+
+Ogni slot pasto è legato a una data (MealSlot.date). La griglia mostra una
+settimana ISO alla volta, identificata dal suo lunedì, e le celle restano
+coppie (codice giorno, pasto) relative alla settimana: `cell_date` e
+`day_code` convertono tra le due forme.
+
+Nelle URL la settimana è il parametro ?week=AAAA-Www (es. 2026-W42);
+le liste della spesa accettano anche un intervallo qualsiasi con
+?start=AAAA-MM-GG&end=AAAA-MM-GG. I parser sollevano ValueError.
+"""
+
+import datetime
+
+from django.utils import timezone
+
+from .models import DAY_CHOICES
+
+DAY_CODES = [code for code, _ in DAY_CHOICES]
+DAY_OFFSETS = {code: i for i, code in enumerate(DAY_CODES)}
+
+ONE_WEEK = datetime.timedelta(days=7)
+
+# Ampiezza massima di un intervallo di date (lista della spesa, esportazioni)
+MAX_RANGE_DAYS = 366
+
+# Date accettate nei parametri: lasciano spazio alle settimane vicine (link
+# precedente/successiva, copia nella settimana dopo) senza OverflowError
+MIN_DATE = datetime.date.min + 2 * ONE_WEEK
+MAX_DATE = datetime.date.max - 2 * ONE_WEEK
+
+
+def week_start(date):
+    """Lunedì della settimana ISO che contiene `date`."""
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def current_week():
+    return week_start(timezone.localdate())
+
+
+def week_end(monday):
+    """Domenica della settimana che inizia a `monday`."""
+    return monday + datetime.timedelta(days=6)
+
+
+def week_range(monday):
+    return monday, week_end(monday)
+
+
+def cell_date(monday, day):
+    """Data della cella con codice giorno `day` nella settimana di `monday`."""
+    return monday + datetime.timedelta(days=DAY_OFFSETS[day])
+
+
+def day_code(date):
+    return DAY_CODES[date.weekday()]
+
+
+def format_week(monday):
+    """Settimana in formato ISO 8601 (AAAA-Www), usato nelle URL."""
+    year, week, _ = monday.isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def check_date(date):
+    """Restituisce `date` se è tra MIN_DATE e MAX_DATE, altrimenti ValueError."""
+    if not MIN_DATE <= date <= MAX_DATE:
+        raise ValueError(f"Date ammesse dal {MIN_DATE} al {MAX_DATE}.")
+    return date
+
+
+def parse_week(value):
+    """Lunedì della settimana indicata come AAAA-Www o come una sua data."""
+    value = value.strip()
+    if '-W' in value.upper():
+        year, _, week = value.upper().partition('-W')
+        monday = datetime.date.fromisocalendar(int(year), int(week), 1)
+    else:
+        monday = week_start(datetime.date.fromisoformat(value))
+    return check_date(monday)
+
+
+def week_from_request(request):
+    """Settimana di ?week= (la corrente se assente)."""
+    value = request.GET.get('week')
+    return parse_week(value) if value else current_week()
+
+
+def range_from_request(request):
+    """
+    Intervallo (inizio, fine) incluso: ?start=&end=, oppure l'intera
+    settimana di ?week=, oppure la settimana corrente. Senza `end`
+    l'intervallo dura sette giorni.
+    """
+    start = request.GET.get('start')
+    if not start:
+        return week_range(week_from_request(request))
+    start = check_date(datetime.date.fromisoformat(start))
+    end = request.GET.get('end')
+    end = check_date(datetime.date.fromisoformat(end) if end else start + datetime.timedelta(days=6))
+    if end < start:
+        raise ValueError("La data di fine precede quella di inizio.")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"L'intervallo può coprire al massimo {MAX_RANGE_DAYS} giorni.")
+    return start, end
+
+
+def requested_period(request):
+    """
+    Intervallo effettivo della richiesta come testo 'inizio/fine' (vuoto se
+    i parametri non sono validi). Senza ?week= né ?start= dipende dal giorno
+    in cui arriva la richiesta: chiavi di cache ed ETag lo comprendono
+    insieme all'URL.
+    """
+    try:
+        start, end = range_from_request(request)
+    except ValueError:
+        return ''
+    return f'{start.isoformat()}/{end.isoformat()}'
+
+
+def has_explicit_period(request):
+    return bool(request.GET.get('week') or request.GET.get('start'))
+
+
+def week_started_at(monday):
+    """Istante in cui inizia la settimana del lunedì `monday` nel fuso corrente."""
+    return timezone.make_aware(datetime.datetime.combine(monday, datetime.time.min))
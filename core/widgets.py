@@ -0,0 +1,62 @@
+# File: core/widgets.py
+
+"""
+Widget dei form dell'app core.
+"""
+
+from django import forms
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    <select> per ModelChoiceField che contiene solo l'opzione vuota e i
+    valori selezionati, preceduto da un campo di ricerca. Le altre opzioni
+    arrivano dall'endpoint `url` (core/api.py) mentre l'utente digita,
+    tramite core/static/core/autocomplete.js.
+
+    Con tabelle da decine di migliaia di righe evita di ripetere l'intero
+    elenco per ogni riga del formset (e per l'empty_form).
+    """
+
+    template_name = 'core/widgets/autocomplete_select.html'
+
+    def __init__(self, url, attrs=None):
+        super().__init__(attrs)
+        self.url = url
+        # Oggetti già caricati dal chiamante (es. l'istanza del form): str(pk) -> oggetto
+        self.known_objects = {}
+
+    def __deepcopy__(self, memo):
+        obj = super().__deepcopy__(memo)
+        obj.known_objects = self.known_objects.copy()
+        return obj
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['url'] = str(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        selected = [v for v in value if v not in (None, '')]
+
+        objects = [self.known_objects[v] for v in selected if v in self.known_objects]
+        missing = [v for v in selected if v not in self.known_objects]
+        if missing:
+            try:
+                objects += list(field.queryset.filter(pk__in=missing))
+            except (ValueError, TypeError):
+                # Valore non valido inviato dal client: lo segnalerà la validazione
+                pass
+
+        options = []
+        if field.empty_label is not None:
+            options.append(self.create_option(name, '', field.empty_label, not objects, 0))
+        for obj in objects:
+            option_value, label = self.choices.choice(obj)
+            options.append(self.create_option(name, option_value, label, True, len(options)))
+        return [(None, options, 0)]
+
+
+class AutocompleteSelectMultiple(AutocompleteSelect, forms.SelectMultiple):
+    """Variante a scelta multipla (ModelMultipleChoiceField) di AutocompleteSelect."""
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,11 +42,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Per primo: misura anche il tempo degli altri middleware
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Nucleo familiare della richiesta (request.household_id), dalla sessione
+    'core.middleware.HouseholdMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +59,8 @@ ROOT_URLCONF = 'planner.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Backend standard di Django che misura anche il tempo di rendering
+        'BACKEND': 'core.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -67,19 +73,108 @@ TEMPLATES = [
     },
 ]
 
+# Metriche per rotta esposte su /metrics (core/metrics.py). Da disattivate
+# il middleware non viene caricato. Le richieste che superano la soglia
+# (secondi) finiscono nel log 'core.metrics' con le query più lente.
+METRICS_ENABLED = True
+METRICS_SLOW_REQUEST_SECONDS = 0.5
+
+# Indirizzi che possono leggere /metrics senza essere staff (es. Prometheus)
+INTERNAL_IPS = ['127.0.0.1', '::1']
+
 WSGI_APPLICATION = 'planner.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Impostazioni SQLite applicate a ogni nuova connessione:
+#   - journal WAL: i lettori non bloccano lo scrittore e viceversa
+#   - synchronous=NORMAL: con WAL resta consistente, fsync solo ai checkpoint
+#   - mmap_size / cache_size: 128 MiB mappati in memoria, ~20 MiB di cache pagine
+# Le transazioni partono IMMEDIATE: lo scrittore prende subito il lock e chi
+# arriva dopo attende fino a `timeout` secondi, invece di fallire con
+# "database is locked" quando una transazione di lettura prova a scrivere.
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA mmap_size=134217728;'
+    'PRAGMA cache_size=-20000;'
+)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Connessioni persistenti (riaperte solo se non rispondono più)
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Stesso file, connessione separata in sola lettura per le viste di
+    # consultazione (vedi core/routers.py). Nei test è uno specchio di default.
+    'read': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS + 'PRAGMA query_only=ON;',
+            'timeout': 20,
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['core.routers.ReadOnlyRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Condivisa tra tutti i processi (worker WSGI/ASGI, comandi): pagine e
+# frammenti renderizzati e la copia dei timbri di versione, il cui originale
+# sta nel database (core.VersionStamp), quindi un'espulsione costa al più
+# una query e non cambia gli ETag.
+# In produzione si usa Redis (REDIS_URL, es. redis://127.0.0.1:6379/1,
+# richiede il pacchetto redis): espelle in memoria, senza scandire nulla.
+# Senza Redis si ripiega sulla cache su file con il limite predefinito di
+# voci: ogni scrittura scandisce la cartella per il cull, quindi il limite
+# non va alzato.
+# I frammenti delle celle della griglia ('fragments') convengono solo su una
+# cache in memoria: su file ogni cella da riscrivere costa circa 1 ms
+# (scrittura e cull), mentre ogni cella letta fa risparmiare meno di 0,1 ms
+# di rendering (vedi WeeklyGridRenderBenchmark), quindi senza Redis sono
+# disattivati.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'fragments',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / '.django_cache',
+        },
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators